@@ -12,7 +12,7 @@ from fastapi import FastAPI, Query, HTTPException, Body  # Body só para as nova
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Tuple
 import os, psycopg2, psycopg2.extras
 from datetime import date, timedelta, datetime
 from dotenv import load_dotenv
@@ -70,6 +70,31 @@ def _parse_window(from_str: Optional[str], to_str: Optional[str], days_back: int
         dt_to   = today + timedelta(days=days_ahead)
     return dt_from, dt_to
 
+def _parse_as_of(as_of: Optional[str]) -> Optional[datetime]:
+    """as_of=YYYY-MM-DD (fim do dia: estado após o último sync dele) ou YYYY-MM-DDTHH:MM[:SS]."""
+    if not as_of:
+        return None
+    try:
+        if len(as_of) == 10:
+            return datetime.strptime(as_of, "%Y-%m-%d") + timedelta(days=1, microseconds=-1)
+        return datetime.fromisoformat(as_of)
+    except ValueError:
+        raise HTTPException(400, "as_of inválido (use YYYY-MM-DD ou YYYY-MM-DDTHH:MM[:SS]).")
+
+def _op_source(cur, as_of: Optional[datetime]) -> Tuple[str, List[Any]]:
+    """
+    Origem das OPs para o FROM: op (estado atual) ou, com as_of, a versão de cada
+    OP válida naquele instante em op_hist (índice GiST do intervalo de validade).
+    Itens (m² de pintura, cores dos itens) são sempre os atuais.
+    """
+    if as_of is None:
+        return "op", []
+    cur.execute("SELECT to_regclass('public.op_hist') IS NOT NULL AS ok")
+    row = cur.fetchone()
+    if not (row["ok"] if isinstance(row, dict) else row[0]):
+        raise HTTPException(503, "Tabela op_hist não existe (rode o ETL ao menos uma vez).")
+    return "(SELECT * FROM op_hist WHERE tstzrange(valid_from, valid_to) @> %s::timestamptz)", [as_of]
+
 # ============================================================================
 # /ops — listagem com filtros, paginação e ordenação
 #   + agrega m² de pintura
@@ -92,8 +117,10 @@ def list_ops(
     page_size: int = 50,
     order_by: str = Query("validade", regex="^(validade|prev_inicio|emissao|percent|op_numero)$"),
     order_dir: str = Query("desc", regex="^(asc|desc)$"),
+    as_of: Optional[str] = Query(None, description="Estado em YYYY-MM-DD[THH:MM] (histórico op_hist)"),
 ):
     dt_from, dt_to = _parse_window(from_date, to_date, days_back, days_ahead)
+    as_of_ts = _parse_as_of(as_of)
     field_map = {"validade":"dt_validade", "prev_inicio":"dt_prev_inicio", "emissao":"dt_emissao"}
     order_map = {"validade":"dt_validade","prev_inicio":"dt_prev_inicio","emissao":"dt_emissao","percent":"percent_concluido","op_numero":"op_numero"}
     col = field_map[date_field]
@@ -127,7 +154,7 @@ def list_ops(
     END
     """
 
-    sql_count = f"SELECT COUNT(*) FROM op o WHERE {where_sql}"
+    sql_count = f"SELECT COUNT(*) FROM {{src}} o WHERE {where_sql}"
 
     sql_page = f"""
       WITH paint AS (
@@ -164,7 +191,7 @@ def list_ops(
         COALESCE(p.m2_pintura_total, 0)      AS m2_pintura_total,
         COALESCE(p.m2_pintura_produzida, 0)  AS m2_pintura_produzida,
         COALESCE(p.m2_pintura_saldo, 0)      AS m2_pintura_saldo
-      FROM op o
+      FROM {{src}} o
       LEFT JOIN paint    p  ON p.op_id = o.op_id
       LEFT JOIN cores       ON cores.op_id = o.op_id
       LEFT JOIN cfgcores    ON cfgcores.op_id = o.op_id
@@ -174,21 +201,23 @@ def list_ops(
       LIMIT %s OFFSET %s
     """
 
-    params_page = list(params)
+    with get_conn() as con, con.cursor() as cur:
+        src, src_params = _op_source(cur, as_of_ts)
+        cur.execute(sql_count.replace("{src}", src), src_params + params)
+        total = cur.fetchone()[0]
+
+    params_page = src_params + params
     if cor_contains:
         params_page.append(f"%{cor_contains}%")
     params_page += [page_size, offset]
 
-    with get_conn() as con, con.cursor() as cur:
-        cur.execute(sql_count, params)
-        total = cur.fetchone()[0]
-
     with get_conn() as con, con.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute(sql_page, params_page)
+        cur.execute(sql_page.replace("{src}", src), params_page)
         rows = cur.fetchall()
         return JSONResponse(content=jsonable_encoder({
             "total": total, "page": page, "page_size": page_size,
             "window": {"from": str(dt_from), "to": str(dt_to), "field": date_field},
+            "as_of": as_of_ts.isoformat() if as_of_ts else None,
             "items": rows
         }))
 
@@ -512,19 +541,23 @@ def dashboard(
     days_back: int = 7,
     days_ahead:int = 30,
     status: str = Query("ABERTA,INICIADA,ENTRADA PARCIAL"),
+    as_of: Optional[str] = Query(None, description="Estado em YYYY-MM-DD[THH:MM] (histórico op_hist)"),
 ):
     dt_from, dt_to = _parse_window(from_date, to_date, days_back, days_ahead)
+    as_of_ts = _parse_as_of(as_of)
     field_map = {"validade":"dt_validade", "prev_inicio":"dt_prev_inicio", "emissao":"dt_emissao"}
     col = field_map[date_field]
     status_list = [s.strip().upper() for s in status.split(",") if s.strip()]
     where = f"o.filial = %s AND o.{col} BETWEEN %s AND %s AND o.status_nome = ANY(%s)"
-    params = [filial, dt_from, dt_to, status_list]
 
     with get_conn() as con, con.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        src, src_params = _op_source(cur, as_of_ts)
+        params = src_params + [filial, dt_from, dt_to, status_list]
+
         # Por Status
         cur.execute(f"""
           SELECT o.status_nome, COUNT(*) AS qtd
-          FROM op o
+          FROM {src} o
           WHERE {where}
           GROUP BY o.status_nome
           ORDER BY qtd DESC
@@ -559,7 +592,7 @@ def dashboard(
         base AS (
           SELECT
             {cor_expr} AS cor_final
-          FROM op o
+          FROM {src} o
           LEFT JOIN cores    ON cores.op_id    = o.op_id
           LEFT JOIN cfgcores ON cfgcores.op_id = o.op_id
           WHERE {where}
@@ -575,7 +608,7 @@ def dashboard(
         # Série diária
         cur.execute(f"""
           SELECT date_trunc('day', o.{col})::date AS dia, COUNT(*) AS qtd
-          FROM op o
+          FROM {src} o
           WHERE {where}
           GROUP BY dia ORDER BY dia
         """, params)
@@ -584,19 +617,126 @@ def dashboard(
         # Média %
         cur.execute(f"""
           SELECT ROUND(AVG(o.percent_concluido)::numeric, 2) AS media_percent
-          FROM op o
+          FROM {src} o
           WHERE {where}
         """, params)
         avg_percent = (cur.fetchone() or {}).get("media_percent")
 
     return JSONResponse(content=jsonable_encoder({
         "window": {"from": str(dt_from), "to": str(dt_to), "field": date_field},
+        "as_of": as_of_ts.isoformat() if as_of_ts else None,
         "by_status": by_status,
         "by_color": by_color,
         "series": series,
         "avg_percent_concluido": float(avg_percent) if avg_percent is not None else None
     }))
 
+# ============================================================================
+# /etl/status — idade dos dados (tabela etl_run, gravada pelos scripts do ETL)
+#   - por tipo/filial: última execução concluída (ok/partial) e há quantos segundos
+#   - última tentativa de cada tipo (para ver erro/execução em curso)
+#   - data_version: último run_id que gravou algo (também no header X-Data-Version;
+#     o front pode usar para saber se precisa recarregar)
+# ============================================================================
+@app.get("/etl/status")
+def etl_status(filial: Optional[int] = Query(None)):
+    with get_conn() as con, con.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute("SELECT to_regclass('public.etl_run') IS NOT NULL AS ok")
+        if not cur.fetchone()["ok"]:
+            raise HTTPException(503, "Tabela etl_run não existe (rode o ETL ao menos uma vez).")
+        where = "(filial = %s OR filial IS NULL)" if filial is not None else "TRUE"
+        params = [filial] if filial is not None else []
+
+        cur.execute(f"""
+          SELECT DISTINCT ON (kind, filial)
+                 kind, filial, run_id, status, dt_from, dt_to, started_at, finished_at,
+                 duration_s, selected, done, failed, changed,
+                 ROUND(EXTRACT(EPOCH FROM now() - started_at)::numeric, 0) AS age_s
+          FROM etl_run
+          WHERE status IN ('ok','partial') AND {where}
+          ORDER BY kind, filial, started_at DESC
+        """, params)
+        fresh = cur.fetchall()
+
+        cur.execute(f"""
+          SELECT DISTINCT ON (kind)
+                 kind, filial, run_id, status, started_at, finished_at, error
+          FROM etl_run
+          WHERE {where}
+          ORDER BY kind, started_at DESC
+        """, params)
+        last = cur.fetchall()
+
+        cur.execute(f"""
+          SELECT MAX(run_id) AS v FROM etl_run
+          WHERE status IN ('ok','partial') AND changed > 0 AND {where}
+        """, params)
+        version = cur.fetchone()["v"]
+
+    return JSONResponse(
+        content=jsonable_encoder({"data_version": version, "fresh": fresh, "last_attempt": last}),
+        headers={"X-Data-Version": str(version or 0)},
+    )
+
+# ============================================================================
+# /series/progress — série de andamento gravada pelo ETL (etl/progress_series.py,
+#   baldes de hora; os demais períodos são agregados aqui)
+#   - progress: por período (bucket=hour|day|week|month), OPs que avançaram e a
+#     soma dos deltas de % (com op_id: o % da OP no fim de cada período)
+#   - setores: etapas PENDENTE/EM_EXECUCAO/CONCLUIDO por setor no fim de cada período
+#   Tabelas particionadas por mês: só as partições da janela são lidas.
+# ============================================================================
+@app.get("/series/progress")
+def series_progress(
+    filial: int = Query(...),
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date:   Optional[str] = Query(None, alias="to"),
+    days_back: int = 30,
+    bucket: str = Query("day", regex="^(hour|day|week|month)$"),
+    setor: Optional[int] = None,
+    op_id: Optional[int] = None,
+):
+    dt_from, dt_to = _parse_window(from_date, to_date, days_back, 0)
+    ts_from = datetime.combine(dt_from, datetime.min.time())
+    ts_to = datetime.combine(dt_to + timedelta(days=1), datetime.min.time())  # fim exclusivo
+
+    with get_conn() as con, con.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute("SELECT to_regclass('public.progress_op') IS NOT NULL AS ok")
+        if not cur.fetchone()["ok"]:
+            raise HTTPException(503, "Tabelas da série não existem (rode o ETL ao menos uma vez).")
+
+        op_sql = "AND op_id = %s" if op_id is not None else ""
+        cur.execute(f"""
+          SELECT date_trunc(%s, bucket) AS t,
+                 COUNT(DISTINCT op_id) AS ops,
+                 SUM(delta) AS delta_sum
+                 {", (array_agg(percent ORDER BY bucket DESC))[1] AS percent" if op_id is not None else ""}
+          FROM progress_op
+          WHERE filial = %s AND bucket >= %s AND bucket < %s {op_sql}
+          GROUP BY 1
+          ORDER BY 1
+        """, [bucket, filial, ts_from, ts_to] + ([op_id] if op_id is not None else []))
+        progress = cur.fetchall()
+
+        setor_sql = "AND setor_codigo = %s" if setor is not None else ""
+        cur.execute(f"""
+          SELECT DISTINCT ON (setor_codigo, date_trunc(%s, bucket))
+                 date_trunc(%s, bucket) AS t, setor_codigo, pendente, em_execucao, concluido
+          FROM progress_setor
+          WHERE filial = %s AND bucket >= %s AND bucket < %s {setor_sql}
+          ORDER BY setor_codigo, date_trunc(%s, bucket), bucket DESC
+        """, [bucket, bucket, filial, ts_from, ts_to] + ([setor] if setor is not None else []) + [bucket])
+        setores = cur.fetchall()
+        for r in setores:
+            r["setor_nome"] = SETOR_LEGACY_MAP.get(r["setor_codigo"])
+
+    return JSONResponse(content=jsonable_encoder({
+        "filial": filial, "bucket": bucket,
+        "window": {"from": str(dt_from), "to": str(dt_to)},
+        "progress": progress,
+        "setores": setores,
+    }))
+
 # ============================================================
 # 🔵 MÓDULO ADICIONAL: Operações da Pintura (Operador)
 #     - novas rotas; não toca no que já existe
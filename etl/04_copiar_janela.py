@@ -1,12 +1,28 @@
 # etl/04_copiar_janela.py
 # -----------------------------------------------------------------------------
 # Copia OPs do Firebird -> Postgres por janela de datas (emissão/prev_inicio/validade).
-# - Leitura: Firebird (MSYSDADOS.FDB) via firebirdsql
+# - Leitura: Firebird (MSYSDADOS.FDB) via fb_driver (firebirdsql ou firebird-driver,
+#   comandos preparados reaproveitados, transação somente leitura)
 # - Escrita: Postgres (tabelas op, op_item, roteiro)
 # - Tolerante a variações de esquema no Firebird:
-#     * Detecta dinamicamente a coluna de descrição em PRODUTOS
-#     * Detecta dinamicamente a coluna de nome da cor em CORES
+#     * Detecta a coluna de descrição em PRODUTOS, o nome da cor em CORES e a
+#       tabela de roteiro UMA vez por execução (fb_schema.py, com cache em disco)
 #     * SEM depender de colunas de cor em PRODUTOS (ex.: PRO_COR_CODIGO)
+# - Modo --bulk: extração set-based por blocos de ORP_IDs (ver fb_extract.py) e
+#   carga via COPY em staging + um merge por tabela (ver pg_load.py)
+# - Modo --pipeline: o mesmo, com extração/transformação/gravação concorrentes
+# - --dims: PRODUTOS/CORES replicados em produto/cor (dim_sync.py); itens sem JOIN
+# - --with-andamento: andamento_setor sai da MESMA leitura do roteiro (com
+#   início/fim/status), numa transação SNAPSHOT do Firebird — dispensa o 05
+# - --slice-ops N: janelas grandes são divididas em fatias de ~N OPs (COUNT por
+#   fatia), cada uma selecionada, copiada e commitada sozinha (desligado por
+#   padrão; não combina com --with-andamento, que exige um SNAPSHOT só)
+# - --snapshot-dir: a extração crua de cada bloco também vai para Parquet local
+#   (fb_snapshot.py); --from-snapshot recarrega o Postgres desses arquivos, sem
+#   consultar o Firebird (rebuild após mudança de esquema, experimentos)
+# - op_hist: versão nova do cabeçalho a cada mudança (op_history.py; API as_of=)
+# - --series: ao fim, amostra a série de % por OP e etapas por setor
+#   (progress_series.py; API /series/progress)
 # -----------------------------------------------------------------------------
 r"""
 Como usar (PowerShell):
@@ -20,22 +36,80 @@ Como usar (PowerShell):
 # Intervalo exato
 (.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --from 2025-05-01 --to 2025-10-30
 
+# Extração em lote (poucas consultas por bloco de OPs; recomendado para janelas grandes)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --days-back 7 --days-ahead 30 --bulk
+
+# Sync frequente: só as OPs que mudaram desde a última execução (1 consulta + deltas)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --days-back 7 --days-ahead 30 --bulk --changed-only
+
+# Refresh completo de 90 dias em paralelo (4 workers, cada um com suas conexões)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --days-back 90 --days-ahead 0 --bulk --workers 4
+
+# Leitura do Firebird e gravação no Postgres sobrepostas (pipeline com filas limitadas)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --days-back 90 --days-ahead 0 --pipeline
+
+# Backfill de 2 anos em fatias de ~2000 OPs (cada fatia commitada; seleção da próxima em paralelo)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --from 2024-01-01 --to 2025-12-31 --bulk --slice-ops 2000 --prefetch
+
+# Backfill longo: commit a cada 200 OPs; se cair, retoma do último checkpoint
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --from 2024-01-01 --to 2025-12-31 --bulk --commit-every 200
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --from 2024-01-01 --to 2025-12-31 --bulk --commit-every 200 --resume
+
+# Reprocessar só as OPs que falharam (etl_dead_letter)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --retry-dead-letter
+
+# Itens sem JOIN em PRODUTOS/CORES: nomes vêm das dimensões replicadas no Postgres
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --days-back 7 --days-ahead 30 --bulk --dims
+
+# OP + andamento por setor numa passada só (roteiro lido uma vez, snapshot consistente)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --days-back 7 --days-ahead 30 --bulk --with-andamento
+
+# Guarda a extração crua em Parquet (partições dt=YYYY-MM-DD) enquanto copia
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --from 2024-01-01 --to 2025-12-31 --bulk --snapshot-dir .\etl\.snapshots
+
+# Recarrega o Postgres só dos snapshots (nenhuma consulta ao Firebird da Microsys)
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --from-snapshot .\etl\.snapshots --with-andamento
+
+# Reconciliação: OPs finalizadas/canceladas/removidas no Firebird deixam de aparecer como abertas
+(.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --reconcile
+
 # Apenas listar o que seria copiado (sem gravar)
 (.venv) PS> python .\etl\04_copiar_janela.py --filial 1 --date-field validade --from 2025-05-01 --to 2025-10-30 --dry-run
 """
 
 import os
-import re  # << necessário para as detecções por regex
 import sys
+import json
+import queue
+import hashlib
 import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from typing import Tuple, List, Dict, Any, Optional
 from datetime import datetime, date, timedelta
 
 import psycopg2
 import psycopg2.extras
-import firebirdsql
 from dotenv import load_dotenv
 
+from fb_extract import (DEFAULT_CHUNK, DEFAULT_FETCH, Record, chunked, iter_records, extract_bundles,
+                        fetch_status, roteiro_select)
+from fb_schema import resolve_schema
+import fb_driver
+from fb_snapshot import (open_snapshot, snapshot_bundles, close_snapshot, find_runs, load_manifest,
+                         read_part, require_pyarrow)
+from pg_load import (ensure_staging, load_staged, set_async_commit, savepoint, derive_op_header,
+                     add_stats, new_stats, merge_stats, format_stats, upsert_values,
+                     upsert_andamento, delete_vanished_steps, ITEM_COLS)
+from maps import andamento_rows
+from dim_sync import ensure_dim_schema, sync_dims, load_dim_names, apply_dim_names, HASH_MOD
+from run_ledger import ensure_run_schema, recorded_run, args_params
+from op_history import ensure_hist_schema, record_op_history
+from progress_series import ensure_series_schema, sample_progress, BUCKET
+from etl_metrics import (new_metrics, stage, count_cursor, merge_metrics, summary, emit,
+                         profiled, add_cli_args)
+
 # -----------------------------------------------------------------------------
 # .env
 # -----------------------------------------------------------------------------
@@ -50,6 +124,9 @@ FB_DB   = os.getenv("FIREBIRD_DB_PATH")
 FB_USER = os.getenv("FIREBIRD_USER", "SYSDBA")
 FB_PASS = os.getenv("FIREBIRD_PASSWORD", "masterkey")
 FB_CHAR = os.getenv("FIREBIRD_CHARSET", "WIN1252")
+FB_FAKE_DB = os.getenv("FIREBIRD_FAKE_DB")  # banco sintético (fb_fake.py), só para benchmark
+FB_SOURCE = f"fake:{FB_FAKE_DB}" if FB_FAKE_DB else f"{FB_HOST}:{FB_PORT}/{FB_DB}"  # chave do cache de esquema
+SOURCE_NAME = os.getenv("ETL_SOURCE_NAME") or None  # marca op.origem (vários bancos: ver 08_sync_multi)
 
 # Postgres (destino)
 PG_HOST = os.getenv("PG_HOST", "localhost")
@@ -61,15 +138,35 @@ PG_PASS = os.getenv("PG_PASSWORD", "")
 # -----------------------------------------------------------------------------
 # Conexões
 # -----------------------------------------------------------------------------
-def fb_connect():
-    """Abre conexão com o Firebird."""
-    if not FB_DB:
+def fb_connect(snapshot: bool = False, src: Optional[Dict[str, Any]] = None):
+    """
+    Abre conexão (somente leitura) com o Firebird pela camada fb_driver (driver,
+    transação, fetch e compressão: FIREBIRD_DRIVER/_TX/_FETCH_SIZE/_WIRE_COMPRESSION).
+    Com snapshot=True a transação é SNAPSHOT: todas as leituras até o commit veem o
+    mesmo estado do banco. Com FIREBIRD_FAKE_DB, abre o banco sintético do
+    benchmark (fb_fake.py).
+    `src`: outra origem (host/port/database/user/password/charset ou fake_db, como
+    no arquivo de origens do 08_sync_multi); o que faltar vem do .env.
+    """
+    src = src or {}
+    fake = src.get("fake_db") or (None if src.get("database") else FB_FAKE_DB)
+    database = src.get("database") or FB_DB
+    if not fake and not database:
         raise SystemExit("Erro: defina FIREBIRD_DB_PATH em etl\\.env")
-    return firebirdsql.connect(
-        host=FB_HOST, port=FB_PORT, database=FB_DB,
-        user=FB_USER, password=FB_PASS, charset=FB_CHAR
+    return fb_driver.connect(
+        host=src.get("host", FB_HOST), port=int(src.get("port", FB_PORT)), database=database,
+        user=src.get("user", FB_USER), password=src.get("password", FB_PASS),
+        charset=src.get("charset", FB_CHAR), snapshot=snapshot, fake_db=fake
     )
 
+def source_key(src: Optional[Dict[str, Any]] = None) -> str:
+    """Chave da origem no cache de esquema (fb_schema); sem `src`, a do .env (FB_SOURCE)."""
+    if not src:
+        return FB_SOURCE
+    if src.get("fake_db"):
+        return f"fake:{src['fake_db']}"
+    return f"{src.get('host', FB_HOST)}:{src.get('port', FB_PORT)}/{src.get('database') or FB_DB}"
+
 def pg_connect():
     """Abre conexão com o Postgres."""
     return psycopg2.connect(
@@ -87,59 +184,19 @@ def fb_fetchone(cur, sql: str, params=()):
     cols = [d[0] for d in cur.description]
     return cols, row
 
-def fb_fetchall(cur, sql: str, params=()):
-    """Executa e retorna todas as linhas (com nomes de colunas)."""
+def fb_iter(cur, sql: str, params=(), fetch_size: int = DEFAULT_FETCH):
+    """Executa e gera as linhas em streaming (fetchmany), sem materializar o resultado."""
     cur.execute(sql, params)
-    rows = cur.fetchall()
-    cols = [d[0] for d in cur.description]
-    return cols, rows
-
-# -----------------------------------------------------------------------------
-# Detecção de colunas no Firebird (tolerante a variações de esquema)
-# -----------------------------------------------------------------------------
-def fb_list_columns(cur_fb, table_name: str) -> List[str]:
-    """
-    Lista as colunas de uma tabela de usuário no Firebird (em UPPER).
-    """
-    cur_fb.execute("""
-        SELECT TRIM(rf.rdb$field_name)
-        FROM rdb$relation_fields rf
-        WHERE rf.rdb$relation_name = ?
-        ORDER BY rf.rdb$field_position
-    """, (table_name.upper(),))
-    return [r[0].upper() for r in cur_fb.fetchall()]
-
-def fb_pick_column(cur_fb, table_name: str, regex_patterns: List[str]) -> str:
-    """
-    Dado um conjunto de regex, retorna o primeiro nome de coluna que bater.
-    """
-    cols = fb_list_columns(cur_fb, table_name)
-    for pat in regex_patterns:
-        rx = re.compile(pat, re.I)
-        for c in cols:
-            if rx.search(c):
-                return c
-    return ""
-
-def fb_detect_product_desc_column(cur_fb) -> str:
-    """
-    Tenta achar a coluna de DESCRIÇÃO em PRODUTOS.
-    Exemplos comuns: PRO_DESCRICAO, PRO_DESCR, DESCRICAO, DESCR.
-    """
-    return fb_pick_column(cur_fb, "PRODUTOS", [
-        r"^PRO_?DESCR",   # PRO_DESCRICAO, PRO_DESCR...
-        r"DESCR"          # qualquer coisa com DESCR
-    ])
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
 
-def fb_detect_color_name_column(cur_fb) -> str:
-    """
-    Tenta achar a coluna de NOME/DESCRIÇÃO em CORES.
-    Exemplos comuns: COR_NOME, COR_DESCRICAO, NOME, DESCRICAO.
-    """
-    return fb_pick_column(cur_fb, "CORES", [
-        r"^COR_?(NOME|DESCR)",  # COR_NOME, COR_DESCRICAO
-        r"^(NOME|DESCR).*"      # NOME, DESCRICAO...
-    ])
+def fb_records(cur, sql: str, params=()) -> List[Record]:
+    """Executa e retorna as linhas como Record (acesso por nome, sem dict por linha)."""
+    cur.execute(sql, params)
+    return list(iter_records(cur))
 
 # -----------------------------------------------------------------------------
 # Mapeamentos / schema Postgres
@@ -198,22 +255,61 @@ def ensure_schema(pg_cur):
       sequencia       INTEGER NOT NULL,
       UNIQUE (op_numero, setor_codigo, sequencia)
     );
+    CREATE TABLE IF NOT EXISTS andamento_setor (
+      op_numero    INTEGER NOT NULL,
+      setor_codigo INTEGER NOT NULL,
+      sequencia    INTEGER NOT NULL,
+      status_setor VARCHAR(20) NOT NULL,
+      dt_inicio    TIMESTAMP NULL,
+      dt_fim       TIMESTAMP NULL,
+      PRIMARY KEY (op_numero, setor_codigo, sequencia)
+    );
+    CREATE INDEX IF NOT EXISTS idx_andamento_op ON andamento_setor(op_numero);
+    CREATE TABLE IF NOT EXISTS etl_op_fingerprint (
+      op_id           INTEGER PRIMARY KEY,
+      fingerprint     VARCHAR(32) NOT NULL,
+      synced_at       TIMESTAMP NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS etl_checkpoint (
+      run_key         VARCHAR(200) PRIMARY KEY,
+      last_op_id      INTEGER,
+      updated_at      TIMESTAMP NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS etl_dead_letter (
+      id              BIGSERIAL PRIMARY KEY,
+      run_key         VARCHAR(200),
+      op_id           INTEGER NOT NULL,
+      error           TEXT,
+      payload         JSONB,
+      created_at      TIMESTAMP NOT NULL DEFAULT now(),
+      resolved_at     TIMESTAMP NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_dead_letter_pend ON etl_dead_letter(op_id) WHERE resolved_at IS NULL;
     """)
+    ensure_dim_schema(pg_cur)
+    ensure_run_schema(pg_cur)
     # Migração suave (ambientes antigos)
     pg_cur.execute("ALTER TABLE op_item ADD COLUMN IF NOT EXISTS pro_desc TEXT;")
     pg_cur.execute("ALTER TABLE op_item ADD COLUMN IF NOT EXISTS cor_nome VARCHAR(200);")
+    pg_cur.execute("ALTER TABLE op ADD COLUMN IF NOT EXISTS origem VARCHAR(60);")
+    ensure_hist_schema(pg_cur)
+    ensure_series_schema(pg_cur)
 
-def upsert_op(pg_cur, op: Dict[str,Any]):
-    """UPSERT do cabeçalho da OP."""
+def upsert_op(pg_cur, op: Dict[str,Any], stats: Optional[Dict[str, Dict[str, int]]] = None):
+    """
+    UPSERT do cabeçalho da OP (não reescreve se nada mudou).
+    percent_concluido/cor_txt não vêm daqui: derive_op_header (pg_load) calcula
+    a partir de op_item no checkpoint. origem NULL mantém a já gravada.
+    """
     pg_cur.execute("""
-    INSERT INTO op (
+    INSERT INTO op AS t (
       op_id, op_numero, filial, descricao, pedido_numero,
       status_code, status_nome, dt_emissao, dt_prev_inicio, dt_validade,
-      qtd_total_hdr, qtd_produzidas_hdr, qtd_saldo_hdr, percent_concluido, cor_txt
+      qtd_total_hdr, qtd_produzidas_hdr, qtd_saldo_hdr, origem
     ) VALUES (
       %(ORP_ID)s, %(ORP_SERIE)s, %(EMP_FIL_CODIGO)s, %(ORP_DESCRICAO)s, %(ORP_PDV_NUMERO)s,
       %(status_code)s, %(status_nome)s, %(ORP_DATA)s, %(ORP_DT_PREV_INICIO)s, %(ORP_DT_VALIDADE)s,
-      %(ORP_QTDE_PRODUCAO)s, %(ORP_QTDE_PRODUZIDAS)s, %(ORP_QTDE_SALDO)s, %(percent_concluido)s, %(cor_txt)s
+      %(ORP_QTDE_PRODUCAO)s, %(ORP_QTDE_PRODUZIDAS)s, %(ORP_QTDE_SALDO)s, %(origem)s
     )
     ON CONFLICT (op_id) DO UPDATE SET
       op_numero = EXCLUDED.op_numero,
@@ -228,27 +324,33 @@ def upsert_op(pg_cur, op: Dict[str,Any]):
       qtd_total_hdr = EXCLUDED.qtd_total_hdr,
       qtd_produzidas_hdr = EXCLUDED.qtd_produzidas_hdr,
       qtd_saldo_hdr = EXCLUDED.qtd_saldo_hdr,
-      percent_concluido = EXCLUDED.percent_concluido,
-      cor_txt = EXCLUDED.cor_txt;
+      origem = COALESCE(EXCLUDED.origem, t.origem)
+    WHERE (t.op_numero, t.filial, t.descricao, t.pedido_numero,
+           t.status_code, t.status_nome, t.dt_emissao, t.dt_prev_inicio, t.dt_validade,
+           t.qtd_total_hdr, t.qtd_produzidas_hdr, t.qtd_saldo_hdr, t.origem)
+      IS DISTINCT FROM
+          (EXCLUDED.op_numero, EXCLUDED.filial, EXCLUDED.descricao, EXCLUDED.pedido_numero,
+           EXCLUDED.status_code, EXCLUDED.status_nome, EXCLUDED.dt_emissao, EXCLUDED.dt_prev_inicio, EXCLUDED.dt_validade,
+           EXCLUDED.qtd_total_hdr, EXCLUDED.qtd_produzidas_hdr, EXCLUDED.qtd_saldo_hdr,
+           COALESCE(EXCLUDED.origem, t.origem))
+    RETURNING (t.xmax = 0)
     """, op)
+    row = pg_cur.fetchone()
+    if row is None:
+        add_stats(stats, "op", unchanged=1)
+    else:
+        add_stats(stats, "op", inserted=int(row[0]), updated=int(not row[0]))
 
-def upsert_items(pg_cur, items: List[Dict[str,Any]]):
-    """UPSERT dos itens de OP."""
+def upsert_items(pg_cur, items: List[Record], stats: Optional[Dict[str, Dict[str, int]]] = None):
+    """UPSERT dos itens de OP (só reescreve itens que mudaram)."""
     if not items:
         return
-    for it in items:
-        it.setdefault("PRO_DESC", None)
-        it.setdefault("COR_NOME", None)
-    psycopg2.extras.execute_batch(pg_cur, """
-    INSERT INTO op_item (
+    upsert_values(pg_cur, """
+    INSERT INTO op_item AS t (
       opd_id, op_id, op_numero, lote, pro_codigo, cor_codigo,
       qtd, qtd_produzidas, qtd_saldo,
       pro_desc, cor_nome
-    ) VALUES (
-      %(OPD_ID)s, %(OPD_ORP_ID)s, %(OPD_ORP_SERIE)s, %(OPD_LOTE)s, %(OPD_PRO_CODIGO)s, %(OPD_COR_CODIGO)s,
-      %(OPD_QUANTIDADE)s, %(OPD_QTD_PRODUZIDAS)s, %(OPD_QTDE_SALDO)s,
-      %(PRO_DESC)s, %(COR_NOME)s
-    )
+    ) VALUES %s
     ON CONFLICT (opd_id) DO UPDATE SET
       op_id = EXCLUDED.op_id,
       op_numero = EXCLUDED.op_numero,
@@ -260,25 +362,84 @@ def upsert_items(pg_cur, items: List[Dict[str,Any]]):
       qtd_saldo = EXCLUDED.qtd_saldo,
       pro_desc = EXCLUDED.pro_desc,
       cor_nome = EXCLUDED.cor_nome
-    """, items, page_size=500)
+    WHERE (t.op_id, t.op_numero, t.lote, t.pro_codigo, t.cor_codigo,
+           t.qtd, t.qtd_produzidas, t.qtd_saldo, t.pro_desc, t.cor_nome)
+      IS DISTINCT FROM
+          (EXCLUDED.op_id, EXCLUDED.op_numero, EXCLUDED.lote, EXCLUDED.pro_codigo, EXCLUDED.cor_codigo,
+           EXCLUDED.qtd, EXCLUDED.qtd_produzidas, EXCLUDED.qtd_saldo, EXCLUDED.pro_desc, EXCLUDED.cor_nome)
+    RETURNING (t.xmax = 0)
+    """, [item_row(it) for it in items], f"({', '.join(['%s'] * len(ITEM_COLS))})", "op_item", stats)
 
-def upsert_roteiro(pg_cur, op_numero: int, atividades: List[Dict[str,Any]]):
-    """UPSERT do roteiro (setor/ordem)."""
-    if not atividades:
-        return
+def item_row(it: Record) -> tuple:
+    """Item lido do Firebird -> tupla na ordem de pg_load.ITEM_COLS."""
+    return (
+        it["OPD_ID"], it.get("OPD_ORP_ID"), it.get("OPD_ORP_SERIE"), it.get("OPD_LOTE"), it.get("OPD_PRO_CODIGO"), it.get("OPD_COR_CODIGO"),
+        it.get("OPD_QUANTIDADE"), it.get("OPD_QTD_PRODUZIDAS"), it.get("OPD_QTDE_SALDO"),
+        it.get("PRO_DESC"), it.get("COR_NOME"),
+    )
+
+def roteiro_rows(op_numero: int, atividades: List[Record],
+                 info: Optional[Dict[str, Optional[str]]]) -> List[tuple]:
+    """
+    Normaliza as atividades lidas do Firebird em tuplas (op_numero, setor_codigo, sequencia),
+    pelas colunas de setor/sequência da detecção `info` (fb_schema, schema["ROTEIRO"]).
+    """
+    if not info:
+        return []
+    c_set, c_seq = info["SETOR_COD"].upper(), info["SEQ"].upper()
     rows = []
     for a in atividades:
-        setor = a.get("OPR_ATV_ID") or a.get("APR_ATV_ID") or a.get("OPR_SET_CODIGO") or a.get("APR_SET_CODIGO") or a.get("ATV_ID") or a.get("ATV_CODIGO")
-        seq   = a.get("OPR_ATV_SEQUENCIA") or a.get("APR_ATV_SEQUENCIA") or a.get("ATV_SEQUENCIA") or a.get("SEQUENCIA") or a.get("ORDEM") or a.get("OPR_SEQ")
+        setor, seq = a.get(c_set), a.get(c_seq)
         if setor is None or seq is None:
             continue
-        rows.append({"op_numero": op_numero, "setor_codigo": int(setor), "sequencia": int(seq)})
+        rows.append((op_numero, int(setor), int(seq)))
+    return rows
 
-    psycopg2.extras.execute_batch(pg_cur, """
-    INSERT INTO roteiro (op_numero, setor_codigo, sequencia)
-    VALUES (%(op_numero)s, %(setor_codigo)s, %(sequencia)s)
+def steps_unparsed(atividades: List[Record], rows: List[tuple]) -> bool:
+    """OP com atividades no Firebird mas nenhuma etapa aproveitada: não é roteiro vazio, não apagar."""
+    return bool(atividades) and not rows
+
+def upsert_roteiro(pg_cur, op_numero: int, atividades: List[Record], info: Optional[Dict[str, Any]],
+                   stats: Optional[Dict[str, Dict[str, int]]] = None, replace: bool = False):
+    """
+    UPSERT do roteiro (setor/ordem). Com `replace` (roteiro lido do Firebird),
+    `atividades` é o roteiro completo da OP: etapas removidas/ressequenciadas
+    na Microsys são apagadas (exceto se nenhuma atividade pôde ser lida).
+    """
+    rows = roteiro_rows(op_numero, atividades, info)
+    if replace and not steps_unparsed(atividades, rows):
+        delete_vanished_steps(pg_cur, "roteiro", op_numero, rows, stats)
+    if not rows:
+        return
+
+    upsert_values(pg_cur, """
+    INSERT INTO roteiro AS t (op_numero, setor_codigo, sequencia)
+    VALUES %s
     ON CONFLICT (op_numero, setor_codigo, sequencia) DO NOTHING
-    """, rows, page_size=500)
+    RETURNING (t.xmax = 0)
+    """, rows, "(%s, %s, %s)", "roteiro", stats)
+
+def bundle_rows(hdr: Dict[str,Any], items: List[Record], atividades: List[Record],
+                roteiro_info: Optional[Dict[str, Any]],
+                andamento_info: Optional[Dict[str, Any]] = None) -> Dict[str, List[tuple]]:
+    """
+    Linhas de uma OP já transformada, na ordem de colunas do pg_load (carga via COPY).
+    Com `andamento_info` (--with-andamento), também as de andamento_setor, das mesmas etapas.
+    "keep_steps": [op_numero] se a OP tem atividades mas nenhuma etapa foi lida
+    (as etapas dela no Postgres não são apagadas pelo merge).
+    """
+    op = [(
+        hdr["ORP_ID"], hdr["ORP_SERIE"], hdr.get("EMP_FIL_CODIGO"), hdr.get("ORP_DESCRICAO"), hdr.get("ORP_PDV_NUMERO"),
+        hdr.get("status_code"), hdr.get("status_nome"), hdr.get("ORP_DATA"), hdr.get("ORP_DT_PREV_INICIO"), hdr.get("ORP_DT_VALIDADE"),
+        hdr.get("ORP_QTDE_PRODUCAO"), hdr.get("ORP_QTDE_PRODUZIDAS"), hdr.get("ORP_QTDE_SALDO"), hdr.get("origem"),
+    )]
+    op_item = [item_row(it) for it in items]
+    roteiro = roteiro_rows(hdr["ORP_SERIE"], atividades, roteiro_info)
+    out = {"op": op, "op_item": op_item, "roteiro": roteiro,
+           "keep_steps": [hdr["ORP_SERIE"]] if steps_unparsed(atividades, roteiro) else []}
+    if andamento_info:
+        out["andamento_setor"] = andamento_rows(hdr["ORP_SERIE"], atividades, andamento_info)
+    return out
 
 # -----------------------------------------------------------------------------
 # Consultas Firebird
@@ -298,7 +459,7 @@ def get_op_header(cur_fb, op_id: int) -> Dict[str, Any]:
         raise RuntimeError(f"OP {op_id} não encontrada.")
     return dict(zip(cols, row))
 
-def get_items(cur_fb, op_id: int, orp_serie: int) -> List[Dict[str, Any]]:
+def get_items(cur_fb, op_id: int, orp_serie: int, schema: Dict[str, Any]) -> List[Record]:
     """
     Lê os itens da OP no Firebird. Traz:
       - código do produto (OPD_PRO_CODIGO)
@@ -306,13 +467,16 @@ def get_items(cur_fb, op_id: int, orp_serie: int) -> List[Dict[str, Any]]:
       - código e NOME da cor (apenas via i.OPD_COR_CODIGO + CORES)
       - quantidades (qtd, produzidas, saldo)
     """
-    # Detecta colunas opcionais
-    prod_desc_col  = fb_detect_product_desc_column(cur_fb)  # ex.: PRO_DESCRICAO
-    color_name_col = fb_detect_color_name_column(cur_fb)    # ex.: COR_NOME
+    # Colunas opcionais (detectadas uma vez por execução)
+    prod_desc_col  = schema["PRODUTOS_DESC"]  # ex.: PRO_DESCRICAO
+    color_name_col = schema["CORES_NOME"]     # ex.: COR_NOME
 
     # Exprs dinâmicas (se não achar, usa NULL)
     prod_desc_expr  = f"p.{prod_desc_col}" if prod_desc_col else "CAST(NULL AS VARCHAR(200))"
     color_name_expr = f"c.{color_name_col}" if color_name_col else "CAST(NULL AS VARCHAR(200))"
+    # sem coluna (ou com as dimensões locais, --dims): sem JOIN no Firebird
+    prod_join  = "LEFT JOIN PRODUTOS p ON p.PRO_CODIGO = i.OPD_PRO_CODIGO" if prod_desc_col else ""
+    color_join = "LEFT JOIN CORES    c ON c.COR_CODIGO = i.OPD_COR_CODIGO" if color_name_col else ""
 
     # IMPORTANTE: não usamos nenhuma coluna de cor em PRODUTOS.
     # Usamos APENAS i.OPD_COR_CODIGO para linkar em CORES.
@@ -330,185 +494,735 @@ def get_items(cur_fb, op_id: int, orp_serie: int) -> List[Dict[str, Any]]:
           i.OPD_QTD_PRODUZIDAS,
           i.OPD_QTDE_SALDO
         FROM ORDEM_PRODUCAO_ITENS i
-        LEFT JOIN PRODUTOS p ON p.PRO_CODIGO = i.OPD_PRO_CODIGO
-        LEFT JOIN CORES    c ON c.COR_CODIGO = i.OPD_COR_CODIGO
+        {prod_join}
+        {color_join}
         WHERE {{filtro}} = ?
         ORDER BY i.OPD_ID
     """
     # Tenta por OPD_ORP_ID; se vazio, tenta por ORP_SERIE
-    cols, rows = fb_fetchall(cur_fb, base_sql.format(filtro="i.OPD_ORP_ID"), (op_id,))
-    if not rows:
-        cols, rows = fb_fetchall(cur_fb, base_sql.format(filtro="i.OPD_ORP_SERIE"), (orp_serie,))
-
-    return [dict(zip([c.upper() for c in cols], r)) for r in rows]
+    items = fb_records(cur_fb, base_sql.format(filtro="i.OPD_ORP_ID"), (op_id,))
+    if not items:
+        items = fb_records(cur_fb, base_sql.format(filtro="i.OPD_ORP_SERIE"), (orp_serie,))
+    return items
 
-def get_color_and_percent(cur_fb, orp_serie: int, hdr: Dict[str, Any]) -> Tuple[str, float]:
+def get_roteiro(cur_fb, op_id: int, orp_serie: int, schema: Dict[str, Any]) -> List[Record]:
     """
-    Calcula % concluído com base nas quantidades dos ITENS (prioritário) ou cabeçalho.
-    Monta o texto de cor a partir dos nomes em CORES vinculados por i.OPD_COR_CODIGO.
+    Lê o roteiro (setores/ordem e, se detectados, início/fim/status) da OP,
+    independente do nome real da tabela.
     """
-    # Totais por itens (para %)
-    cols, row = fb_fetchone(cur_fb, """
-        SELECT
-          SUM(COALESCE(i.OPD_QUANTIDADE,     0)) AS QTD_TOTAL_ITENS,
-          SUM(COALESCE(i.OPD_QTD_PRODUZIDAS, 0)) AS QTD_PRODUZIDAS_ITENS,
-          SUM(COALESCE(i.OPD_QTDE_SALDO,     0)) AS QTD_SALDO_ITENS
-        FROM ORDEM_PRODUCAO_ITENS i
-        WHERE i.OPD_ORP_SERIE = ?
-    """, (orp_serie,))
-    it = dict(zip(cols, row)) if row else {}
-
-    # Nome da cor (detectado) em CORES
-    color_name_col = fb_detect_color_name_column(cur_fb)  # ex.: COR_NOME
-    color_expr = f"TRIM(c.{color_name_col})" if color_name_col else "NULL"
-
-    # Lista de cores distintas vinculadas aos ITENS desta série
-    _, rowc = fb_fetchone(cur_fb, f"""
-        SELECT CAST(LIST(DISTINCT {color_expr}, ', ') AS VARCHAR(200))
-        FROM ORDEM_PRODUCAO_ITENS i
-        LEFT JOIN CORES c ON c.COR_CODIGO = i.OPD_COR_CODIGO
-        WHERE i.OPD_ORP_SERIE = ?
-          AND i.OPD_COR_CODIGO IS NOT NULL
-    """, (orp_serie,))
-    cor = rowc[0] if rowc and rowc[0] else "SEM PINTURA"
-
-    # % concluído
-    def num(x): return 0.0 if x is None else float(x)
-    if it and any(v is not None for v in it.values()):
-        tot = num(it.get("QTD_TOTAL_ITENS")); saldo = num(it.get("QTD_SALDO_ITENS"))
-        pct = round((1 - (saldo / tot)) * 100, 2) if tot > 0 else 0.0
-    else:
-        tot = num(hdr.get("ORP_QTDE_PRODUCAO")); saldo = num(hdr.get("ORP_QTDE_SALDO"))
-        pct = round((1 - (saldo / tot)) * 100, 2) if tot > 0 else 0.0
-
-    return cor, pct
-
-def detect_roteiro(cur_fb) -> Optional[Dict[str,str]]:
-    """
-    Detecta qual tabela/colunas representam o roteiro no seu Firebird.
-    """
-    def list_user_tables():
-        cur_fb.execute("""
-          SELECT TRIM(r.rdb$relation_name)
-          FROM rdb$relations r
-          WHERE r.rdb$system_flag = 0 AND r.rdb$view_blr IS NULL
-          ORDER BY 1
-        """)
-        return [r[0] for r in cur_fb.fetchall()]
-
-    def list_columns(table):
-        cur_fb.execute("""
-          SELECT TRIM(rf.rdb$field_name)
-          FROM rdb$relation_fields rf
-          WHERE rf.rdb$relation_name = ?
-          ORDER BY rf.rdb$field_position
-        """, (table,))
-        return [r[0] for r in cur_fb.fetchall()]
-
-    tables = list_user_tables()
-    candidates = ["PCP_APTO_ROTEIRO","PCP_ORP_ROTEIRO","PCP_ROTEIRO","ROTEIRO"]
-
-    # Heurística leve
-    for t in candidates:
-        if t not in tables:
-            continue
-        cols = [c.upper() for c in list_columns(t)]
-        # Op num/id
-        opnum = next((c for c in cols if re.search(r"(^|_)ORP_?(NUM|NUMERO|SERIE|ID)$", c, re.I)), None)
-        # Setor
-        setor = next((c for c in cols if re.search(r"(OPR_)?(ATV|SET).*?(ID|COD)", c, re.I)), None)
-        # Sequência
-        seq = next((c for c in cols if re.search(r"(SEQ|ORDEM)", c, re.I)), None)
-        if opnum and setor and seq:
-            return {"TABLE": t, "OP_NUM": opnum, "SETOR_COD": setor, "SEQ": seq}
-    return None
-
-def get_roteiro(cur_fb, op_id: int, orp_serie: int) -> List[Dict[str,Any]]:
-    """
-    Lê o roteiro (setores/ordem) da OP, independente do nome real da tabela.
-    """
-    info = detect_roteiro(cur_fb)
+    info = schema["ROTEIRO"]
     if not info:
         return []
     link = info["OP_NUM"].upper()
     param = op_id if "ID" in link else orp_serie
 
-    cols, rows = fb_fetchall(cur_fb, f"""
-        SELECT {info['OP_NUM']}, {info['SETOR_COD']}, {info['SEQ']}
+    return fb_records(cur_fb, f"""
+        SELECT {', '.join(roteiro_select(info))}
         FROM {info['TABLE']}
         WHERE {info['OP_NUM']} = ?
         ORDER BY {info['SEQ']}
     """, (param,))
-    return [dict(zip([c.upper() for c in cols], r)) for r in rows]
 
 # -----------------------------------------------------------------------------
 # Seleção de OPs por janela (Firebird)
 # -----------------------------------------------------------------------------
-def find_ops_window(cur_fb, filial: int, status_list: List[str],
-                    date_field: str, dt_from: date, dt_to: date,
-                    limit: Optional[int] = None) -> List[int]:
-    """
-    Localiza ORP_IDs no Firebird dentro da janela/filial/status.
-    """
+def _window_filter(filial: int, status_list: List[str], date_field: str,
+                   dt_from: date, dt_to: date) -> Tuple[str, str, List[Any]]:
+    """Coluna de data, WHERE e parâmetros da janela (sobre ORDEM_PRODUCAO op)."""
     field_map = {
         "validade":   "ORP_DT_VALIDADE",
         "prev_inicio":"ORP_DT_PREV_INICIO",
         "emissao":    "ORP_DATA",
     }
-    col = field_map.get(date_field, "ORP_DT_VALIDADE")
+    col = "op." + field_map.get(date_field, "ORP_DT_VALIDADE")
     status_tuple = tuple([s.strip().upper() for s in status_list if s.strip()])
+    where = f"""
+        op.EMP_FIL_CODIGO = ?
+          AND COALESCE(op.ORP_FECHADO, 0) = 0
+          AND COALESCE(op.ORP_STS_CODIGO, '') IN ({','.join(['?']*len(status_tuple))})
+          AND {col} BETWEEN ? AND ?
+    """
+    params = [filial] + list(status_tuple) + [dt_from, dt_to]
+    return col, where, params
 
+def find_ops_window(cur_fb, filial: int, status_list: List[str],
+                    date_field: str, dt_from: date, dt_to: date,
+                    limit: Optional[int] = None) -> List[int]:
+    """
+    Localiza ORP_IDs no Firebird dentro da janela/filial/status.
+    """
+    col, where, params = _window_filter(filial, status_list, date_field, dt_from, dt_to)
     sql = f"""
         SELECT { 'FIRST ' + str(limit) if limit else '' } ORP_ID
         FROM ORDEM_PRODUCAO op
-        WHERE op.EMP_FIL_CODIGO = ?
-          AND COALESCE(op.ORP_FECHADO, 0) = 0
-          AND COALESCE(op.ORP_STS_CODIGO, '') IN ({','.join(['?']*len(status_tuple))})
-          AND {col} BETWEEN ? AND ?
+        WHERE {where}
         ORDER BY {col} NULLS LAST, op.ORP_SERIE DESC
     """
-    params = [filial] + list(status_tuple) + [dt_from, dt_to]
-    _, rows = fb_fetchall(cur_fb, sql, params)
-    return [int(r[0]) for r in rows]
+    return [int(r[0]) for r in fb_iter(cur_fb, sql, params)]
+
+def _fp_text(expr: str) -> str:
+    """Coluna como texto para o HASH do fingerprint (NULL vira '')."""
+    return f"COALESCE(CAST({expr} AS VARCHAR(40)), '')"
+
+def _fp_steps(roteiro: Optional[Dict[str, Optional[str]]], step_status: bool) -> str:
+    """
+    Subconsulta do fingerprint do roteiro da OP: qtd de etapas + soma de HASH de
+    (setor, sequência[, início, fim, status com --with-andamento]). Sem roteiro detectado: ''.
+    """
+    if not roteiro:
+        return "''"
+    cols = [roteiro["SETOR_COD"], roteiro["SEQ"]]
+    if step_status:
+        cols += [roteiro[k] for k in ("DTINI", "DTFIM", "STATUS") if roteiro.get(k)]
+    link = "op.ORP_ID" if "ID" in roteiro["OP_NUM"].upper() else "op.ORP_SERIE"
+    row = " || '|' || ".join(_fp_text(f"r.{c}") for c in cols)
+    return f"""(SELECT COUNT(*) || ':' || COALESCE(SUM(MOD(HASH({row}), {HASH_MOD})), 0)
+                  FROM {roteiro['TABLE']} r WHERE r.{roteiro['OP_NUM']} = {link})"""
+
+def find_ops_window_fingerprints(cur_fb, filial: int, status_list: List[str],
+                                 date_field: str, dt_from: date, dt_to: date,
+                                 limit: Optional[int] = None,
+                                 roteiro: Optional[Dict[str, Optional[str]]] = None,
+                                 step_status: bool = False) -> List[Tuple[int, str]]:
+    """
+    Mesma seleção de find_ops_window, numa única consulta agregada que também
+    devolve um fingerprint barato por OP, cobrindo o que a cópia grava:
+      - cabeçalho: status, descrição, pedido, datas e quantidades;
+      - itens (por OPD_ORP_ID; sem nenhum, pela série, como fetch_items): nº,
+        somas de quantidade/saldo/produzidas, maior OPD_ID e soma de HASH de
+        (item, produto, cor);
+      - roteiro (se detectado): nº de etapas e soma de HASH de setor/sequência
+        (+ início/fim/status com `step_status`, --with-andamento).
+    Retorna [(ORP_ID, fingerprint)] na ordem da janela.
+    """
+    col, where, params = _window_filter(filial, status_list, date_field, dt_from, dt_to)
+    item = " || '|' || ".join(_fp_text(f"COALESCE(i.{c}, s.{c})")
+                              for c in ("OPD_ID", "OPD_PRO_CODIGO", "OPD_COR_CODIGO"))
+    sql = f"""
+        SELECT { 'FIRST ' + str(limit) if limit else '' }
+          op.ORP_ID, op.ORP_STS_CODIGO, op.ORP_STS_ID,
+          op.ORP_DESCRICAO, op.ORP_PDV_NUMERO, op.ORP_DATA,
+          op.ORP_QTDE_PRODUCAO, op.ORP_QTDE_PRODUZIDAS, op.ORP_QTDE_SALDO,
+          op.ORP_DT_PREV_INICIO, op.ORP_DT_VALIDADE,
+          COUNT(COALESCE(i.OPD_ID, s.OPD_ID)),
+          SUM(COALESCE(i.OPD_QUANTIDADE, s.OPD_QUANTIDADE, 0)),
+          SUM(COALESCE(i.OPD_QTDE_SALDO, s.OPD_QTDE_SALDO, 0)),
+          SUM(COALESCE(i.OPD_QTD_PRODUZIDAS, s.OPD_QTD_PRODUZIDAS, 0)),
+          MAX(COALESCE(i.OPD_ID, s.OPD_ID)),
+          SUM(MOD(HASH({item}), {HASH_MOD})),
+          {_fp_steps(roteiro, step_status)}
+        FROM ORDEM_PRODUCAO op
+        LEFT JOIN ORDEM_PRODUCAO_ITENS i ON i.OPD_ORP_ID = op.ORP_ID
+        LEFT JOIN ORDEM_PRODUCAO_ITENS s ON s.OPD_ORP_SERIE = op.ORP_SERIE
+          AND NOT EXISTS (SELECT 1 FROM ORDEM_PRODUCAO_ITENS x WHERE x.OPD_ORP_ID = op.ORP_ID)
+        WHERE {where}
+        GROUP BY op.ORP_ID, op.ORP_SERIE, op.ORP_STS_CODIGO, op.ORP_STS_ID,
+                 op.ORP_DESCRICAO, op.ORP_PDV_NUMERO, op.ORP_DATA,
+                 op.ORP_QTDE_PRODUCAO, op.ORP_QTDE_PRODUZIDAS, op.ORP_QTDE_SALDO,
+                 op.ORP_DT_PREV_INICIO, op.ORP_DT_VALIDADE
+        ORDER BY {col} NULLS LAST, op.ORP_SERIE DESC
+    """
+    out = []
+    for r in fb_iter(cur_fb, sql, params):
+        raw = "|".join("" if v is None else str(v) for v in r[1:])
+        out.append((int(r[0]), hashlib.md5(raw.encode("utf-8")).hexdigest()))
+    return out
+
+def count_ops_window(cur_fb, filial: int, status_list: List[str],
+                     date_field: str, dt_from: date, dt_to: date) -> int:
+    """Quantas OPs a janela selecionaria (mesmo filtro, só COUNT)."""
+    _, where, params = _window_filter(filial, status_list, date_field, dt_from, dt_to)
+    _, row = fb_fetchone(cur_fb, f"SELECT COUNT(*) FROM ORDEM_PRODUCAO op WHERE {where}", params)
+    return int(row[0]) if row else 0
+
+def plan_slices(cur_fb, args, dt_from: date, dt_to: date, target: int) -> List[Tuple[date, date, int]]:
+    """
+    Divide a janela em fatias de até ~`target` OPs, em ordem de data: conta a
+    faixa e, se passar do alvo, reparte em ceil(n/target) faixas de mesmo
+    tamanho em dias e repete em cada uma (meses cheios viram fatias menores).
+    Fatias vizinhas compartilham o dia da borda (BETWEEN inclusivo: a união é
+    exatamente a janela); a OP repetida é descartada na cópia. Fatias vazias saem.
+    Retorna [(de, até, qtd)].
+    """
+    status_list = args.status.split(",")
+    out: List[Tuple[date, date, int]] = []
+    stack = [(dt_from, dt_to)]
+    while stack:
+        a, b = stack.pop()
+        n = count_ops_window(cur_fb, args.filial, status_list, args.date_field, a, b)
+        days = (b - a).days
+        if n <= target or days < 2:
+            if n:
+                out.append((a, b, n))
+            continue
+        parts = min(-(-n // target), days)
+        edges = [a + timedelta(days=days * k // parts) for k in range(parts + 1)]
+        stack.extend(reversed(list(zip(edges[:-1], edges[1:]))))  # LIFO: a primeira faixa sai antes
+    return out
 
 # -----------------------------------------------------------------------------
-# Worker de cópia
+# Fingerprints da última sincronização (Postgres)
+# -----------------------------------------------------------------------------
+def filter_changed(pg_cur, fps: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """
+    Mantém só as OPs cujo fingerprint difere do gravado no último sync
+    (ou que não têm fingerprint / não existem mais em op).
+    """
+    if not fps:
+        return []
+    pg_cur.execute("""
+        SELECT f.op_id, f.fingerprint
+        FROM etl_op_fingerprint f
+        JOIN op o ON o.op_id = f.op_id
+        WHERE f.op_id = ANY(%s)
+    """, ([op_id for op_id, _ in fps],))
+    known = dict(pg_cur.fetchall())
+    return [(op_id, fp) for op_id, fp in fps if known.get(op_id) != fp]
+
+def save_fingerprints(pg_cur, fps: List[Tuple[int, str]]):
+    """Grava os fingerprints das OPs copiadas com sucesso."""
+    if not fps:
+        return
+    psycopg2.extras.execute_values(pg_cur, """
+        INSERT INTO etl_op_fingerprint (op_id, fingerprint, synced_at)
+        VALUES %s
+        ON CONFLICT (op_id) DO UPDATE SET
+          fingerprint = EXCLUDED.fingerprint,
+          synced_at   = EXCLUDED.synced_at
+    """, fps, template="(%s, %s, now())", page_size=1000)
+
+# -----------------------------------------------------------------------------
+# Reconciliação (--reconcile): OPs que saíram da janela, fecharam ou foram canceladas
+# -----------------------------------------------------------------------------
+FINAL_STATUS = ("FINALIZADA", "CANCELADA", "FECHADA", "REMOVIDA")
+
+def reconcile_ops(fbc, pgc, filial: Optional[int] = None,
+                  stats: Optional[Dict[str, Dict[str, int]]] = None,
+                  origem: Optional[str] = None) -> Dict[str, int]:
+    """
+    A janela só seleciona OPs abertas no Firebird; uma OP finalizada/cancelada lá
+    ficaria "ABERTA" no Postgres para sempre. Aqui: pega as OPs NÃO finais do
+    Postgres, lê só o status delas no Firebird (IN em blocos, sem itens/roteiro)
+    e atualiza status_code/status_nome em lote (versionando em op_hist):
+      - ORP_FECHADO = 1 com código ainda aberto -> FECHADA
+      - OP que não existe mais no Firebird      -> REMOVIDA (tombstone)
+    Só as OPs gravadas pela `origem` deste Firebird (None = as do .env sem
+    ETL_SOURCE_NAME, op.origem NULL): as de outro banco não existem aqui e
+    virariam REMOVIDA (ou pegariam o status de outra OP com o mesmo ORP_ID);
+    elas são reconciliadas pelo 08_sync_multi --reconcile, na própria origem.
+    Não faz commit. Retorna {"checked", "updated", "removed"}.
+    """
+    sql = "SELECT op_id, status_code, status_nome FROM op WHERE COALESCE(status_nome, '') <> ALL(%s)"
+    sql += " AND origem IS NOT DISTINCT FROM %s"
+    params: List[Any] = [list(FINAL_STATUS), origem]
+    if filial is not None:
+        sql += " AND filial = %s"; params.append(filial)
+    pgc.execute(sql, params)
+    current = {int(r[0]): (r[1], r[2]) for r in pgc.fetchall()}
+    if not current:
+        return {"checked": 0, "updated": 0, "removed": 0}
+
+    fb_status = fetch_status(fbc, list(current))
+    changes: List[Tuple[int, Optional[str], str]] = []
+    removed = 0
+    for op_id, (code, nome) in current.items():
+        st = fb_status.get(op_id)
+        if st is None:
+            new_code, new_nome = code, "REMOVIDA"; removed += 1
+        else:
+            new_code = (st["ORP_STS_CODIGO"] or "").strip() or None
+            new_nome = map_status(new_code)
+            if int(st["ORP_FECHADO"] or 0) and new_nome not in FINAL_STATUS:
+                new_nome = "FECHADA"
+        if (new_code, new_nome) != (code, nome):
+            changes.append((op_id, new_code, new_nome))
+
+    if changes:
+        psycopg2.extras.execute_values(pgc, """
+            UPDATE op AS t SET status_code = v.code, status_nome = v.nome
+            FROM (VALUES %s) AS v(op_id, code, nome)
+            WHERE t.op_id = v.op_id
+        """, changes, template="(%s::int, %s::varchar, %s::varchar)", page_size=1000)
+        record_op_history(pgc, [c[0] for c in changes])
+    add_stats(stats, "op", updated=len(changes), unchanged=len(current) - len(changes))
+    return {"checked": len(current), "updated": len(changes), "removed": removed}
+
+# -----------------------------------------------------------------------------
+# Contexto da execução: checkpoint, dead-letter e commits em lotes
 # -----------------------------------------------------------------------------
-def copy_one_op(fbc, pgc, op_id: int) -> bool:
+def new_run(key: str, commit_every: int = 0, fps: Optional[List[Tuple[int, str]]] = None,
+            andamento: Optional[Dict[str, Any]] = None,
+            dims: Optional[Dict[str, Dict[int, Any]]] = None,
+            metrics: Optional[Dict[str, Any]] = None, roteiro: Optional[Dict[str, Any]] = None,
+            source: Optional[str] = None,
+            snapshot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Copia 1 OP do Firebird p/ Postgres (cabeçalho, itens, roteiro).
+    Estado de uma execução (ou partição de worker):
+      key          chave do checkpoint (janela/filial/status [+ partição])
+      commit_every commit a cada N OPs processadas (0 = só no fim)
+      fps          fingerprints a gravar junto com as OPs copiadas (--changed-only)
+      andamento    detecção do roteiro, se andamento_setor sai da mesma leitura (--with-andamento)
+      dims         nomes de produto/cor do Postgres, se os itens vêm sem JOIN (--dims)
+      metrics      tempos por estágio (etl_metrics), ou None
+      roteiro      detecção do roteiro (schema["ROTEIRO"]): colunas de setor/sequência;
+                   se detectado, as etapas lidas são o conjunto completo de cada OP e
+                   as que sumiram no Firebird são apagadas (roteiro/andamento)
+      source       nome da origem gravado em op.origem (None = não marca)
+      snapshot     gravador de snapshot (fb_snapshot) da extração crua, ou None
     """
+    return {"key": key, "commit_every": commit_every, "fps": dict(fps or []), "andamento": andamento,
+            "dims": dims, "metrics": metrics, "roteiro": roteiro, "replace_steps": bool(roteiro),
+            "source": source,
+            "snapshot": snapshot,
+            "stats": new_stats(), "done": [], "fail": 0,
+            "committed": {"done": 0, "fail": 0, "stats": new_stats()},
+            "pending_ok": [], "pending_n": 0, "last_op_id": None}
+
+@contextmanager
+def snapshot_run(args, run_key: str, schema: Dict[str, Any], suffix: str = ""):
+    """
+    Gravador de snapshot da execução (--snapshot-dir) ou None. O manifest é gravado
+    na saída (status ok/error): só então a pasta vale para --from-snapshot.
+    """
+    if not args.snapshot_dir:
+        yield None
+        return
+    snap = open_snapshot(args.snapshot_dir, {
+        "run_key": run_key, "filial": args.filial, "origem": SOURCE_NAME, "source": FB_SOURCE,
+        "date_field": args.date_field, "status_list": args.status, "dims": args.dims, "schema": schema,
+    }, suffix)
+    status = "error"
     try:
-        # Cabeçalho e metadados calculados
-        hdr = get_op_header(fbc, op_id)
-        orp_serie = hdr["ORP_SERIE"]
+        yield snap
+        status = "ok"
+    finally:
+        path = close_snapshot(snap, status)
+        print(f"Snapshot: {snap['ops']} OP(s) em {len(snap['parts'])} parte(s) -> {path}")
+
+def _json_default(o):
+    if isinstance(o, Record):
+        return o.as_dict()
+    return str(o)
+
+def record_ok(run: Dict[str, Any], op_id: int):
+    run["done"].append(op_id); run["pending_ok"].append(op_id)
+    run["pending_n"] += 1; run["last_op_id"] = op_id
+
+def record_fail(pgc, run: Dict[str, Any], op_id: int, error: Any, payload: Any = None):
+    """Conta a falha e manda a OP para etl_dead_letter (para reprocessar sozinha)."""
+    print(f"[ERRO] OP {op_id}: {error}")
+    run["fail"] += 1; run["pending_n"] += 1; run["last_op_id"] = op_id
+    pgc.execute("""
+        INSERT INTO etl_dead_letter (run_key, op_id, error, payload)
+        VALUES (%s, %s, %s, %s)
+    """, (run["key"], op_id, str(error)[:4000],
+          psycopg2.extras.Json(payload, dumps=lambda o: json.dumps(o, default=_json_default))))
 
-        # Calcula cor e % concluído de forma robusta
-        cor_txt, percent = get_color_and_percent(fbc, orp_serie, hdr)
+def checkpoint(pgc, run: Dict[str, Any], force: bool = False):
+    """
+    A cada `commit_every` OPs (ou no fim, com force=True): recalcula % concluído
+    e cor das OPs copiadas (1 UPDATE set-based), versiona as que mudaram em
+    op_hist, grava os fingerprints, resolve dead-letters antigos delas, salva o
+    checkpoint (última ORP_ID processada) e faz COMMIT.
+    """
+    if not force and (run["commit_every"] <= 0 or run["pending_n"] < run["commit_every"]):
+        return
+    ok_ids = run["pending_ok"]
+    if ok_ids:
+        derive_op_header(pgc, ok_ids, run["stats"])
+        record_op_history(pgc, ok_ids, run["stats"])
+        save_fingerprints(pgc, [(i, run["fps"][i]) for i in ok_ids if i in run["fps"]])
+        pgc.execute("""
+            UPDATE etl_dead_letter SET resolved_at = now()
+            WHERE op_id = ANY(%s) AND resolved_at IS NULL
+        """, (ok_ids,))
+    if run["last_op_id"] is not None:
+        pgc.execute("""
+            INSERT INTO etl_checkpoint (run_key, last_op_id, updated_at)
+            VALUES (%s, %s, now())
+            ON CONFLICT (run_key) DO UPDATE SET
+              last_op_id = EXCLUDED.last_op_id,
+              updated_at = EXCLUDED.updated_at
+        """, (run["key"], run["last_op_id"]))
+    pgc.connection.commit()
+    run["pending_ok"] = []; run["pending_n"] = 0
+    # progresso já gravado (um worker que cair depois devolve só isto)
+    run["committed"] = {"done": len(run["done"]), "fail": run["fail"],
+                        "stats": {t: dict(c) for t, c in run["stats"].items()}}
 
-        hdr["status_code"] = hdr.get("ORP_STS_CODIGO")
-        hdr["status_nome"] = map_status(hdr.get("ORP_STS_CODIGO"))
-        hdr["percent_concluido"] = percent
-        hdr["cor_txt"] = cor_txt
+def apply_resume(pgc, key: str, op_ids: List[int]) -> List[int]:
+    """--resume: continua depois da última ORP_ID commitada para esta chave."""
+    pgc.execute("SELECT last_op_id FROM etl_checkpoint WHERE run_key = %s", (key,))
+    row = pgc.fetchone()
+    if not row or row[0] not in op_ids:
+        return op_ids
+    rest = op_ids[op_ids.index(row[0]) + 1:]
+    print(f"Retomando {key} após a OP {row[0]}: {len(op_ids) - len(rest)} já processada(s), {len(rest)} restante(s).")
+    return rest
 
-        # Itens e roteiro
-        items      = get_items(fbc, op_id, orp_serie)
-        atividades = get_roteiro(fbc, op_id, orp_serie)
+def dead_letter_ops(pgc) -> List[int]:
+    """ORP_IDs pendentes em etl_dead_letter (--retry-dead-letter)."""
+    pgc.execute("SELECT DISTINCT op_id FROM etl_dead_letter WHERE resolved_at IS NULL ORDER BY op_id")
+    return [r[0] for r in pgc.fetchall()]
+
+# -----------------------------------------------------------------------------
+# Worker de cópia
+# -----------------------------------------------------------------------------
+def copy_one_op(fbc, pgc, op_id: int, schema: Dict[str, Any], run: Dict[str, Any]) -> bool:
+    """
+    Copia 1 OP do Firebird p/ Postgres (cabeçalho, itens, roteiro), dentro de um
+    SAVEPOINT: uma OP com erro não aborta a transação das demais.
+    """
+    hdr: Dict[str, Any] = {}
+    try:
+        # Cabeçalho, itens e roteiro (% concluído e cor: derive_op_header no checkpoint)
+        with stage(run["metrics"], "extract"):
+            hdr = get_op_header(fbc, op_id)
+            orp_serie = hdr["ORP_SERIE"]
+            items      = get_items(fbc, op_id, orp_serie, schema)
+            atividades = get_roteiro(fbc, op_id, orp_serie, schema)
+        if run["dims"]:
+            apply_dim_names(items, run["dims"])
+        transform_header(hdr, run["source"])
 
         # UPSERT no Postgres
-        upsert_op(pgc, hdr)
-        upsert_items(pgc, items)
-        upsert_roteiro(pgc, orp_serie, atividades)
+        stats = new_stats()
+        with stage(run["metrics"], "load"), savepoint(pgc):
+            upsert_op(pgc, hdr, stats)
+            upsert_items(pgc, items, stats)
+            upsert_roteiro(pgc, orp_serie, atividades, run["roteiro"], stats, run["replace_steps"])
+            if run["andamento"]:
+                upsert_steps_andamento(pgc, run, orp_serie, atividades, stats)
+        merge_stats(run["stats"], stats)
+        record_ok(run, op_id)
         return True
 
     except Exception as e:
-        print(f"[ERRO] OP {op_id}: {e}")
+        record_fail(pgc, run, op_id, e, {"hdr": hdr})
         return False
 
+def upsert_steps_andamento(pgc, run: Dict[str, Any], orp_serie: int, atividades: List[Record],
+                           stats: Dict[str, Dict[str, int]]):
+    """andamento_setor de uma OP (--with-andamento), caminho por OP; mesmo diff do roteiro."""
+    rows = andamento_rows(orp_serie, atividades, run["andamento"])
+    if run["replace_steps"] and not steps_unparsed(atividades, rows):
+        delete_vanished_steps(pgc, "andamento_setor", orp_serie, rows, stats)
+    upsert_andamento(pgc, rows, stats)
+
+def transform_header(hdr: Dict[str, Any], source: Optional[str] = None) -> Dict[str, Any]:
+    """Campos derivados do cabeçalho (status humanizado, origem)."""
+    hdr["status_code"] = hdr.get("ORP_STS_CODIGO")
+    hdr["status_nome"] = map_status(hdr.get("ORP_STS_CODIGO"))
+    hdr["origem"] = source
+    return hdr
+
+def transform_chunk(pgc, run: Dict[str, Any], ids: List[int], bundles: List[Dict[str, Any]],
+                    load: str) -> List[Dict[str, Any]]:
+    """
+    Estágio de transformação de um bloco: deriva o cabeçalho e (load="copy") as
+    linhas de cada OP. OPs ausentes no Firebird ou com erro vão para o dead-letter.
+    `pgc` pode ser None (pipeline): nesse caso as falhas voltam em b["error"].
+    """
+    found = {b["op_id"] for b in bundles}
+    out = []
+    for op_id in ids:
+        if op_id not in found:
+            b = {"op_id": op_id, "error": f"OP {op_id} não encontrada.", "payload": None}
+            if pgc is None:
+                out.append(b)
+            else:
+                record_fail(pgc, run, op_id, b["error"])
+    for b in bundles:
+        try:
+            if run["dims"]:
+                apply_dim_names(b["items"], run["dims"])
+            transform_header(b["hdr"], run["source"])
+            if load == "copy":
+                b["rows"] = bundle_rows(b["hdr"], b["items"], b["roteiro"], run["roteiro"], run["andamento"])
+            out.append(b)
+        except Exception as e:
+            if pgc is None:
+                out.append({"op_id": b["op_id"], "error": e, "payload": b})
+            else:
+                record_fail(pgc, run, b["op_id"], e, b)
+    return out
+
+def write_chunk(pgc, run: Dict[str, Any], bundles: List[Dict[str, Any]], load: str):
+    """
+    Grava um bloco já transformado:
+      - load="copy": tudo num COPY + merge, sob SAVEPOINT; se o bloco falhar,
+        refaz OP a OP (cada uma com seu SAVEPOINT) para isolar a(s) culpada(s);
+      - load="batch": upserts por OP, cada uma com seu SAVEPOINT.
+    Falhas vão para etl_dead_letter com o pacote da OP.
+    """
+    ok = []
+    for b in bundles:
+        if "error" in b:
+            record_fail(pgc, run, b["op_id"], b["error"], b.get("payload"))
+        else:
+            ok.append(b)
+    if not ok:
+        return
+
+    if load == "copy":
+        staged: Dict[str, List[tuple]] = {}
+        for b in ok:
+            for k, rows in b["rows"].items():
+                staged.setdefault(k, []).extend(rows)
+        stats = new_stats()
+        try:
+            with savepoint(pgc, "etl_bloco"):
+                load_staged(pgc, staged, stats, run["replace_steps"])
+            merge_stats(run["stats"], stats)
+            for b in ok:
+                record_ok(run, b["op_id"])
+            return
+        except Exception as e:
+            print(f"[AVISO] bloco com {len(ok)} OPs falhou ({e}); refazendo OP a OP.")
+
+    for b in ok:
+        stats = new_stats()
+        try:
+            with savepoint(pgc):
+                if load == "copy":
+                    load_staged(pgc, b["rows"], stats, run["replace_steps"])
+                else:
+                    upsert_op(pgc, b["hdr"], stats)
+                    upsert_items(pgc, b["items"], stats)
+                    upsert_roteiro(pgc, b["hdr"]["ORP_SERIE"], b["roteiro"], run["roteiro"], stats, run["replace_steps"])
+                    if run["andamento"]:
+                        upsert_steps_andamento(pgc, run, b["hdr"]["ORP_SERIE"], b["roteiro"], stats)
+            merge_stats(run["stats"], stats)
+            record_ok(run, b["op_id"])
+        except Exception as e:
+            record_fail(pgc, run, b["op_id"], e, {k: v for k, v in b.items() if k != "rows"})
+
+def copy_ops_bulk(fbc, pgc, op_ids: List[int], schema: Dict[str, Any], run: Dict[str, Any],
+                  chunk_size: int = DEFAULT_CHUNK, load: str = "copy") -> Tuple[List[int], int]:
+    """
+    Copia as OPs em blocos: por bloco, cabeçalhos/itens/roteiro em poucas
+    consultas set-based (fb_extract). Gravação:
+      - load="copy":  COPY para staging + 1 INSERT ... SELECT por tabela (pg_load)
+      - load="batch": upserts por OP (mesmo caminho do modo por OP)
+    Retorna (ORP_IDs copiados, falhas).
+    """
+    prod_desc_col  = schema["PRODUTOS_DESC"]
+    color_name_col = schema["CORES_NOME"]
+    rot_info       = schema["ROTEIRO"]
+    if load == "copy":
+        ensure_staging(pgc)
+
+    m = run["metrics"]
+    for ids in chunked(op_ids, chunk_size):
+        with stage(m, "extract"):
+            bundles = extract_bundles(fbc, ids, prod_desc_col, color_name_col, rot_info)
+        if run["snapshot"]:
+            with stage(m, "snapshot"):
+                snapshot_bundles(run["snapshot"], bundles)
+        with stage(m, "transform"):
+            chunk = transform_chunk(pgc, run, ids, bundles, load)
+        with stage(m, "load"):
+            write_chunk(pgc, run, chunk, load)
+        with stage(m, "commit"):
+            checkpoint(pgc, run)
+    return run["done"], run["fail"]
+
+# -----------------------------------------------------------------------------
+# Pipeline extract -> transform -> load com filas limitadas (--pipeline)
+# -----------------------------------------------------------------------------
+_END = object()  # fim de fila
+
+def _q_put(q: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """put bloqueante (back-pressure) que desiste se o pipeline foi abortado."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _q_get(q: "queue.Queue", stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _END
+
+def copy_ops_pipeline(fbc, pgc, op_ids: List[int], schema: Dict[str, Any], run: Dict[str, Any],
+                      chunk_size: int = DEFAULT_CHUNK, load: str = "copy",
+                      queue_size: int = 4) -> Tuple[List[int], int]:
+    """
+    Mesma cópia do modo --bulk, em 3 estágios concorrentes:
+      - leitor (thread): extrai blocos de OPs do Firebird (fb_extract);
+      - transformação (thread): status e linhas para o Postgres;
+      - gravador (thread atual): grava cada bloco no Postgres.
+    As filas entre os estágios têm `queue_size` blocos no máximo: se o Postgres
+    atrasar, o leitor espera (memória estável) e o tempo total tende a
+    max(extração, carga) em vez da soma. Retorna (ORP_IDs copiados, falhas).
+    """
+    q_ext: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    q_load: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def reader():
+        try:
+            for ids in chunked(op_ids, chunk_size):
+                with stage(run["metrics"], "extract"):
+                    bundles = extract_bundles(fbc, ids, schema["PRODUTOS_DESC"], schema["CORES_NOME"], schema["ROTEIRO"])
+                if run["snapshot"]:
+                    # antes da transformação, que altera cabeçalho e itens
+                    with stage(run["metrics"], "snapshot"):
+                        snapshot_bundles(run["snapshot"], bundles)
+                if not _q_put(q_ext, (ids, bundles), stop):
+                    return
+        except BaseException as e:
+            errors.append(e); stop.set()
+        finally:
+            _q_put(q_ext, _END, stop)
+
+    def transformer():
+        try:
+            while True:
+                item = _q_get(q_ext, stop)
+                if item is _END:
+                    break
+                ids, bundles = item
+                # sem cursor: a thread de transformação não toca no Postgres
+                with stage(run["metrics"], "transform"):
+                    chunk = transform_chunk(None, run, ids, bundles, load)
+                if not _q_put(q_load, chunk, stop):
+                    return
+        except BaseException as e:
+            errors.append(e); stop.set()
+        finally:
+            _q_put(q_load, _END, stop)
+
+    if load == "copy":
+        ensure_staging(pgc)
+    threads = [threading.Thread(target=reader, name="etl-extract", daemon=True),
+               threading.Thread(target=transformer, name="etl-transform", daemon=True)]
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            chunk = _q_get(q_load, stop)
+            if chunk is _END:
+                break
+            with stage(run["metrics"], "load"):
+                write_chunk(pgc, run, chunk, load)
+            with stage(run["metrics"], "commit"):
+                checkpoint(pgc, run)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    return run["done"], run["fail"]
+
+def sync_ops(fbc, pgc, op_ids: List[int], schema: Dict[str, Any], args,
+             run: Dict[str, Any]) -> Tuple[List[int], int]:
+    """Copia as OPs pelo caminho escolhido na CLI. Retorna (ORP_IDs copiados, falhas)."""
+    if args.pipeline:
+        return copy_ops_pipeline(fbc, pgc, op_ids, schema, run, args.chunk_size, args.load, args.queue_size)
+    if args.bulk:
+        return copy_ops_bulk(fbc, pgc, op_ids, schema, run, args.chunk_size, args.load)
+    for opid in op_ids:
+        copy_one_op(fbc, pgc, opid, schema, run)
+        with stage(run["metrics"], "commit"):
+            checkpoint(pgc, run)
+    return run["done"], run["fail"]
+
+# -----------------------------------------------------------------------------
+# Workers paralelos (--workers N)
+# -----------------------------------------------------------------------------
+def sync_partition(op_ids: List[int], fps: List[Tuple[int, str]], args,
+                   run_key: str) -> Tuple[List[int], int, Dict[str, Dict[str, int]], Dict[str, Any], Optional[str]]:
+    """
+    Worker: conexões PRÓPRIAS com Firebird e Postgres, copia a sua partição e
+    faz o commit dela de forma independente (checkpoint próprio em `run_key`).
+    Retorna (copiados, falhas, contagens, tempos/round trips do worker, erro).
+    Se cair no meio, `erro` traz a causa e valem só as OPs já commitadas: as
+    demais da partição contam como falha (--resume continua do checkpoint).
+    """
+    m = new_metrics(run_key)
+    fb = fb_connect(snapshot=args.with_andamento); fbc = count_cursor(fb.cursor(), m, "fb")
+    pg = pg_connect(); pg.autocommit = False; pgc = count_cursor(pg.cursor(), m, "pg")
+    run = None
+    try:
+        if args.async_commit:
+            set_async_commit(pgc)
+        if args.resume:
+            op_ids = apply_resume(pgc, run_key, op_ids)
+        schema, dims = local_dims(pgc, args, resolve_schema(fbc, FB_SOURCE))  # esquema vem do cache
+        suffix = "-w" + run_key.rsplit("#w", 1)[1].split("/")[0]
+        with snapshot_run(args, run_key, schema, suffix) as snap:
+            run = new_run(run_key, args.commit_every, fps, andamento_info(args, schema), dims, m,
+                          roteiro=schema["ROTEIRO"], source=SOURCE_NAME, snapshot=snap)
+            done, fail = sync_ops(fbc, pgc, op_ids, schema, args, run)
+        with stage(m, "commit"):
+            checkpoint(pgc, run, force=True)
+        return done, fail, run["stats"], {"stages": m["stages"], "calls": m["calls"]}, None
+    except Exception as e:
+        pg.rollback()
+        if run is None:
+            raise
+        c = run["committed"]
+        return (run["done"][:c["done"]], len(op_ids) - c["done"], c["stats"],
+                {"stages": m["stages"], "calls": m["calls"]}, str(e))
+    finally:
+        pgc.close(); pg.close()
+        fbc.close(); fb.close()
+
+def run_workers(op_ids: List[int], fps: List[Tuple[int, str]], args, run_key: str,
+                metrics: Optional[Dict[str, Any]] = None) -> Tuple[List[int], int, Dict[str, Dict[str, int]]]:
+    """
+    Coordenador: reparte os ORP_IDs em `args.workers` partições (round-robin, para
+    equilibrar OPs grandes/pequenas ao longo da janela), roda cada uma num worker
+    e agrega sucesso/falhas/contagens. Uma partição que cair no meio (ex.: queda
+    de conexão) conta as OPs não commitadas como falha (as commitadas valem; as
+    do dead-letter contam uma vez); se cair antes de copiar, a partição toda.
+    As demais seguem.
+    Cada partição tem checkpoint próprio (`run_key#wI/N`): --resume exige o mesmo N.
+    Tempos/round trips dos workers são somados em `metrics`.
+    """
+    n = max(1, min(args.workers, len(op_ids)))
+    parts = [op_ids[i::n] for i in range(n)]
+    fp_map = dict(fps)
+    Pool = ProcessPoolExecutor if args.worker_pool == "process" else ThreadPoolExecutor
+
+    done: List[int] = []; fail = 0; stats = new_stats()
+    with Pool(max_workers=n) as pool:
+        futures = {
+            pool.submit(sync_partition, part, [(i, fp_map[i]) for i in part if i in fp_map], args,
+                        f"{run_key}#w{k}/{n}"): part
+            for k, part in enumerate(parts)
+        }
+        for fut, part in futures.items():
+            try:
+                p_done, p_fail, p_stats, p_metrics, p_error = fut.result()
+                done.extend(p_done); fail += p_fail
+                merge_stats(stats, p_stats)
+                if metrics is not None:
+                    merge_metrics(metrics, p_metrics)
+                if p_error:
+                    print(f"[ERRO] worker com {len(part)} OP(s) caiu: {p_error} "
+                          f"({len(p_done)} commitada(s), {p_fail} falha(s)).")
+            except Exception as e:
+                print(f"[ERRO] worker com {len(part)} OP(s): {e}")
+                fail += len(part)
+    return done, fail, stats
+
 # -----------------------------------------------------------------------------
 # CLI
 # -----------------------------------------------------------------------------
-def parse_args():
+def parse_args(argv: Optional[List[str]] = None):
     ap = argparse.ArgumentParser(description="Copia OPs por janela do Firebird para Postgres.")
     ap.add_argument("--filial", type=int, required=True, help="Código da filial (EMP_FIL_CODIGO).")
     ap.add_argument("--date-field", choices=["prev_inicio","validade","emissao"], default="validade",
@@ -521,47 +1235,370 @@ def parse_args():
     ap.add_argument("--days-ahead", type=int, default=30, help="Dias para frente (se --from/--to não informados).")
     ap.add_argument("--limit", type=int, default=None, help="Limita a quantidade de OPs.")
     ap.add_argument("--dry-run", action="store_true", help="Mostra as OPs que seriam copiadas, sem gravar.")
-    return ap.parse_args()
-
-def main():
-    args = parse_args()
+    ap.add_argument("--bulk", action="store_true",
+                    help="Extração em lote: poucas consultas por bloco de OPs em vez de ~8 por OP.")
+    ap.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK,
+                    help=f"Tamanho do bloco de ORP_IDs no modo --bulk (padrão {DEFAULT_CHUNK}, máx. 1500).")
+    ap.add_argument("--pipeline", action="store_true",
+                    help="Extração em lote com leitura/transformação/gravação em paralelo (filas limitadas).")
+    ap.add_argument("--queue-size", type=int, default=4,
+                    help="Blocos em espera entre os estágios do --pipeline (limita a memória).")
+    ap.add_argument("--load", choices=["copy","batch"], default="copy",
+                    help="Gravação no modo --bulk/--pipeline: COPY p/ staging + merge set-based (copy) ou upserts por OP (batch).")
+    ap.add_argument("--changed-only", action="store_true",
+                    help="Copia só as OPs cujo fingerprint (cabeçalho/itens/roteiro; +andamento com --with-andamento) mudou desde o último sync.")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Quantidade de workers paralelos (cada um com conexões Firebird/Postgres próprias).")
+    ap.add_argument("--worker-pool", choices=["thread","process"], default="thread",
+                    help="Tipo de pool para --workers (process usa mais de um núcleo de CPU).")
+    ap.add_argument("--slice-ops", type=int, default=0,
+                    help="Janela com mais OPs que isso é dividida em fatias de ~N OPs (COUNT por fatia), "
+                         "cada uma copiada e commitada sozinha; 0 (padrão) = nunca dividir. "
+                         "Não combina com --with-andamento.")
+    ap.add_argument("--prefetch", action="store_true",
+                    help="Com fatias: seleciona a próxima fatia (2ª conexão Firebird) enquanto copia a atual.")
+    ap.add_argument("--commit-every", type=int, default=0,
+                    help="Commit (e checkpoint) a cada N OPs processadas; 0 = um commit no fim.")
+    ap.add_argument("--resume", action="store_true",
+                    help="Continua a partir do último checkpoint desta janela/filial/status.")
+    ap.add_argument("--retry-dead-letter", action="store_true",
+                    help="Reprocessa só as OPs pendentes em etl_dead_letter (ignora a janela).")
+    ap.add_argument("--dims", action="store_true",
+                    help="Usa produto/cor replicados no Postgres (dim_sync): itens lidos sem JOIN em PRODUTOS/CORES.")
+    ap.add_argument("--with-andamento", action="store_true",
+                    help="Gera também andamento_setor da mesma leitura do roteiro (substitui o 05), numa transação SNAPSHOT.")
+    ap.add_argument("--reconcile", action="store_true",
+                    help="Só reconcilia o status das OPs não finais do Postgres com o Firebird (não copia).")
+    ap.add_argument("--async-commit", action="store_true",
+                    help="synchronous_commit=off na sessão do ETL (menos espera de WAL no commit).")
+    ap.add_argument("--snapshot-dir", type=str, default=None,
+                    help="Grava também a extração crua em Parquet nesta pasta (partições dt=YYYY-MM-DD; exige --bulk ou --pipeline).")
+    ap.add_argument("--series", action="store_true",
+                    help="Ao fim, grava a amostra da série de andamento (%% por OP e etapas por setor) no balde da hora.")
+    ap.add_argument("--from-snapshot", type=str, default=None,
+                    help="Recarrega o Postgres dos snapshots desta pasta (raiz, dt=... ou uma execução), sem acessar o Firebird.")
+    add_cli_args(ap)
+    args = ap.parse_args(argv)
+    if args.snapshot_dir and not (args.bulk or args.pipeline):
+        ap.error("--snapshot-dir exige --bulk ou --pipeline (o caminho por OP não extrai em blocos).")
+    if args.snapshot_dir and args.from_snapshot:
+        ap.error("--snapshot-dir e --from-snapshot são exclusivos.")
+    if args.slice_ops > 0 and args.with_andamento:
+        # cada fatia encerra a transação de leitura: não há um SNAPSHOT único da janela
+        ap.error("--with-andamento não combina com --slice-ops (cada fatia faz commit no Firebird e "
+                 "perde o SNAPSHOT da janela); use --slice-ops 0.")
+    return args
 
-    # Janela
+def window_bounds(args) -> Tuple[date, date]:
+    """Janela de datas: --from/--to exatos ou hoje - days_back .. hoje + days_ahead."""
     today = date.today()
     if args.dt_from and args.dt_to:
-        dt_from = datetime.strptime(args.dt_from, "%Y-%m-%d").date()
-        dt_to   = datetime.strptime(args.dt_to,   "%Y-%m-%d").date()
-    else:
-        dt_from = today - timedelta(days=args.days_back)
-        dt_to   = today + timedelta(days=args.days_ahead)
+        return (datetime.strptime(args.dt_from, "%Y-%m-%d").date(),
+                datetime.strptime(args.dt_to,   "%Y-%m-%d").date())
+    return today - timedelta(days=args.days_back), today + timedelta(days=args.days_ahead)
 
+def window_run_key(args, dt_from: date, dt_to: date) -> str:
+    """Chave do checkpoint desta janela/filial/status."""
+    if args.retry_dead_letter:
+        return "dead_letter"
+    status = ",".join(s.strip().upper() for s in args.status.split(","))
+    return f"janela:{args.filial}:{args.date_field}:{dt_from}..{dt_to}:{status}"
+
+def select_ops(fbc, args, dt_from: date, dt_to: date,
+               schema: Optional[Dict[str, Any]] = None) -> Tuple[List[int], List[Tuple[int, str]]]:
+    """
+    ORP_IDs da janela (e fingerprints, se --changed-only). Em --retry-dead-letter vêm do Postgres.
+    `schema`: detecção da origem (roteiro do fingerprint); sem ele, a do .env (FB_SOURCE).
+    """
+    if args.retry_dead_letter:
+        return [], []
     status_list = args.status.split(",")
+    if args.changed_only:
+        schema = schema or resolve_schema(fbc, FB_SOURCE)
+        fps = find_ops_window_fingerprints(fbc, args.filial, status_list, args.date_field, dt_from, dt_to,
+                                           args.limit, schema["ROTEIRO"], args.with_andamento)
+        return [op_id for op_id, _ in fps], fps
+    return find_ops_window(fbc, args.filial, status_list, args.date_field, dt_from, dt_to, args.limit), []
+
+def andamento_info(args, schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Detecção do roteiro para gerar andamento_setor na mesma leitura (--with-andamento)."""
+    if not args.with_andamento:
+        return None
+    if not schema["ROTEIRO"]:
+        print("[AVISO] --with-andamento: tabela de roteiro não detectada; andamento_setor não será gerado.")
+    return schema["ROTEIRO"]
 
-    # Conexões
-    fb = fb_connect(); fbc = fb.cursor()
+def local_dims(pgc, args, schema: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Dict[int, Any]]]]:
+    """
+    --dims: itens lidos sem JOIN em PRODUTOS/CORES (colunas "vazias" no esquema) e
+    nomes preenchidos a partir de produto/cor no Postgres (dim_sync).
+    """
+    if not args.dims:
+        return schema, None
+    return dict(schema, PRODUTOS_DESC="", CORES_NOME=""), load_dim_names(pgc)
+
+def refresh_dims(fbc, pgc, schema: Dict[str, Any], metrics: Optional[Dict[str, Any]] = None):
+    """--dims: sincroniza produto/cor (dim_sync) antes da cópia."""
+    with stage(metrics, "dims"):
+        res = sync_dims(fbc, pgc, schema)
+    print("Dimensões: " + "; ".join(f"{d}: +{r['new']} ~{r['updated']} -{r['deleted']}" for d, r in res.items()))
+
+def run_window(fbc, pgc, args, run_key: str, op_ids: List[int],
+               fps: List[Tuple[int, str]], metrics: Optional[Dict[str, Any]] = None,
+               dims_synced: bool = False) -> Dict[str, Any]:
+    """
+    Copia as OPs selecionadas (conexões já abertas, ensure_schema já feito) e
+    faz o commit. Usado pelo main() e pelo daemon (06_sync_daemon.py).
+    `dims_synced`: produto/cor já sincronizados (fatias: uma vez por execução).
+    Retorna {"selected", "done", "fail", "stats"}; tempos por estágio em `metrics`.
+    """
+    selected = len(op_ids)
+    if args.retry_dead_letter:
+        op_ids = dead_letter_ops(pgc)
+        print(f"Dead-letter pendentes: {len(op_ids)} OP(s).")
+    if args.changed_only:
+        fps = filter_changed(pgc, fps)
+        op_ids = [op_id for op_id, _ in fps]
+        print(f"Alteradas desde o último sync: {len(op_ids)} OP(s).")
+    schema = resolve_schema(fbc, FB_SOURCE)
+    if args.dims and not dims_synced:
+        refresh_dims(fbc, pgc, schema, metrics)
+    schema, dims = local_dims(pgc, args, schema)
+    if args.workers > 1:
+        pgc.connection.commit()  # DDL/leituras do coordenador antes de abrir os workers
+        done, fail, stats = run_workers(op_ids, fps, args, run_key, metrics)
+    else:
+        if args.resume:
+            op_ids = apply_resume(pgc, run_key, op_ids)
+        with snapshot_run(args, run_key, schema) as snap:
+            run = new_run(run_key, args.commit_every, fps, andamento_info(args, schema), dims, metrics,
+                          roteiro=schema["ROTEIRO"], source=SOURCE_NAME, snapshot=snap)
+            done, fail = sync_ops(fbc, pgc, op_ids, schema, args, run)
+        with stage(metrics, "commit"):
+            checkpoint(pgc, run, force=True)
+        stats = run["stats"]
+    return {"selected": selected, "done": len(done), "fail": fail, "stats": stats}
+
+def replay_snapshot(pgc, args, metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    --from-snapshot: recarrega o Postgres das execuções gravadas com --snapshot-dir
+    (só as da --filial pedida), SEM consultar o Firebird. Cada parte passa pela
+    mesma transformação/gravação do --bulk; esquema do roteiro e origem vêm do
+    manifest. Execuções em ordem de gravação: a mais recente prevalece.
+    Retorna o mesmo que run_window, + "runs".
+    """
+    runs = [(d, mf) for d, mf in ((d, load_manifest(d)) for d in find_runs(args.from_snapshot))
+            if mf.get("filial") == args.filial]
+    total = {"selected": 0, "done": 0, "fail": 0, "stats": new_stats(), "runs": len(runs)}
+    if args.load == "copy":
+        ensure_staging(pgc)
+    names = None
+    for d, mf in runs:
+        schema = mf["schema"]
+        if (args.dims or mf.get("dims")) and names is None:
+            names = load_dim_names(pgc)  # snapshot com --dims: itens sem nome de produto/cor
+        run = new_run(f"snapshot:{mf['run_key']}"[:200], args.commit_every, None, andamento_info(args, schema),
+                      names if args.dims or mf.get("dims") else None, metrics,
+                      roteiro=schema["ROTEIRO"], source=mf.get("origem"))
+        print(f"Snapshot {d}: {mf['ops']} OP(s), {len(mf['parts'])} parte(s), extraído em {mf['created_at']}.")
+        for p in mf["parts"]:
+            with stage(metrics, "snapshot"):
+                bundles = read_part(d, p["name"])
+            with stage(metrics, "transform"):
+                chunk = transform_chunk(pgc, run, [b["op_id"] for b in bundles], bundles, args.load)
+            with stage(metrics, "load"):
+                write_chunk(pgc, run, chunk, args.load)
+            with stage(metrics, "commit"):
+                checkpoint(pgc, run)
+        with stage(metrics, "commit"):
+            checkpoint(pgc, run, force=True)
+        total["selected"] += mf["ops"]; total["done"] += len(run["done"]); total["fail"] += run["fail"]
+        merge_stats(total["stats"], run["stats"])
+    return total
+
+def replay_main(args, m: Dict[str, Any]):
+    """--from-snapshot no main(): nenhuma conexão com o Firebird."""
+    require_pyarrow()
+    runs = [d for d in find_runs(args.from_snapshot) if load_manifest(d).get("filial") == args.filial]
+    if not runs:
+        raise SystemExit(f"Nenhum snapshot (pasta com manifest) da filial {args.filial} em {args.from_snapshot}.")
+    if args.dry_run:
+        for d in runs:
+            mf = load_manifest(d)
+            print(f"{d}: {mf['ops']} OP(s), {mf['rows']} ({mf['status']}, {mf['created_at']})")
+        print("DRY-RUN: nada será gravado no Postgres.")
+        return
+    pg = pg_connect(); pg.autocommit = False; pgc = count_cursor(pg.cursor(), m, "pg")
+    try:
+        if args.async_commit:
+            set_async_commit(pgc)
+        with stage(m, "schema"):
+            ensure_schema(pgc)
+        with recorded_run(pgc, "snapshot", args.filial, params=args_params(args)) as rec:
+            res = replay_snapshot(pgc, args, m)
+            rec.update(selected=res["selected"], done=res["done"], fail=res["fail"], stats=res["stats"])
+        print(f"Concluído ({res['runs']} snapshot(s)). Sucesso: {res['done']}; Falhas: {res['fail']}.")
+        print(f"Linhas (+inseridas ~atualizadas =inalteradas): {format_stats(res['stats'])}")
+        emit(summary(m, res["stats"], {"run_key": f"snapshot:{args.from_snapshot}", "selected": res["selected"],
+                                       "done": res["done"], "fail": res["fail"]}),
+             args.metrics_json, args.prom_textfile)
+    except Exception:
+        pg.rollback()
+        raise
+    finally:
+        pgc.close(); pg.close()
+
+def run_slices(fb, fbc, pgc, args, slices: List[Tuple[date, date, int]],
+               metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Copia a janela fatia a fatia (plan_slices): cada fatia é selecionada,
+    copiada e commitada como uma janela própria (run_window; checkpoint próprio,
+    então --resume pula as fatias já feitas). Entre fatias a transação de leitura
+    do Firebird é encerrada (também a da conexão do --prefetch, após cada
+    seleção). Com --dims, produto/cor são sincronizados uma vez, antes. Memória, duração de transação e custo de uma falha
+    ficam limitados à fatia. Com --prefetch, a seleção da fatia seguinte roda numa
+    segunda conexão Firebird enquanto a atual é copiada.
+    Retorna o mesmo que run_window, somado, + "slices".
+    """
+    total = {"selected": 0, "done": 0, "fail": 0, "stats": new_stats(), "slices": len(slices)}
+    seen: set = set()
+
+    def select(fbc_sel, k: int) -> Tuple[List[int], List[Tuple[int, str]]]:
+        a, b, _ = slices[k]
+        with stage(metrics, "select"):
+            return select_ops(fbc_sel, args, a, b)
+
+    def prefetch(k: int) -> Tuple[List[int], List[Tuple[int, str]]]:
+        try:
+            return select(fbc2, k)
+        finally:
+            fb2.commit()  # não segura a transação de leitura até a próxima fatia
+
+    if args.dims:
+        refresh_dims(fbc, pgc, resolve_schema(fbc, FB_SOURCE), metrics)
+
+    pool = fb2 = fbc2 = None
+    if args.prefetch and len(slices) > 1:
+        fb2 = fb_connect(); fbc2 = count_cursor(fb2.cursor(), metrics, "fb")
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="etl-prefetch")
     try:
-        # Seleciona OPs na janela
-        op_ids = find_ops_window(fbc, args.filial, status_list, args.date_field, dt_from, dt_to, args.limit)
-        if not op_ids:
-            print(f"Nenhuma OP encontrada para filial={args.filial}, campo={args.date_field}, janela={dt_from}..{dt_to}, status={status_list}")
+        nxt = pool.submit(prefetch, 0) if pool else None
+        for k, (a, b, n) in enumerate(slices):
+            op_ids, fps = nxt.result() if pool else select(fbc, k)
+            if pool and k + 1 < len(slices):
+                nxt = pool.submit(prefetch, k + 1)
+            # borda compartilhada com a fatia anterior: a OP já copiada não se repete
+            op_ids = [i for i in op_ids if i not in seen]
+            fps = [(i, fp) for i, fp in fps if i not in seen]
+            seen.update(op_ids)
+            print(f"Fatia {k + 1}/{len(slices)} {a}..{b}: {len(op_ids)} OP(s).")
+            res = run_window(fbc, pgc, args, window_run_key(args, a, b), op_ids, fps, metrics,
+                             dims_synced=True)
+            fb.commit()
+            total["selected"] += res["selected"]; total["done"] += res["done"]; total["fail"] += res["fail"]
+            merge_stats(total["stats"], res["stats"])
+    finally:
+        if pool:
+            pool.shutdown(wait=True)
+            fbc2.close(); fb2.close()
+    return total
+
+def sample_series(pgc, args):
+    """--series: amostra da série de andamento da filial (progress_series), registrada em etl_run."""
+    with recorded_run(pgc, "series", args.filial, params={"bucket": BUCKET}) as rec:
+        res = sample_progress(pgc, args.filial)
+        pgc.connection.commit()
+        rec.update(selected=res["ops"], done=res["ops"], stats=res["stats"])
+    print(f"Série ({BUCKET} {res['bucket']}): {res['ops']} OP(s) com % alterado, "
+          f"{res['setores']} linha(s) por setor.")
+
+def main():
+    args = parse_args()
+    with profiled(args.profile):
+        _main(args)
+
+def _main(args):
+    dt_from, dt_to = window_bounds(args)
+    run_key = window_run_key(args, dt_from, dt_to)
+    m = new_metrics("copiar_janela")
+    if args.from_snapshot:
+        return replay_main(args, m)
+
+    # Conexões (--with-andamento: uma transação SNAPSHOT para seleção + leitura)
+    fb = fb_connect(snapshot=args.with_andamento); fbc = count_cursor(fb.cursor(), m, "fb")
+    try:
+        if args.reconcile:
+            pg = pg_connect(); pg.autocommit = False; pgc = pg.cursor()
+            try:
+                ensure_schema(pgc)
+                if args.dry_run:
+                    res = reconcile_ops(fbc, pgc, args.filial, origem=SOURCE_NAME)
+                    pg.rollback()
+                else:
+                    with recorded_run(pgc, "reconcile", args.filial) as rec:
+                        res = reconcile_ops(fbc, pgc, args.filial, origem=SOURCE_NAME)
+                        pg.commit()
+                        rec.update(selected=res["checked"], done=res["updated"], changed=res["updated"])
+                print(f"Reconciliação: {res['checked']} OP(s) não finais; {res['updated']} com status "
+                      f"atualizado ({res['removed']} removida(s) no Firebird).")
+            except Exception:
+                pg.rollback()
+                raise
+            finally:
+                pgc.close(); pg.close()
             return
 
-        print(f"Encontradas {len(op_ids)} OP(s): {op_ids[:10]}{' ...' if len(op_ids)>10 else ''}")
+        # Janela grande: fatias de ~--slice-ops OPs (COUNT por faixa de datas)
+        slices = None
+        if args.slice_ops > 0 and not args.retry_dead_letter and not args.limit:
+            with stage(m, "select"):
+                slices = plan_slices(fbc, args, dt_from, dt_to, args.slice_ops)
+            if len(slices) > 1:
+                print(f"Janela dividida em {len(slices)} fatias ({sum(n for *_, n in slices)} OPs): "
+                      + ", ".join(f"{a}..{b} ({n})" for a, b, n in slices))
+            else:
+                slices = None
+
+        # Seleciona OPs na janela (com fingerprint, se --changed-only)
+        op_ids, fps = [], []
+        if not slices:
+            with stage(m, "select"):
+                op_ids, fps = select_ops(fbc, args, dt_from, dt_to)
+        empty = not slices and not op_ids and not args.retry_dead_letter
+        if empty:
+            print(f"Nenhuma OP encontrada para filial={args.filial}, campo={args.date_field}, janela={dt_from}..{dt_to}, status={args.status.split(',')}")
+        elif op_ids:
+            print(f"Encontradas {len(op_ids)} OP(s): {op_ids[:10]}{' ...' if len(op_ids)>10 else ''}")
         if args.dry_run:
             print("DRY-RUN: nada será gravado no Postgres.")
             return
 
-        pg = pg_connect(); pg.autocommit = False; pgc = pg.cursor()
+        pg = pg_connect(); pg.autocommit = False; pgc = count_cursor(pg.cursor(), m, "pg")
         try:
-            ensure_schema(pgc)
-            ok = 0; fail = 0
-            for opid in op_ids:
-                if copy_one_op(fbc, pgc, opid):
-                    ok += 1
+            if args.async_commit:
+                set_async_commit(pgc)
+            with stage(m, "schema"):
+                ensure_schema(pgc)
+            kind = "dead_letter" if args.retry_dead_letter else "janela"
+            with recorded_run(pgc, kind, args.filial, dt_from, dt_to, args_params(args)) as rec:
+                # janela vazia também é registrada: os dados estão em dia até aqui
+                if empty:
+                    rec.update(selected=0, done=0)
+                    return
+                if slices:
+                    res = run_slices(fb, fbc, pgc, args, slices, m)
                 else:
-                    fail += 1
-            pg.commit()
-            print(f"Concluído. Sucesso: {ok}; Falhas: {fail}.")
+                    res = run_window(fbc, pgc, args, run_key, op_ids, fps, m)
+                rec.update(selected=res["selected"], done=res["done"], fail=res["fail"], stats=res["stats"])
+            print(f"Concluído. Sucesso: {res['done']}; Falhas: {res['fail']}.")
+            print(f"Linhas (+inseridas ~atualizadas =inalteradas): {format_stats(res['stats'])}")
+            if args.series:
+                sample_series(pgc, args)
+            emit(summary(m, res["stats"], {"run_key": run_key, "selected": res["selected"],
+                                           "done": res["done"], "fail": res["fail"]}),
+                 args.metrics_json, args.prom_textfile)
+            if res["fail"]:
+                print("OPs com falha registradas em etl_dead_letter (reprocesse com --retry-dead-letter).")
         except Exception:
             pg.rollback()
             raise
@@ -2,17 +2,28 @@
 05_sync_andamento_setor.py — Sincroniza andamento por setor a partir do Firebird para Postgres.
 Classifica cada etapa em: PENDENTE | EM_EXECUCAO | CONCLUIDO
 Usa qualquer tabela ROTEIRO detectada (PCP_APTO_ROTEIRO, PCP_ORP_ROTEIRO, PCP_ROTEIRO, ROTEIRO).
+Obs.: `04_copiar_janela.py --with-andamento` faz OP + andamento numa passada só.
+Só as OPs gravadas a partir DESTE Firebird (op.origem = ETL_SOURCE_NAME; sem ele,
+origem vazia); as de outras origens: 08_sync_multi.py --andamento.
 
 Exemplos:
   python .\etl\05_sync_andamento_setor.py --days-back 7 --days-ahead 30
   python .\etl\05_sync_andamento_setor.py --from 2025-09-01 --to 2025-10-31
 """
-import os, argparse, re
+import os, argparse
 from datetime import date, datetime, timedelta
 from typing import Optional, Dict, Any, List
-import firebirdsql, psycopg2, psycopg2.extras
+import psycopg2, psycopg2.extras
 from dotenv import load_dotenv
 
+from fb_schema import resolve_schema
+import fb_driver
+from fb_extract import FB_MAX_IN, DEFAULT_FETCH, iter_roteiro
+from pg_load import new_stats, format_stats, upsert_andamento
+from maps import andamento_rows
+from run_ledger import ensure_run_schema, recorded_run, args_params
+from etl_metrics import new_metrics, stage, timed, count_cursor, summary, emit, profiled, add_cli_args
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
@@ -23,6 +34,9 @@ FB_DB   = os.getenv("FIREBIRD_DB_PATH")
 FB_USER = os.getenv("FIREBIRD_USER", "SYSDBA")
 FB_PASS = os.getenv("FIREBIRD_PASSWORD", "masterkey")
 FB_CHAR = os.getenv("FIREBIRD_CHARSET", "WIN1252")
+FB_FAKE_DB = os.getenv("FIREBIRD_FAKE_DB")  # banco sintético (fb_fake.py), só para benchmark
+FB_SOURCE = f"fake:{FB_FAKE_DB}" if FB_FAKE_DB else f"{FB_HOST}:{FB_PORT}/{FB_DB}"  # chave do cache de esquema
+SOURCE_NAME = os.getenv("ETL_SOURCE_NAME") or None  # op.origem das OPs deste Firebird (como no 04)
 
 # Postgres
 PG_HOST = os.getenv("PG_HOST", "localhost")
@@ -32,81 +46,12 @@ PG_USER = os.getenv("PG_USER", "postgres")
 PG_PASS = os.getenv("PG_PASSWORD", "")
 
 def fb_connect():
-    return firebirdsql.connect(host=FB_HOST, port=FB_PORT, database=FB_DB, user=FB_USER, password=FB_PASS, charset=FB_CHAR)
+    return fb_driver.connect(host=FB_HOST, port=FB_PORT, database=FB_DB, user=FB_USER, password=FB_PASS,
+                             charset=FB_CHAR, fake_db=FB_FAKE_DB)
 
 def pg_connect():
     return psycopg2.connect(host=PG_HOST, port=PG_PORT, dbname=PG_DB, user=PG_USER, password=PG_PASS)
 
-def list_user_tables(cur):
-    cur.execute("""
-      SELECT TRIM(r.rdb$relation_name)
-      FROM rdb$relations r
-      WHERE r.rdb$system_flag = 0 AND r.rdb$view_blr IS NULL
-      ORDER BY 1
-    """); return [r[0] for r in cur.fetchall()]
-
-def list_columns(cur, table: str):
-    cur.execute("""
-      SELECT TRIM(rf.rdb$field_name)
-      FROM rdb$relation_fields rf
-      WHERE rf.rdb$relation_name = ?
-      ORDER BY rf.rdb$field_position
-    """,(table,)); return [r[0] for r in cur.fetchall()]
-
-def pick(cols: List[str], preferred: List[str], patterns: List[re.Pattern]) -> Optional[str]:
-    U=[c.upper() for c in cols]
-    for p in preferred:
-        if p.upper() in U: return p.upper()
-    for rx in patterns:
-        for c in U:
-            if rx.search(c): return c
-    return None
-
-def detect_roteiro(cur) -> Optional[Dict[str,str]]:
-    tabs = list_user_tables(cur)
-    candidates = ["PCP_APTO_ROTEIRO","PCP_ORP_ROTEIRO","PCP_ROTEIRO","ROTEIRO"]
-    for t in candidates:
-        if t not in tabs: continue
-        cols = list_columns(cur, t)
-        opnum = pick(cols,
-            ["OPR_ORP_NUMERO","APR_ORP_NUMERO","OPR_ORP_SERIE","APR_ORP_SERIE","ORP_NUMERO","ORP_SERIE","OPR_ORP_ID","APR_ORP_ID"],
-            [re.compile(r"(^|_)ORP_?(NUM|NUMERO|SERIE|ID)$", re.I)]
-        )
-        setor = pick(cols,
-            ["OPR_ATV_ID","APR_ATV_ID","OPR_SET_CODIGO","APR_SET_CODIGO","ATV_ID","ATV_CODIGO","SET_CODIGO","SETOR_CODIGO"],
-            [re.compile(r"ATV.*(ID|COD)", re.I), re.compile(r"SET.*COD", re.I)]
-        )
-        seq   = pick(cols,
-            ["OPR_ATV_SEQUENCIA","APR_ATV_SEQUENCIA","ATV_SEQUENCIA","SEQUENCIA","ORDEM","OPR_SEQ"],
-            [re.compile(r"SEQ", re.I), re.compile(r"ORDEM", re.I)]
-        )
-        start = pick(cols,
-            ["OPR_ATV_DT_INICIO","APR_ATV_DT_INICIO","DT_INICIO","DATA_INICIO","OPR_DT_INICIO","APR_DT_INICIO","INICIO","DTINI"],
-            [re.compile(r"INI(CIO)?", re.I)]
-        )
-        end   = pick(cols,
-            ["OPR_ATV_DT_FIM","APR_ATV_DT_FIM","DT_FIM","DATA_FIM","OPR_DT_FIM","APR_DT_FIM","FINAL","CONCLUSAO","DTFIM"],
-            [re.compile(r"(FIM|FINAL|CONCL)", re.I)]
-        )
-        stat  = pick(cols,
-            ["OPR_ATV_STATUS","APR_ATV_STATUS","OPR_STATUS","APR_STATUS","STATUS","SITUACAO","IND_REALIZACAO","OPR_IND_REALIZACAO"],
-            [re.compile(r"STATUS|SITU|IND", re.I)]
-        )
-        if opnum and setor and seq:
-            return {"TABLE": t, "OP_NUM": opnum, "SETOR": setor, "SEQ": seq, "DTINI": start, "DTFIM": end, "STATUS": stat}
-    return None
-
-def derive_stage_status(dtini, dtfim, statval) -> str:
-    if dtfim: return "CONCLUIDO"
-    if dtini: return "EM_EXECUCAO"
-    if statval:
-        s = str(statval).strip().upper()
-        if s in ("FF","FINALIZADO","FINALIZADA","CONCLUIDO","CONCLUIDA","FECHADO","FECHADA","F","C","2"):
-            return "CONCLUIDO"
-        if s in ("IN","INICIADO","INICIADA","EXECUCAO","EXECUTANDO","ANDAMENTO","A","1"):
-            return "EM_EXECUCAO"
-    return "PENDENTE"
-
 def ensure_schema_pg(cur):
     cur.execute("""
     CREATE TABLE IF NOT EXISTS andamento_setor (
@@ -120,6 +65,74 @@ def ensure_schema_pg(cur):
     );
     CREATE INDEX IF NOT EXISTS idx_andamento_op ON andamento_setor(op_numero);
     """)
+    ensure_run_schema(cur)
+
+def sync_andamento(fbc, pgc, dt_from: date, dt_to: date, chunk_size: int = FB_MAX_IN,
+                   flush_every: int = 5000, fetch_size: int = DEFAULT_FETCH,
+                   metrics: Optional[Dict[str, Any]] = None, origem: Optional[str] = None,
+                   filial: Optional[int] = None, source_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Sincroniza andamento_setor das OPs do Postgres com validade na janela e faz o
+    commit (conexões já abertas, ensure_schema_pg já feito). Usado pelo main(),
+    pelo daemon (06_sync_daemon.py) e pelo 08_sync_multi --andamento.
+    Retorna {"ops", "rows", "stats"}.
+
+    Só as OPs com op.origem = `origem` (None = origem vazia) e, se informada, da
+    `filial`: o roteiro vem de `fbc`, e OPs de outro banco teriam as etapas de
+    outra OP (ou nenhuma). `source_key`: chave do esquema (padrão: FB_SOURCE).
+
+    O roteiro é lido em blocos de OPs (IN com até `chunk_size` chaves) e em
+    streaming (fetchmany de `fetch_size`), com upsert a cada `flush_every`
+    etapas: a memória fica limitada ao lote, qualquer que seja a janela. A chave de
+    ligação respeita a detecção: ORP_ID (coluna com "ID") ou série (op_numero).
+    Tempos por estágio em `metrics` (etl_metrics), se informado.
+    """
+    m = metrics
+    with stage(m, "select"):
+        sql = "SELECT op_id, op_numero FROM op WHERE dt_validade BETWEEN %s AND %s AND origem IS NOT DISTINCT FROM %s"
+        params: List[Any] = [dt_from, dt_to, origem]
+        if filial is not None:
+            sql += " AND filial = %s"; params.append(filial)
+        pgc.execute(sql, params)
+        ops = [(r[0], r[1]) for r in pgc.fetchall() if r[1] is not None]
+    stats = new_stats()
+    if not ops:
+        print(f"Nenhuma OP no Postgres em {dt_from}..{dt_to}. Rode 04_copiar_janela primeiro.")
+        pgc.connection.rollback()
+        return {"ops": 0, "rows": 0, "stats": stats}
+
+    info = resolve_schema(fbc, source_key or FB_SOURCE)["ROTEIRO"]
+    if not info:
+        raise SystemExit("Não foi possível detectar a tabela de roteiro no Firebird.")
+
+    # valor da coluna de ligação no Firebird -> op_numero no Postgres
+    if "ID" in info["OP_NUM"].upper():
+        key_to_num = {op_id: opn for op_id, opn in ops}
+    else:
+        key_to_num = {opn: opn for _, opn in ops}
+
+    total = 0
+    buf: List[tuple] = []
+    for batch in timed(iter_roteiro(fbc, info, key_to_num, chunk_size, fetch_size), m, "extract"):
+        with stage(m, "transform"):
+            for opn, rec in batch:
+                buf.extend(andamento_rows(opn, [rec], info))
+        if len(buf) >= flush_every:
+            with stage(m, "load"):
+                upsert_andamento(pgc, buf, stats)
+            total += len(buf); buf = []
+    if buf:
+        with stage(m, "load"):
+            upsert_andamento(pgc, buf, stats)
+        total += len(buf)
+
+    if total:
+        with stage(m, "commit"):
+            pgc.connection.commit()
+        print(f"Sincronizado andamento_setor: {total} linhas de {len(ops)} OP(s) ({format_stats(stats)}).")
+    else:
+        print("Nada para sincronizar.")
+    return {"ops": len(ops), "rows": total, "stats": stats}
 
 def main():
     ap = argparse.ArgumentParser()
@@ -127,7 +140,18 @@ def main():
     ap.add_argument("--to", dest="dt_to", type=str)
     ap.add_argument("--days-back", type=int, default=7)
     ap.add_argument("--days-ahead", type=int, default=30)
+    ap.add_argument("--chunk-size", type=int, default=FB_MAX_IN,
+                    help=f"OPs por consulta ao roteiro (lista IN; máx. {FB_MAX_IN}).")
+    ap.add_argument("--fetch-size", type=int, default=DEFAULT_FETCH,
+                    help="Linhas por fetchmany na leitura do roteiro.")
+    ap.add_argument("--flush-every", type=int, default=5000,
+                    help="Etapas por lote gravado no Postgres (limita a memória).")
+    add_cli_args(ap)
     args = ap.parse_args()
+    with profiled(args.profile):
+        _main(args)
+
+def _main(args):
 
     today = date.today()
     if args.dt_from and args.dt_to:
@@ -137,65 +161,19 @@ def main():
         dt_from = today - timedelta(days=args.days_back)
         dt_to   = today + timedelta(days=args.days_ahead)
 
-    fb = fb_connect(); fbc = fb.cursor()
-    pg = pg_connect(); pg.autocommit=False; pgc = pg.cursor()
+    m = new_metrics("sync_andamento_setor")
+    fb = fb_connect(); fbc = count_cursor(fb.cursor(), m, "fb")
+    pg = pg_connect(); pg.autocommit=False; pgc = count_cursor(pg.cursor(), m, "pg")
 
     try:
-        ensure_schema_pg(pgc)
-        pgc.execute("""SELECT DISTINCT op_numero FROM op WHERE dt_validade BETWEEN %s AND %s""", (dt_from, dt_to))
-        ops = [r[0] for r in pgc.fetchall()]
-        if not ops:
-            print(f"Nenhuma OP no Postgres em {dt_from}..{dt_to}. Rode 04_copiar_janela primeiro.")
-            pg.rollback(); return
-
-        info = detect_roteiro(fbc)
-        if not info:
-            raise SystemExit("Não foi possível detectar a tabela de roteiro no Firebird.")
-
-        sel = [info["OP_NUM"], info["SETOR"], info["SEQ"]]
-        if info["DTINI"]: sel.append(info["DTINI"])
-        if info["DTFIM"]: sel.append(info["DTFIM"])
-        if info["STATUS"]: sel.append(info["STATUS"])
-
-        sql = f"SELECT {', '.join(sel)} FROM {info['TABLE']} WHERE {info['OP_NUM']} = ? ORDER BY {info['SEQ']}"
-
-        rows_to_upsert = []
-        for opn in ops:
-            fbc.execute(sql, (opn,))
-            cols = [d[0].upper() for d in fbc.description]
-            for r in fbc.fetchall():
-                rec = dict(zip(cols, r))
-                setor = rec.get(info["SETOR"].upper())
-                seq   = rec.get(info["SEQ"].upper())
-                dtini = rec.get((info["DTINI"] or "").upper()) if info["DTINI"] else None
-                dtfim = rec.get((info["DTFIM"] or "").upper()) if info["DTFIM"] else None
-                statv = rec.get((info["STATUS"] or "").upper()) if info["STATUS"] else None
-                status_setor = derive_stage_status(dtini, dtfim, statv)
-                if setor is None or seq is None: 
-                    continue
-                rows_to_upsert.append({
-                    "op_numero": int(opn),
-                    "setor_codigo": int(setor),
-                    "sequencia": int(seq),
-                    "status_setor": status_setor,
-                    "dt_inicio": dtini,
-                    "dt_fim": dtfim
-                })
-
-        if rows_to_upsert:
-            psycopg2.extras.execute_batch(pgc, """
-            INSERT INTO andamento_setor (op_numero, setor_codigo, sequencia, status_setor, dt_inicio, dt_fim)
-            VALUES (%(op_numero)s, %(setor_codigo)s, %(sequencia)s, %(status_setor)s, %(dt_inicio)s, %(dt_fim)s)
-            ON CONFLICT (op_numero, setor_codigo, sequencia) DO UPDATE SET
-              status_setor = EXCLUDED.status_setor,
-              dt_inicio = EXCLUDED.dt_inicio,
-              dt_fim = EXCLUDED.dt_fim
-            """, rows_to_upsert, page_size=1000)
-            pg.commit()
-            print(f"Sincronizado andamento_setor: {len(rows_to_upsert)} linhas.")
-        else:
-            print("Nada para sincronizar.")
-
+        with stage(m, "schema"):
+            ensure_schema_pg(pgc)
+        with recorded_run(pgc, "andamento", None, dt_from, dt_to, args_params(args)) as rec:
+            res = sync_andamento(fbc, pgc, dt_from, dt_to, args.chunk_size, args.flush_every,
+                                 args.fetch_size, metrics=m, origem=SOURCE_NAME)
+            rec.update(selected=res["ops"], done=res["ops"], stats=res["stats"])
+        emit(summary(m, res["stats"], {"ops": res["ops"], "rows_total": res["rows"]}),
+             args.metrics_json, args.prom_textfile)
     finally:
         fbc.close(); fb.close()
         pgc.close(); pg.close()
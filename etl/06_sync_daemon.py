@@ -0,0 +1,344 @@
+# etl/06_sync_daemon.py
+# -----------------------------------------------------------------------------
+# Daemon de sincronização: substitui o agendador chamando 04_copiar_janela.py e
+# 05_sync_andamento_setor.py a cada execução.
+# - Processo único e de longa duração: imports, .env e detecção de esquema
+#   (fb_schema, cache em memória) são pagos uma vez só;
+# - Cada job mantém o SEU par de conexões Firebird/Postgres abertas entre ciclos
+#   (reabertas só depois de um erro);
+# - Job extra de reconciliação (--reconcile-every): status das OPs não finais;
+# - Job de dimensões (--dims-every): PRODUTOS/CORES -> produto/cor (dim_sync);
+# - Job da série de andamento (--series-every): amostra % por OP e etapas por
+#   setor de todas as filiais (progress_series; só Postgres, sem Firebird);
+# - Intervalos configuráveis com jitter (±fração), para os jobs não baterem no
+#   servidor da Microsys sempre no mesmo segundo;
+# - Se o ciclo anterior de um job ainda está rodando, o ciclo é PULADO (contado);
+# - Tempos/resultados do último ciclo de cada job vão para um JSON
+#   (etl/.sync_daemon_status.json) e para o console.
+#
+# A transação de leitura do Firebird é encerrada ao fim de cada ciclo: uma
+# transação aberta por horas seguraria a coleta de lixo (OIT/OAT) do banco e o
+# ciclo seguinte não enxergaria os dados novos.
+# -----------------------------------------------------------------------------
+r"""
+Como usar (PowerShell):
+
+# Janela a cada 60 s e andamento a cada 60 s (padrões), com jitter de 10%
+(.venv) PS> python .\etl\06_sync_daemon.py --filial 1
+
+# Intervalos próprios e opções extras para a cópia por janela
+(.venv) PS> python .\etl\06_sync_daemon.py --filial 1 --janela-every 120 --andamento-every 60 --janela-opts "--bulk --changed-only --commit-every 200"
+
+# Ver os tempos do último ciclo
+(.venv) PS> Get-Content .\etl\.sync_daemon_status.json
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import random
+import signal
+import argparse
+import importlib
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# Scripts numerados: importados pelo nome do módulo (carregam o .env uma vez)
+janela = importlib.import_module("04_copiar_janela")
+andamento = importlib.import_module("05_sync_andamento_setor")
+
+from pg_load import format_stats, set_async_commit
+from fb_schema import resolve_schema
+from dim_sync import sync_dims
+from etl_metrics import new_metrics, stage
+from run_ledger import recorded_run, args_params
+from progress_series import sample_progress, BUCKET
+
+DEFAULT_STATUS_PATH = os.path.join(BASE_DIR, ".sync_daemon_status.json")
+
+# -----------------------------------------------------------------------------
+# Conexões quentes por job
+# -----------------------------------------------------------------------------
+def open_conns(job: Dict[str, Any]):
+    """Abre (se preciso) o par Firebird/Postgres do job e prepara o schema no Postgres."""
+    if job["conns"] is not None:
+        return job["conns"]
+    fb = janela.fb_connect(snapshot=job["snapshot"]) if job["fb"] else None
+    pg = janela.pg_connect(); pg.autocommit = False
+    pgc = pg.cursor()
+    job["setup"](pgc)
+    pg.commit()
+    job["conns"] = (fb, fb.cursor() if fb else None, pg, pgc)
+    return job["conns"]
+
+def close_conns(job: Dict[str, Any]):
+    conns, job["conns"] = job["conns"], None
+    if not conns:
+        return
+    fb, fbc, pg, pgc = conns
+    for c in (fbc, fb, pgc, pg):
+        if c is None:
+            continue
+        try:
+            c.close()
+        except Exception:
+            pass
+
+def end_fb_transaction(fb):
+    """Encerra a transação de leitura do Firebird (libera OIT/OAT, próximo ciclo vê dados novos)."""
+    try:
+        fb.commit()
+    except Exception:
+        pass
+
+# -----------------------------------------------------------------------------
+# Jobs
+# -----------------------------------------------------------------------------
+def janela_setup(args_j):
+    def setup(pgc):
+        if args_j.async_commit:
+            set_async_commit(pgc)
+        janela.ensure_schema(pgc)
+    return setup
+
+def janela_cycle(args_j) -> Callable:
+    """Um ciclo da cópia por janela (mesmo fluxo do 04_copiar_janela.main)."""
+    def cycle(fbc, pgc) -> Dict[str, Any]:
+        dt_from, dt_to = janela.window_bounds(args_j)
+        run_key = janela.window_run_key(args_j, dt_from, dt_to)
+        m = new_metrics("janela")
+        with stage(m, "select"):
+            op_ids, fps = janela.select_ops(fbc, args_j, dt_from, dt_to)
+        kind = "dead_letter" if args_j.retry_dead_letter else "janela"
+        with recorded_run(pgc, kind, args_j.filial, dt_from, dt_to, args_params(args_j)) as rec:
+            if not op_ids and not args_j.retry_dead_letter:
+                rec.update(selected=0, done=0)
+                return {"selected": 0, "done": 0, "fail": 0, "stats": {}}
+            res = janela.run_window(fbc, pgc, args_j, run_key, op_ids, fps, m)
+            rec.update(selected=res["selected"], done=res["done"], fail=res["fail"], stats=res["stats"])
+        res["stats"] = format_stats(res["stats"])
+        res["stages_s"] = {k: round(v, 3) for k, v in m["stages"].items()}
+        return res
+    return cycle
+
+def andamento_cycle(days_back: int, days_ahead: int) -> Callable:
+    """Um ciclo do sync de andamento por setor (mesma janela de validade do 05)."""
+    def cycle(fbc, pgc) -> Dict[str, Any]:
+        ns = argparse.Namespace(dt_from=None, dt_to=None, days_back=days_back, days_ahead=days_ahead)
+        dt_from, dt_to = janela.window_bounds(ns)
+        with recorded_run(pgc, "andamento", None, dt_from, dt_to) as rec:
+            res = andamento.sync_andamento(fbc, pgc, dt_from, dt_to, origem=andamento.SOURCE_NAME)
+            rec.update(selected=res["ops"], done=res["ops"], stats=res["stats"])
+        res["stats"] = format_stats(res["stats"])
+        return res
+    return cycle
+
+def reconcile_cycle(filial: int) -> Callable:
+    """Um ciclo da reconciliação de status (OPs que fecharam/cancelaram no Firebird)."""
+    def cycle(fbc, pgc) -> Dict[str, Any]:
+        with recorded_run(pgc, "reconcile", filial) as rec:
+            res = janela.reconcile_ops(fbc, pgc, filial, origem=janela.SOURCE_NAME)
+            pgc.connection.commit()
+            rec.update(selected=res["checked"], done=res["updated"], changed=res["updated"])
+        return res
+    return cycle
+
+def dims_cycle(check_every: float) -> Callable:
+    """Um ciclo da réplica de PRODUTOS/CORES (high-water mark; checksum a cada check_every)."""
+    def cycle(fbc, pgc) -> Dict[str, Any]:
+        with recorded_run(pgc, "dims") as rec:
+            res = sync_dims(fbc, pgc, resolve_schema(fbc, janela.FB_SOURCE), check_every)
+            pgc.connection.commit()
+            rec["changed"] = sum(r["new"] + r["updated"] + r["deleted"] for r in res.values())
+        return res
+    return cycle
+
+def series_cycle() -> Callable:
+    """Uma amostra da série de andamento (% por OP e etapas por setor) de todas as filiais."""
+    def cycle(fbc, pgc) -> Dict[str, Any]:
+        with recorded_run(pgc, "series", None, params={"bucket": BUCKET}) as rec:
+            res = sample_progress(pgc, None)
+            pgc.connection.commit()
+            rec.update(selected=res["ops"], done=res["ops"], stats=res["stats"])
+        res["stats"] = format_stats(res["stats"])
+        return res
+    return cycle
+
+def new_job(name: str, every: float, setup: Callable, cycle: Callable,
+            snapshot: bool = False, fb: bool = True) -> Dict[str, Any]:
+    """fb=False: job só de Postgres (não abre conexão com o Firebird; cycle recebe fbc=None)."""
+    return {"name": name, "every": every, "setup": setup, "cycle": cycle, "snapshot": snapshot, "fb": fb,
+            "conns": None, "thread": None, "next_at": 0.0,
+            "cycles": 0, "skipped": 0, "errors": 0, "last": None}
+
+def run_cycle(job: Dict[str, Any], on_done: Callable):
+    """Roda 1 ciclo do job (na thread do job) e registra tempos/resultado em job["last"]."""
+    t0 = time.perf_counter()
+    started = datetime.now().isoformat(timespec="seconds")
+    last: Dict[str, Any] = {"started_at": started}
+    try:
+        fb, fbc, pg, pgc = open_conns(job)
+        t1 = time.perf_counter()
+        try:
+            last["result"] = job["cycle"](fbc, pgc)
+            last["ok"] = True
+        finally:
+            if fb is not None:
+                end_fb_transaction(fb)
+        last["connect_s"] = round(t1 - t0, 3)
+    except (Exception, SystemExit) as e:
+        last["ok"] = False
+        last["error"] = f"{type(e).__name__}: {e}"
+        job["errors"] += 1
+        # conexão pode ter caído: reabre no próximo ciclo
+        if job["conns"]:
+            try:
+                job["conns"][2].rollback()
+            except Exception:
+                pass
+        close_conns(job)
+    last["duration_s"] = round(time.perf_counter() - t0, 3)
+    job["cycles"] += 1
+    job["last"] = last
+    status = "ok" if last["ok"] else f"ERRO {last['error']}"
+    print(f"[{started}] {job['name']}: {status} em {last['duration_s']}s {last.get('result', '')}")
+    on_done()
+
+# -----------------------------------------------------------------------------
+# Agendador
+# -----------------------------------------------------------------------------
+def next_delay(every: float, jitter: float) -> float:
+    return max(1.0, every * (1.0 + random.uniform(-jitter, jitter)))
+
+def write_status(path: str, jobs: List[Dict[str, Any]], lock: threading.Lock):
+    with lock:
+        data = {
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "jobs": {j["name"]: {"every_s": j["every"], "running": bool(j["thread"] and j["thread"].is_alive()),
+                                 "cycles": j["cycles"], "skipped": j["skipped"], "errors": j["errors"],
+                                 "last": j["last"]}
+                     for j in jobs},
+        }
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, default=str)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[AVISO] não foi possível gravar o status do daemon ({path}): {e}")
+
+def serve(jobs: List[Dict[str, Any]], jitter: float, status_path: str,
+          stop: threading.Event, once: bool = False):
+    """
+    Laço principal: dispara cada job quando vence o intervalo (com jitter). Um job
+    ainda em execução tem o ciclo pulado. Com `once`, roda um ciclo de cada e sai.
+    """
+    lock = threading.Lock()
+    on_done = lambda: write_status(status_path, jobs, lock)
+    for k, j in enumerate(jobs):
+        j["next_at"] = time.monotonic() + k * 2.0  # não abre tudo no mesmo instante
+
+    while not stop.is_set():
+        now = time.monotonic()
+        for j in jobs:
+            if now < j["next_at"]:
+                continue
+            j["next_at"] = now + next_delay(j["every"], jitter)
+            if j["thread"] and j["thread"].is_alive():
+                j["skipped"] += 1
+                print(f"[AVISO] {j['name']}: ciclo anterior ainda rodando; ciclo pulado.")
+                on_done()
+                continue
+            j["thread"] = threading.Thread(target=run_cycle, args=(j, on_done),
+                                           name=f"sync-{j['name']}", daemon=True)
+            j["thread"].start()
+        if once and all(j["cycles"] for j in jobs):
+            break
+        wait = min(j["next_at"] for j in jobs) - time.monotonic()
+        stop.wait(min(max(wait, 0.2), 5.0))
+
+    for j in jobs:
+        if j["thread"]:
+            j["thread"].join()
+        close_conns(j)
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+def parse_args(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Daemon: cópia por janela + andamento por setor em intervalos.")
+    ap.add_argument("--filial", type=int, required=True, help="Código da filial (EMP_FIL_CODIGO).")
+    ap.add_argument("--date-field", choices=["prev_inicio","validade","emissao"], default="validade")
+    ap.add_argument("--days-back", type=int, default=7)
+    ap.add_argument("--days-ahead", type=int, default=30)
+    ap.add_argument("--janela-every", type=float, default=60.0,
+                    help="Intervalo (s) entre ciclos da cópia por janela; 0 desliga o job.")
+    ap.add_argument("--andamento-every", type=float, default=60.0,
+                    help="Intervalo (s) entre ciclos do andamento por setor; 0 desliga o job.")
+    ap.add_argument("--reconcile-every", type=float, default=900.0,
+                    help="Intervalo (s) entre reconciliações de status das OPs não finais; 0 desliga o job.")
+    ap.add_argument("--dims-every", type=float, default=600.0,
+                    help="Intervalo (s) entre sincronizações de PRODUTOS/CORES (dim_sync); 0 desliga o job.")
+    ap.add_argument("--dims-check-every", type=float, default=86400.0,
+                    help="Intervalo (s) entre conferências por checksum das dimensões.")
+    ap.add_argument("--series-every", type=float, default=3600.0,
+                    help="Intervalo (s) entre amostras da série de andamento (progress_series); 0 desliga o job.")
+    ap.add_argument("--jitter", type=float, default=0.1,
+                    help="Variação aleatória do intervalo (fração; 0.1 = ±10%%).")
+    ap.add_argument("--janela-opts", type=str, default="--bulk --changed-only",
+                    help="Opções extras repassadas ao 04_copiar_janela (ex.: \"--bulk --changed-only\").")
+    ap.add_argument("--status-file", type=str, default=DEFAULT_STATUS_PATH,
+                    help="JSON com os tempos/resultado do último ciclo de cada job.")
+    ap.add_argument("--once", action="store_true", help="Roda um ciclo de cada job e sai (teste).")
+    return ap.parse_args(argv)
+
+def main():
+    args = parse_args()
+    args_j = janela.parse_args([
+        "--filial", str(args.filial), "--date-field", args.date_field,
+        "--days-back", str(args.days_back), "--days-ahead", str(args.days_ahead),
+        *shlex.split(args.janela_opts),
+    ])
+
+    jobs = []
+    if args.janela_every > 0:
+        jobs.append(new_job("janela", args.janela_every, janela_setup(args_j), janela_cycle(args_j),
+                            snapshot=args_j.with_andamento))
+    if args.andamento_every > 0 and args_j.with_andamento and args.janela_every > 0:
+        print("--with-andamento: andamento_setor vem do job janela; job andamento desligado.")
+    elif args.andamento_every > 0:
+        jobs.append(new_job("andamento", args.andamento_every, andamento.ensure_schema_pg,
+                            andamento_cycle(args.days_back, args.days_ahead)))
+    if args.reconcile_every > 0:
+        jobs.append(new_job("reconcile", args.reconcile_every, janela.ensure_schema,
+                            reconcile_cycle(args.filial)))
+    if args.dims_every > 0:
+        jobs.append(new_job("dims", args.dims_every, janela.ensure_schema, dims_cycle(args.dims_check_every)))
+    if args.series_every > 0:
+        jobs.append(new_job("series", args.series_every, janela.ensure_schema, series_cycle(),
+                            fb=False))
+    if not jobs:
+        raise SystemExit("Nenhum job habilitado (--janela-every/--andamento-every).")
+
+    stop = threading.Event()
+    def _stop(signum, frame):
+        print("Encerrando após os ciclos em andamento...")
+        stop.set()
+    signal.signal(signal.SIGINT, _stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, _stop)
+
+    print(f"Daemon iniciado (pid {os.getpid()}): " +
+          ", ".join(f"{j['name']} a cada {j['every']:g}s" for j in jobs) +
+          f"; status em {args.status_file}")
+    serve(jobs, args.jitter, args.status_file, stop, once=args.once)
+
+if __name__ == "__main__":
+    main()
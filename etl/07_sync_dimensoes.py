@@ -0,0 +1,59 @@
+# etl/07_sync_dimensoes.py
+# -----------------------------------------------------------------------------
+# Replica PRODUTOS (código, descrição) e CORES (código, nome) do Firebird nas
+# tabelas produto/cor do Postgres (ver dim_sync.py):
+#   - novos códigos por high-water mark (consulta barata, pode rodar sempre);
+#   - conferência por checksum das faixas de códigos a cada --check-every
+#     segundos (ou --check): pega renomeações e exclusões;
+#   - nome alterado é propagado para op_item e cor_txt das OPs afetadas.
+# -----------------------------------------------------------------------------
+r"""
+Como usar (PowerShell):
+
+(.venv) PS> python .\etl\07_sync_dimensoes.py
+(.venv) PS> python .\etl\07_sync_dimensoes.py --check
+"""
+import os
+import sys
+import argparse
+import importlib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+janela = importlib.import_module("04_copiar_janela")  # conexões e .env
+
+from fb_schema import resolve_schema
+from dim_sync import ensure_dim_schema, sync_dims
+from run_ledger import recorded_run, args_params
+
+def main():
+    ap = argparse.ArgumentParser(description="Replica PRODUTOS/CORES do Firebird em produto/cor no Postgres.")
+    ap.add_argument("--check", action="store_true", help="Força a conferência por checksum agora.")
+    ap.add_argument("--check-every", type=float, default=86400.0,
+                    help="Intervalo (s) entre conferências por checksum (padrão 1 dia).")
+    args = ap.parse_args()
+
+    fb = janela.fb_connect(); fbc = fb.cursor()
+    pg = janela.pg_connect(); pg.autocommit = False; pgc = pg.cursor()
+    try:
+        janela.ensure_schema(pgc)
+        schema = resolve_schema(fbc, janela.FB_SOURCE)
+        with recorded_run(pgc, "dims", None, params=args_params(args)) as rec:
+            res = sync_dims(fbc, pgc, schema, args.check_every, args.check)
+            pg.commit()
+            rec["changed"] = sum(r["new"] + r["updated"] + r["deleted"] for r in res.values())
+        for dim, r in res.items():
+            print(f"{dim}: +{r['new']} novos, ~{r['updated']} alterados, -{r['deleted']} excluídos, "
+                  f"{r['ops_touched']} OP(s) com itens atualizados"
+                  f"{', conferido por checksum' if r['checked'] else ''} ({r['duration_s']}s).")
+    except Exception:
+        pg.rollback()
+        raise
+    finally:
+        pgc.close(); pg.close()
+        fbc.close(); fb.close()
+
+if __name__ == "__main__":
+    main()
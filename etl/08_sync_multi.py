@@ -0,0 +1,420 @@
+# etl/08_sync_multi.py
+# -----------------------------------------------------------------------------
+# Cópia por janela de VÁRIAS filiais e/ou VÁRIOS bancos Firebird numa execução,
+# a partir de um arquivo de origens (JSON; ver etl/sources.example.json):
+# - Uma leitura por (origem, filial), em threads: seleção da janela, extração
+#   set-based em blocos (fb_extract) e transformação — o mesmo caminho do
+#   04_copiar_janela --bulk;
+# - "max_conns" por origem limita as conexões abertas ao mesmo tempo naquele
+#   servidor Firebird (as demais filiais da origem esperam a vez);
+# - UM gravador no Postgres (thread principal, uma conexão): recebe os blocos de
+#   todas as leituras por uma fila limitada e grava/commita bloco a bloco. O tempo
+#   total tende ao da origem mais lenta (ou ao do Postgres), não à soma;
+# - Esquema (fb_schema) detectado/cacheado por origem; imports e .env uma vez só;
+# - op.origem recebe o "name" da origem. ORP_ID é a chave de op: uma OP cujo
+#   ORP_ID já foi gravado por OUTRA origem não é sobrescrita (vai para o
+#   etl_dead_letter com o motivo);
+# - Cada (origem, filial) vira uma linha em etl_run (run_ledger), com a origem
+#   em params;
+# - --reconcile: em vez da janela, reconcilia o status das OPs NÃO finais de cada
+#   (origem, filial) contra o Firebird da PRÓPRIA origem (só op.origem = name);
+# - --andamento: depois da janela, andamento_setor (como o 05) de cada (origem,
+#   filial), com o roteiro lido do Firebird da própria origem.
+# -----------------------------------------------------------------------------
+r"""
+Como usar (PowerShell):
+
+# Todas as origens/filiais do arquivo (padrão: etl\sources.json)
+(.venv) PS> python .\etl\08_sync_multi.py --config .\etl\sources.json
+
+# Só algumas origens, listando o que seria copiado
+(.venv) PS> python .\etl\08_sync_multi.py --config .\etl\sources.json --only matriz --dry-run
+
+# Status das OPs que fecharam/sumiram, cada origem no seu Firebird
+(.venv) PS> python .\etl\08_sync_multi.py --config .\etl\sources.json --reconcile
+
+# Janela + andamento por setor de cada origem (em vez do 05, que só lê o Firebird do .env)
+(.venv) PS> python .\etl\08_sync_multi.py --config .\etl\sources.json --andamento
+
+# Janela/opções padrão para todas as origens (cada origem pode sobrescrever em "opts")
+(.venv) PS> python .\etl\08_sync_multi.py --opts "--date-field validade --days-back 7 --days-ahead 30 --changed-only"
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shlex
+import argparse
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+janela = importlib.import_module("04_copiar_janela")  # conexões e .env
+andamento = importlib.import_module("05_sync_andamento_setor")
+
+from fb_extract import chunked, extract_bundles
+from fb_schema import resolve_schema
+from pg_load import ensure_staging, set_async_commit, merge_stats, new_stats, format_stats
+from run_ledger import start_run, finish_run, recorded_run, args_params
+from etl_metrics import (new_metrics, stage, count_cursor, merge_metrics, summary, emit,
+                         profiled, add_cli_args)
+
+DEFAULT_CONFIG = os.path.join(BASE_DIR, "sources.json")
+
+# opções do 04 que não se aplicam aqui (o gravador é um só, com o caminho --bulk;
+# a reconciliação é a opção --reconcile do próprio 08)
+UNSUPPORTED = ("pipeline", "retry_dead_letter", "reconcile", "resume", "dims", "snapshot_dir", "from_snapshot",
+               "series")
+
+# -----------------------------------------------------------------------------
+# Configuração
+# -----------------------------------------------------------------------------
+def load_config(path: str, only: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Lê o arquivo de origens. Cada origem: "name", conexão Firebird (host, port,
+    database, user, password ou password_env, charset; ou fake_db), "filiais",
+    "max_conns" (padrão 1) e "opts" (opções do 04, somadas às de --opts).
+    O que faltar na conexão vem do .env (FIREBIRD_*).
+    """
+    if not os.path.exists(path):
+        raise SystemExit(f"Arquivo de origens não encontrado: {path} (veja etl\\sources.example.json)")
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    sources = cfg.get("sources") or []
+    names = [s.get("name") for s in sources]
+    if not sources or not all(names) or len(set(names)) != len(names):
+        raise SystemExit("Arquivo de origens: informe \"sources\" com \"name\" único em cada uma.")
+    for s in sources:
+        if s.get("password_env"):
+            s["password"] = os.getenv(s["password_env"], "")
+        if not s.get("filiais"):
+            raise SystemExit(f"Origem {s['name']}: informe \"filiais\".")
+        s["max_conns"] = max(1, int(s.get("max_conns", 1)))
+        s["opts"] = " ".join(x for x in (cfg.get("opts", ""), s.get("opts", "")) if x)
+    if only:
+        missing = set(only) - set(names)
+        if missing:
+            raise SystemExit(f"Origem(ns) inexistente(s) em --only: {', '.join(sorted(missing))}")
+        sources = [s for s in sources if s["name"] in only]
+    return sources
+
+def task_args(src: Dict[str, Any], filial: int, opts: str):
+    """Opções do 04 para uma (origem, filial): --opts da CLI + "opts" do arquivo."""
+    a = janela.parse_args(["--filial", str(filial), *shlex.split(opts), *shlex.split(src["opts"])])
+    bad = [k for k in UNSUPPORTED if getattr(a, k)] + (["workers"] if a.workers > 1 else [])
+    if bad:
+        raise SystemExit(f"Origem {src['name']}: opção(ões) não suportada(s) no 08: "
+                         + ", ".join("--" + k.replace("_", "-") for k in bad))
+    return a
+
+# -----------------------------------------------------------------------------
+# Leitura (uma thread por origem/filial)
+# -----------------------------------------------------------------------------
+def _put(q: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """put bloqueante (back-pressure) que desiste se o gravador parou."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def read_task(src: Dict[str, Any], filial: int, a, sem: threading.Semaphore,
+              q: "queue.Queue", stop: threading.Event, dry_run: bool = False):
+    """
+    Lê uma (origem, filial) e manda para o gravador, em ordem:
+      ("start", tag, info) -> ("chunk", tag, bloco transformado)* -> ("end", tag, None)
+    ou ("error", tag, exceção). A conexão Firebird só é aberta dentro do limite
+    da origem (`sem`).
+    """
+    tag = (src["name"], filial)
+    m = new_metrics(f"{src['name']}:{filial}")
+    try:
+        with sem:
+            fb = janela.fb_connect(snapshot=a.with_andamento, src=src)
+            fbc = count_cursor(fb.cursor(), m, "fb")
+            try:
+                dt_from, dt_to = janela.window_bounds(a)
+                schema = resolve_schema(fbc, janela.source_key(src))
+                with stage(m, "select"):
+                    op_ids, fps = janela.select_ops(fbc, a, dt_from, dt_to, schema)
+                if a.changed_only and op_ids:
+                    fps = changed_fps(fps)
+                    op_ids = [op_id for op_id, _ in fps]
+                run = janela.new_run(f"{src['name']}/{janela.window_run_key(a, dt_from, dt_to)}",
+                                     0, fps, janela.andamento_info(a, schema), None, m,
+                                     roteiro=schema["ROTEIRO"], source=src["name"])
+                info = {"dt_from": dt_from, "dt_to": dt_to, "selected": len(op_ids), "run": run, "load": a.load,
+                        "params": dict(args_params(a), origem=src["name"])}
+                print(f"[{src['name']}] filial {filial}: {len(op_ids)} OP(s) em {dt_from}..{dt_to}.")
+                if not _put(q, ("start", tag, info), stop):
+                    return
+                if not dry_run:
+                    for ids in chunked(op_ids, a.chunk_size):
+                        with stage(m, "extract"):
+                            bundles = extract_bundles(fbc, ids, schema["PRODUTOS_DESC"],
+                                                      schema["CORES_NOME"], schema["ROTEIRO"])
+                        with stage(m, "transform"):
+                            chunk = janela.transform_chunk(None, run, ids, bundles, a.load)
+                        if not _put(q, ("chunk", tag, chunk), stop):
+                            return
+            finally:
+                fbc.close(); fb.close()
+        _put(q, ("end", tag, None), stop)
+    except BaseException as e:
+        _put(q, ("error", tag, e), stop)
+
+def changed_fps(fps: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """--changed-only: compara os fingerprints com o Postgres numa conexão só de leitura."""
+    pg = janela.pg_connect()
+    try:
+        with pg.cursor() as pgc:
+            return janela.filter_changed(pgc, fps)
+    finally:
+        pg.rollback(); pg.close()
+
+# -----------------------------------------------------------------------------
+# Gravador (thread principal, uma conexão Postgres)
+# -----------------------------------------------------------------------------
+def foreign_ops(pgc, source: str, op_ids: List[int]) -> Dict[int, str]:
+    """ORP_IDs do bloco já gravados no Postgres por outra origem (colisão de chave)."""
+    pgc.execute("SELECT op_id, origem FROM op WHERE op_id = ANY(%s) AND origem IS NOT NULL AND origem <> %s",
+                (op_ids, source))
+    return {int(r[0]): r[1] for r in pgc.fetchall()}
+
+def write_task_chunk(pgc, run: Dict[str, Any], chunk: List[Dict[str, Any]], load: str):
+    """Grava um bloco de uma (origem, filial) e commita (checkpoint da execução dela)."""
+    taken = foreign_ops(pgc, run["source"], [b["op_id"] for b in chunk if "error" not in b])
+    if taken:
+        chunk = [{"op_id": b["op_id"], "payload": None,
+                  "error": f"ORP_ID {b['op_id']} já gravado pela origem {taken[b['op_id']]}"}
+                 if b["op_id"] in taken and "error" not in b else b for b in chunk]
+    janela.write_chunk(pgc, run, chunk, load)
+    janela.checkpoint(pgc, run, force=True)
+
+def sync_sources(sources: List[Dict[str, Any]], args, m: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Dispara as leituras (todas as origens/filiais ao mesmo tempo, limitadas por
+    max_conns de cada origem) e grava o que chega na fila. Uma (origem, filial)
+    com erro é registrada e não interrompe as outras. Retorna o resultado de cada uma.
+    """
+    tasks = [(src, f, task_args(src, f, args.opts)) for src in sources for f in src["filiais"]]
+    sems = {src["name"]: threading.Semaphore(src["max_conns"]) for src in sources}
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, args.queue_size))
+    stop = threading.Event()
+
+    pg = pgc = None
+    if not args.dry_run:
+        pg = janela.pg_connect(); pg.autocommit = False; pgc = count_cursor(pg.cursor(), m, "pg")
+        if args.async_commit:
+            set_async_commit(pgc)
+        with stage(m, "schema"):
+            janela.ensure_schema(pgc)
+            ensure_staging(pgc)
+        pg.commit()
+
+    state: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    results: List[Dict[str, Any]] = []
+    pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="etl-read")
+    try:
+        for src, f, a in tasks:
+            pool.submit(read_task, src, f, a, sems[src["name"]], q, stop, args.dry_run)
+        pending = len(tasks)
+        while pending:
+            kind, tag, payload = q.get()
+            st = state.get(tag)
+            if kind == "start":
+                st = state[tag] = {"info": payload, "t0": time.perf_counter(), "rec": None}
+                if pgc is not None:
+                    st["rec"] = {"run_id": start_run(pgc, "janela", tag[1], payload["dt_from"],
+                                                     payload["dt_to"], payload["params"])}
+            elif kind == "chunk":
+                with stage(m, "load"):
+                    write_task_chunk(pgc, st["info"]["run"], payload, st["info"]["load"])
+            else:
+                pending -= 1
+                results.append(finish_task(pgc, tag, st, payload if kind == "error" else None))
+    except BaseException:
+        stop.set()
+        if pg is not None:
+            pg.rollback()
+        raise
+    finally:
+        stop.set()
+        pool.shutdown(wait=True)
+        if pg is not None:
+            pgc.close(); pg.close()
+    for st in state.values():
+        merge_metrics(m, st["info"]["run"]["metrics"])
+    return results
+
+def finish_task(pgc, tag: Tuple[str, int], st: Optional[Dict[str, Any]],
+                error: Optional[BaseException]) -> Dict[str, Any]:
+    """Fecha uma (origem, filial): contagens, etl_run e linha do resumo."""
+    name, filial = tag
+    if error is not None:
+        print(f"[ERRO] {name} filial {filial}: {type(error).__name__}: {error}")
+    if st is None:  # falhou antes de selecionar a janela
+        if pgc is not None:
+            rec = {"run_id": start_run(pgc, "janela", filial, params={"origem": name})}
+            finish_run(pgc, rec, "error", f"{type(error).__name__}: {error}")
+        return {"source": name, "filial": filial, "selected": 0, "done": 0, "fail": 0,
+                "stats": {}, "error": str(error)}
+    run, info = st["info"]["run"], st["info"]
+    out = {"source": name, "filial": filial, "selected": info["selected"], "done": len(run["done"]),
+           "fail": run["fail"], "stats": run["stats"], "duration_s": round(time.perf_counter() - st["t0"], 3)}
+    if error is not None:
+        out["error"] = str(error)
+    if st["rec"] is not None:
+        pgc.connection.rollback()  # nada pendente: cada bloco já foi commitado
+        st["rec"].update(selected=info["selected"], done=out["done"], fail=out["fail"], stats=run["stats"])
+        finish_run(pgc, st["rec"], "error" if error else ("partial" if run["fail"] else "ok"),
+                   f"{type(error).__name__}: {error}" if error else None)
+    return out
+
+# -----------------------------------------------------------------------------
+# Passadas por origem (conexões próprias, no Firebird da origem)
+# -----------------------------------------------------------------------------
+def source_pass(sources: List[Dict[str, Any]], args, m: Dict[str, Any], kind: str,
+                fn: Callable) -> List[Dict[str, Any]]:
+    """
+    Roda `fn(fbc, pgc, src, filial, a)` para cada (origem, filial), cada uma com
+    conexões Firebird (a da SUA origem) e Postgres próprias, em paralelo limitado
+    por max_conns de cada origem. Uma linha em etl_run (`kind`) por par; com
+    --dry-run, nada é gravado. Uma falha não interrompe as outras.
+    """
+    tasks = [(src, f, task_args(src, f, args.opts)) for src in sources for f in src["filiais"]]
+    sems = {src["name"]: threading.Semaphore(src["max_conns"]) for src in sources}
+
+    def one(src: Dict[str, Any], filial: int, a) -> Dict[str, Any]:
+        tm = new_metrics(f"{kind}:{src['name']}:{filial}")
+        out: Dict[str, Any] = {"source": src["name"], "filial": filial, "metrics": tm}
+        try:
+            with sems[src["name"]]:
+                fb = janela.fb_connect(src=src); fbc = count_cursor(fb.cursor(), tm, "fb")
+                pg = janela.pg_connect(); pg.autocommit = False; pgc = count_cursor(pg.cursor(), tm, "pg")
+                try:
+                    if args.dry_run:
+                        out.update(fn(fbc, pgc, src, filial, a))
+                        pg.rollback()
+                    else:
+                        with recorded_run(pgc, kind, filial, params=dict(args_params(a), origem=src["name"])) as rec:
+                            res = fn(fbc, pgc, src, filial, a)
+                            pg.commit()
+                            rec.update(res.get("rec", {}))
+                        out.update(res)
+                except Exception:
+                    pg.rollback()
+                    raise
+                finally:
+                    fbc.close(); fb.close()
+                    pgc.close(); pg.close()
+        except (Exception, SystemExit) as e:
+            print(f"[ERRO] {src['name']} filial {filial}: {type(e).__name__}: {e}")
+            out["error"] = str(e)
+        out.pop("rec", None)
+        return out
+
+    with ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix=f"etl-{kind}") as pool:
+        results = list(pool.map(lambda t: one(*t), tasks))
+    for r in results:
+        merge_metrics(m, r.pop("metrics"))
+    return results
+
+def reconcile_one(fbc, pgc, src: Dict[str, Any], filial: int, a) -> Dict[str, Any]:
+    """Reconciliação de uma (origem, filial): só as OPs gravadas por esta origem."""
+    res = janela.reconcile_ops(fbc, pgc, filial, origem=src["name"])
+    print(f"[{src['name']}] filial {filial}: {res['checked']} OP(s) não finais; {res['updated']} com status "
+          f"atualizado ({res['removed']} removida(s) no Firebird).")
+    return dict(res, rec={"selected": res["checked"], "done": res["updated"], "changed": res["updated"]})
+
+def andamento_one(fbc, pgc, src: Dict[str, Any], filial: int, a) -> Dict[str, Any]:
+    """andamento_setor de uma (origem, filial), na janela de validade das opções da origem."""
+    dt_from, dt_to = janela.window_bounds(a)
+    res = andamento.sync_andamento(fbc, pgc, dt_from, dt_to, origem=src["name"], filial=filial,
+                                   source_key=janela.source_key(src))
+    return dict(res, rec={"selected": res["ops"], "done": res["ops"], "stats": res["stats"],
+                          "dt_from": dt_from, "dt_to": dt_to})
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+def parse_args(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Cópia por janela de várias filiais/bancos Firebird ao mesmo tempo.")
+    ap.add_argument("--config", type=str, default=DEFAULT_CONFIG,
+                    help="Arquivo JSON de origens (ver etl\\sources.example.json).")
+    ap.add_argument("--only", type=str, default=None,
+                    help="Só estas origens (nomes separados por vírgula).")
+    ap.add_argument("--opts", type=str, default="",
+                    help="Opções do 04_copiar_janela para todas as origens (ex.: \"--days-back 7 --changed-only\").")
+    ap.add_argument("--queue-size", type=int, default=8,
+                    help="Blocos em espera para o gravador (limita a memória).")
+    ap.add_argument("--async-commit", action="store_true",
+                    help="synchronous_commit=off na sessão do gravador.")
+    ap.add_argument("--dry-run", action="store_true", help="Só seleciona as janelas, sem gravar.")
+    ap.add_argument("--reconcile", action="store_true",
+                    help="Em vez da janela: reconcilia o status das OPs não finais de cada origem/filial "
+                         "no Firebird da própria origem.")
+    ap.add_argument("--andamento", action="store_true",
+                    help="Depois da janela: andamento_setor de cada origem/filial (como o 05), "
+                         "com o roteiro do Firebird da própria origem.")
+    add_cli_args(ap)
+    return ap.parse_args(argv)
+
+def main():
+    args = parse_args()
+    with profiled(args.profile):
+        _main(args)
+
+def _main(args):
+    only = [s.strip() for s in args.only.split(",") if s.strip()] if args.only else None
+    sources = load_config(args.config, only)
+    m = new_metrics("sync_multi")
+    if args.reconcile:
+        if not args.dry_run:
+            pg = janela.pg_connect()
+            try:
+                with pg.cursor() as pgc:
+                    janela.ensure_schema(pgc)
+                pg.commit()
+            finally:
+                pg.close()
+        results = source_pass(sources, args, m, "reconcile", reconcile_one)
+        emit(summary(m, new_stats(), {"sources": results}), args.metrics_json, args.prom_textfile)
+        if any(r.get("error") for r in results):
+            raise SystemExit(1)
+        return
+    results = sync_sources(sources, args, m)
+    if args.dry_run:
+        print("DRY-RUN: nada foi gravado no Postgres.")
+        return
+
+    stats = new_stats()
+    for r in sorted(results, key=lambda r: (r["source"], r["filial"])):
+        merge_stats(stats, r["stats"])
+        status = f"ERRO {r['error']}" if r.get("error") else f"{r['done']} ok, {r['fail']} falha(s)"
+        print(f"[{r['source']}] filial {r['filial']}: {r['selected']} OP(s), {status} "
+              f"({r.get('duration_s', 0)}s; {format_stats(r['stats'])})")
+    fail = sum(r["fail"] for r in results)
+    extra: Dict[str, Any] = {}
+    if args.andamento:
+        extra["andamento"] = source_pass(sources, args, m, "andamento", andamento_one)
+        for r in extra["andamento"]:
+            if "stats" in r:
+                merge_stats(stats, r["stats"])
+    emit(summary(m, stats, dict(extra, sources=results, done=sum(r["done"] for r in results), fail=fail)),
+         args.metrics_json, args.prom_textfile)
+    if fail:
+        print("OPs com falha registradas em etl_dead_letter.")
+    if any(r.get("error") for r in results + extra.get("andamento", [])):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# etl/bench_etl.py
+# -----------------------------------------------------------------------------
+# Benchmark do ETL contra um Firebird sintético (fb_fake.py) e um Postgres local.
+# - Gera (uma vez por escala/semente) o banco fake em etl/.bench/;
+# - Roda 04_copiar_janela (cenários: por OP, --bulk, --pipeline...) e
+#   05_sync_andamento_setor de ponta a ponta, como processos separados, com
+#   --metrics-json (etl_metrics): tempo total e por estágio, round trips FB/PG,
+#   linhas/s e pico de RSS;
+# - Cada cenário roda "frio" (tabelas de destino vazias) e "morno" (de novo, nada
+#   mudou) --repeat vezes; vale a mediana;
+# - --baseline compara com um resultado anterior e sai com código 1 se algum
+#   cenário ficou mais lento que --max-regression.
+# ATENÇÃO: as tabelas do ETL no banco --pg-db são TRUNCADAS a cada cenário.
+# -----------------------------------------------------------------------------
+r"""
+Como usar (PowerShell):
+
+# 10k e 100k itens, cenários padrão, Postgres local (banco gp_bench, criado se faltar)
+(.venv) PS> python .\etl\bench_etl.py --scales 10000,100000
+
+# Guardar como referência e comparar depois de uma mudança
+(.venv) PS> python .\etl\bench_etl.py --scales 100000 --out .\etl\.bench\base.json
+(.venv) PS> python .\etl\bench_etl.py --scales 100000 --baseline .\etl\.bench\base.json
+
+# Cenários próprios (nome=opções do 04; "andamento" roda o 05)
+(.venv) PS> python .\etl\bench_etl.py --scales 1000000 --scenario bulk=--bulk --scenario workers4="--bulk --workers 4"
+"""
+import os
+import sys
+import json
+import shlex
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from dotenv import load_dotenv
+
+import fb_fake
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+BENCH_DIR = os.path.join(BASE_DIR, ".bench")
+
+DEFAULT_SCALES = "10000,100000,1000000"
+DEFAULT_SCENARIOS = [
+    ("por_op", ""),
+    ("bulk", "--bulk"),
+    ("pipeline", "--pipeline"),
+    ("bulk_andamento", "--bulk --with-andamento"),
+    ("andamento", None),   # 05_sync_andamento_setor (depois de uma cópia)
+]
+# tabelas do ETL zeradas antes de cada cenário (as que existirem; as particionadas
+# progress_* são truncadas pela tabela-mãe)
+ETL_TABLES = ["op", "op_item", "roteiro", "andamento_setor", "etl_op_fingerprint",
+              "etl_checkpoint", "etl_dead_letter", "produto", "cor", "etl_dim_bucket",
+              "etl_run", "op_hist", "progress_op", "progress_op_last", "progress_setor"]
+
+# -----------------------------------------------------------------------------
+# Postgres de benchmark
+# -----------------------------------------------------------------------------
+def pg_params(dbname: str) -> Dict[str, Any]:
+    return {"host": os.getenv("PG_HOST", "localhost"), "port": int(os.getenv("PG_PORT", "5432")),
+            "user": os.getenv("PG_USER", "postgres"), "password": os.getenv("PG_PASSWORD", ""),
+            "dbname": dbname}
+
+def ensure_bench_db(dbname: str):
+    """Cria o banco de benchmark se ainda não existir."""
+    conn = psycopg2.connect(**pg_params("postgres"))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{dbname}"')
+    finally:
+        conn.close()
+
+def reset_tables(dbname: str, tables: List[str]):
+    conn = psycopg2.connect(**pg_params(dbname))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename = ANY(%s)",
+                        (tables,))
+            present = [r[0] for r in cur.fetchall()]
+            if present:
+                cur.execute(f"TRUNCATE {', '.join(present)}")
+        conn.commit()
+    finally:
+        conn.close()
+
+# -----------------------------------------------------------------------------
+# Execução
+# -----------------------------------------------------------------------------
+def fake_db(scale: int, seed: int, regenerate: bool) -> str:
+    path = os.path.join(BENCH_DIR, f"fb_{scale}_{seed}.sqlite")
+    if regenerate or not os.path.exists(path):
+        print(f"Gerando Firebird sintético: {scale} itens (semente {seed}) -> {path}")
+        counts = fb_fake.generate(path, scale, seed)
+        print("  " + ", ".join(f"{t} {n}" for t, n in counts.items()))
+    return path
+
+def window_args() -> List[str]:
+    """Janela por validade que cobre todas as datas geradas (prev. início + validade)."""
+    dt_to = fb_fake.BASE_DATE + timedelta(days=fb_fake.DAYS + 70)
+    return ["--from", fb_fake.BASE_DATE.isoformat(), "--to", dt_to.isoformat()]
+
+def janela_args(opts: str) -> List[str]:
+    return ["--filial", "1", "--date-field", "validade"] + window_args() + shlex.split(opts)
+
+def run_script(script: str, argv: List[str], env: Dict[str, str], metrics_path: str) -> Dict[str, Any]:
+    """Roda um script do ETL e devolve o resumo do --metrics-json."""
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    cmd = [sys.executable, os.path.join(BASE_DIR, script)] + argv + ["--metrics-json", metrics_path]
+    proc = subprocess.run(cmd, env=env, cwd=BASE_DIR, capture_output=True, text=True)
+    if proc.returncode != 0 or not os.path.exists(metrics_path):
+        raise RuntimeError(f"{script} falhou ({proc.returncode}):\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def median_of(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mediana dos números de várias execuções do mesmo cenário."""
+    stages = sorted({k for r in runs for k in r["stages_s"]})
+    return {
+        "runs": len(runs),
+        "total_s": round(statistics.median(r["total_s"] for r in runs), 3),
+        "stages_s": {k: round(statistics.median(r["stages_s"].get(k, 0.0) for r in runs), 3) for k in stages},
+        "fb_round_trips": int(statistics.median(r["fb_round_trips"] for r in runs)),
+        "pg_round_trips": int(statistics.median(r["pg_round_trips"] for r in runs)),
+        "rows_per_s": statistics.median((r["rows_per_s"] or 0) for r in runs),
+        "peak_rss_mb": max((r["peak_rss_mb"] or 0) for r in runs),
+    }
+
+def bench_scenario(name: str, opts: Optional[str], env: Dict[str, str], pg_db: str,
+                   repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Roda o cenário frio e morno `repeat` vezes cada; devolve as medianas."""
+    metrics_path = os.path.join(BENCH_DIR, f"_{name}.json")
+    if opts is None:  # 05: precisa das OPs desta escala no Postgres (cópia fora da medição)
+        reset_tables(pg_db, ETL_TABLES)
+        run_script("04_copiar_janela.py", janela_args("--bulk"), env, metrics_path)
+        script, argv = "05_sync_andamento_setor.py", window_args()
+        def reset():
+            reset_tables(pg_db, ["andamento_setor"])
+    else:
+        script, argv = "04_copiar_janela.py", janela_args(opts)
+        def reset():
+            reset_tables(pg_db, ETL_TABLES)
+    cold, warm = [], []
+    for _ in range(repeat):
+        reset()
+        cold.append(run_script(script, argv, env, metrics_path))
+        warm.append(run_script(script, argv, env, metrics_path))
+    return {"cold": median_of(cold), "warm": median_of(warm)}
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Cenários (escala/cenário/fase) mais lentos que o baseline além da tolerância."""
+    out = []
+    for scale, scen in results["results"].items():
+        for name, phases in scen.items():
+            for phase, r in phases.items():
+                base = baseline.get("results", {}).get(scale, {}).get(name, {}).get(phase)
+                if not base or not base["total_s"]:
+                    continue
+                delta = r["total_s"] / base["total_s"] - 1.0
+                if delta > max_regression:
+                    out.append(f"{scale} {name} {phase}: {base['total_s']}s -> {r['total_s']}s (+{delta:.0%})")
+    return out
+
+def print_table(results: Dict[str, Any]):
+    print(f"\n{'itens':>9} {'cenário':<16} {'fase':<5} {'total s':>9} {'extract':>8} {'load':>8} "
+          f"{'FB rt':>7} {'PG rt':>7} {'linhas/s':>10} {'RSS MB':>7}")
+    for scale, scen in results["results"].items():
+        for name, phases in scen.items():
+            for phase, r in phases.items():
+                st = r["stages_s"]
+                print(f"{scale:>9} {name:<16} {phase:<5} {r['total_s']:>9} {st.get('extract', 0):>8} "
+                      f"{st.get('load', 0):>8} {r['fb_round_trips']:>7} {r['pg_round_trips']:>7} "
+                      f"{r['rows_per_s']:>10} {r['peak_rss_mb']:>7}")
+
+def parse_scenarios(items: Optional[List[str]]) -> List[Tuple[str, Optional[str]]]:
+    if not items:
+        return DEFAULT_SCENARIOS
+    out = []
+    for it in items:
+        name, _, opts = it.partition("=")
+        out.append((name, None if name == "andamento" else opts))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do ETL contra um Firebird sintético.")
+    ap.add_argument("--scales", type=str, default=DEFAULT_SCALES, help="Itens de OP por escala (lista).")
+    ap.add_argument("--seed", type=int, default=42, help="Semente dos dados sintéticos.")
+    ap.add_argument("--scenario", action="append",
+                    help='Cenário nome=opções do 04 (repetível); "andamento" roda o 05. Padrão: todos.')
+    ap.add_argument("--repeat", type=int, default=3, help="Execuções por cenário e fase (mediana).")
+    ap.add_argument("--pg-db", type=str, default=os.getenv("PG_BENCH_DB", "gp_bench"),
+                    help="Banco Postgres do benchmark (TRUNCADO a cada cenário).")
+    ap.add_argument("--regenerate", action="store_true", help="Gera de novo os bancos sintéticos.")
+    ap.add_argument("--out", type=str, default=None, help="Grava os resultados em JSON.")
+    ap.add_argument("--baseline", type=str, default=None, help="JSON de um benchmark anterior para comparar.")
+    ap.add_argument("--max-regression", type=float, default=0.15,
+                    help="Tolerância de lentidão vs. baseline (0.15 = 15%%).")
+    args = ap.parse_args()
+
+    if args.pg_db == os.getenv("PG_DB", "gp_local"):
+        raise SystemExit(f"Erro: --pg-db {args.pg_db} é o banco do ETL; use um banco só para benchmark.")
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    ensure_bench_db(args.pg_db)
+
+    results: Dict[str, Any] = {"started_at": datetime.now().isoformat(timespec="seconds"),
+                               "seed": args.seed, "repeat": args.repeat, "results": {}}
+    for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+        env = dict(os.environ, FIREBIRD_FAKE_DB=fake_db(scale, args.seed, args.regenerate), PG_DB=args.pg_db,
+                   FB_SCHEMA_CACHE=os.path.join(BENCH_DIR, ".fb_schema_cache.json"))
+        scen_out = results["results"].setdefault(str(scale), {})
+        for name, opts in parse_scenarios(args.scenario):
+            print(f"[{scale}] {name} ...", flush=True)
+            scen_out[name] = bench_scenario(name, opts, env, args.pg_db, args.repeat)
+    print_table(results)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\nREGRESSÕES:")
+            for r in regressions:
+                print("  " + r)
+            sys.exit(1)
+        print(f"\nSem regressões acima de {args.max_regression:.0%} em relação a {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# etl/bench_fb_driver.py
+# -----------------------------------------------------------------------------
+# Micro-benchmark da camada fb_driver contra o SEU servidor Firebird (.env):
+# - Combinações de driver (firebirdsql / firebird-driver, os instalados),
+#   transação (read_committed / snapshot), cache de comandos preparados
+#   (ligado / desligado), fetch size e compressão do protocolo (firebird-driver);
+# - Carga de trabalho = o que o ETL faz: leitura por OP (cabeçalho, itens e
+#   roteiro de cada OP de uma amostra da janela; é onde o preparo pesa) e leitura
+#   em bloco (fb_extract.extract_bundles da mesma amostra; decodificação);
+# - Cada combinação roda --repeat vezes (conexão nova; vale a mediana) e o
+#   resultado sai ordenado, com as linhas do .env da mais rápida.
+# Só leitura: nada é gravado no Firebird nem no Postgres.
+# -----------------------------------------------------------------------------
+r"""
+Como usar (PowerShell):
+
+# Amostra de 200 OPs da janela padrão da filial 1, todas as combinações
+(.venv) PS> python .\etl\bench_fb_driver.py --filial 1
+
+# Só um driver, fetch sizes próprios, resultado em JSON
+(.venv) PS> python .\etl\bench_fb_driver.py --filial 1 --drivers firebird-driver --fetch-sizes 500,2000,10000 --out .\etl\.bench\fb_driver.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import itertools
+import statistics
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+janela = importlib.import_module("04_copiar_janela")  # .env e consultas do ETL
+
+import fb_driver
+from fb_extract import chunked, extract_bundles
+from fb_schema import resolve_schema
+
+def available_drivers() -> List[str]:
+    return [d for d, mod in (("firebirdsql", fb_driver.firebirdsql), ("firebird-driver", fb_driver.fbdriver))
+            if mod is not None]
+
+def configs(args) -> List[Dict[str, Any]]:
+    """Combinações a medir (compressão só no firebird-driver, que a implementa)."""
+    drivers = [d.strip() for d in args.drivers.split(",")] if args.drivers else available_drivers()
+    out = []
+    for drv, tx, cache, fetch in itertools.product(drivers, args.tx.split(","), (64, 0),
+                                                  [int(x) for x in args.fetch_sizes.split(",")]):
+        for wire in ((False, True) if drv == "firebird-driver" and args.wire_compression else (False,)):
+            out.append({"driver": drv, "tx": tx, "stmt_cache": cache, "fetch_size": fetch,
+                        "wire_compression": wire})
+    return out
+
+def connect(cfg: Dict[str, Any]):
+    return fb_driver.connect(janela.FB_HOST, janela.FB_PORT, janela.FB_DB, janela.FB_USER, janela.FB_PASS,
+                             janela.FB_CHAR, fake_db=janela.FB_FAKE_DB, **cfg)
+
+def workload(cfg: Dict[str, Any], op_ids: List[int], schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Uma rodada: leitura por OP e em bloco da amostra, numa conexão nova."""
+    t0 = time.perf_counter()
+    fb = connect(cfg); cur = fb.cursor()
+    try:
+        t1 = time.perf_counter()
+        rows = 0
+        for op_id in op_ids:
+            hdr = janela.get_op_header(cur, op_id)
+            rows += 1 + len(janela.get_items(cur, op_id, hdr["ORP_SERIE"], schema))
+            rows += len(janela.get_roteiro(cur, op_id, hdr["ORP_SERIE"], schema))
+        t2 = time.perf_counter()
+        for ids in chunked(op_ids, janela.DEFAULT_CHUNK):
+            for b in extract_bundles(cur, ids, schema["PRODUTOS_DESC"], schema["CORES_NOME"], schema["ROTEIRO"]):
+                rows += 1 + len(b["items"]) + len(b["roteiro"])
+        t3 = time.perf_counter()
+        fb.commit()
+        return {"connect_s": t1 - t0, "por_op_s": t2 - t1, "bulk_s": t3 - t2, "rows": rows,
+                "prepared": fb.stats["prepared"], "reused": fb.stats["reused"]}
+    finally:
+        cur.close(); fb.close()
+
+def measure(cfg: Dict[str, Any], op_ids: List[int], schema: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    runs = [workload(cfg, op_ids, schema) for _ in range(max(1, repeat))]
+    med = {k: round(statistics.median(r[k] for r in runs), 4) for k in ("connect_s", "por_op_s", "bulk_s")}
+    med["total_s"] = round(med["connect_s"] + med["por_op_s"] + med["bulk_s"], 4)
+    return dict(cfg, **med, rows=runs[-1]["rows"], prepared=runs[-1]["prepared"], reused=runs[-1]["reused"])
+
+def env_lines(best: Dict[str, Any]) -> List[str]:
+    return [f"FIREBIRD_DRIVER={best['driver']}", f"FIREBIRD_TX={best['tx']}",
+            f"FIREBIRD_STMT_CACHE={best['stmt_cache']}", f"FIREBIRD_FETCH_SIZE={best['fetch_size']}",
+            f"FIREBIRD_WIRE_COMPRESSION={int(best['wire_compression'])}"]
+
+def parse_args(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Micro-benchmark da camada de acesso ao Firebird (fb_driver).")
+    ap.add_argument("--filial", type=int, required=True, help="Filial da amostra de OPs.")
+    ap.add_argument("--date-field", choices=["prev_inicio","validade","emissao"], default="validade")
+    ap.add_argument("--from", dest="dt_from", type=str, help="Data inicial (YYYY-MM-DD).")
+    ap.add_argument("--to",   dest="dt_to",   type=str, help="Data final (YYYY-MM-DD).")
+    ap.add_argument("--days-back", type=int, default=30)
+    ap.add_argument("--days-ahead", type=int, default=30)
+    ap.add_argument("--status", type=str, default="AA,IN,EP,SS")
+    ap.add_argument("--sample", type=int, default=200, help="OPs da amostra.")
+    ap.add_argument("--drivers", type=str, default=None,
+                    help="Drivers a medir (padrão: os instalados): firebirdsql,firebird-driver.")
+    ap.add_argument("--tx", type=str, default="read_committed,snapshot", help="Modos de transação a medir.")
+    ap.add_argument("--fetch-sizes", type=str, default="500,2000", help="Valores de FIREBIRD_FETCH_SIZE.")
+    ap.add_argument("--wire-compression", action="store_true",
+                    help="Mede também com compressão do protocolo (firebird-driver; útil em link lento).")
+    ap.add_argument("--repeat", type=int, default=3, help="Rodadas por combinação (vale a mediana).")
+    ap.add_argument("--out", type=str, default=None, help="Grava o resultado em JSON.")
+    return ap.parse_args(argv)
+
+def main():
+    args = parse_args()
+    dt_from, dt_to = janela.window_bounds(args)
+    fb = janela.fb_connect(); cur = fb.cursor()
+    try:
+        op_ids = janela.find_ops_window(cur, args.filial, args.status.split(","), args.date_field,
+                                        dt_from, dt_to, args.sample)
+        schema = resolve_schema(cur, janela.FB_SOURCE)
+    finally:
+        cur.close(); fb.close()
+    if not op_ids:
+        raise SystemExit(f"Nenhuma OP na janela {dt_from}..{dt_to} da filial {args.filial} para a amostra.")
+
+    cfgs = [{"driver": "fake", "tx": "read_committed", "stmt_cache": 0, "fetch_size": 2000,
+             "wire_compression": False}] if janela.FB_FAKE_DB else configs(args)
+    print(f"Amostra: {len(op_ids)} OP(s) de {dt_from}..{dt_to}; {len(cfgs)} combinação(ões) x {args.repeat}.")
+    results = []
+    for cfg in cfgs:
+        try:
+            r = measure(cfg, op_ids, schema, args.repeat)
+        except (Exception, SystemExit) as e:
+            print(f"[AVISO] {cfg}: {e}")
+            continue
+        results.append(r)
+        print(f"  {r['driver']:<16} {r['tx']:<15} cache={r['stmt_cache']:<3} fetch={r['fetch_size']:<6} "
+              f"wire={int(r['wire_compression'])}  total {r['total_s']:.3f}s (por OP {r['por_op_s']:.3f}s, "
+              f"bloco {r['bulk_s']:.3f}s; preparados {r['prepared']}, reaproveitados {r['reused']})")
+    if not results:
+        raise SystemExit("Nenhuma combinação rodou.")
+
+    results.sort(key=lambda r: r["total_s"])
+    best = results[0]
+    print("\nMais rápida: " + ", ".join(f"{k}={best[k]}" for k in ("driver", "tx", "stmt_cache", "fetch_size", "wire_compression")))
+    print("Para usar, no etl\\.env:\n  " + "\n  ".join(env_lines(best)))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"created_at": datetime.now().isoformat(timespec="seconds"),
+                       "source": janela.FB_SOURCE, "sample": len(op_ids), "results": results,
+                       "env": env_lines(best)}, f, indent=2)
+        print(f"Resultado gravado em {args.out}")
+
+if __name__ == "__main__":
+    main()
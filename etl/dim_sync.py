@@ -0,0 +1,217 @@
+# etl/dim_sync.py
+# -----------------------------------------------------------------------------
+# Réplica incremental das dimensões PRODUTOS e CORES no Postgres (produto, cor).
+# - Incremental por high-water mark: só lê do Firebird os códigos maiores que o
+#   maior código já replicado;
+# - Conferência periódica por checksum: o Firebird devolve (qtd, soma de HASH da
+#   descrição) por faixa de códigos; as faixas que diferem da última conferência
+#   (etl_dim_bucket) são relidas inteiras (pega renomeações e exclusões);
+# - Um nome/descrição alterado é propagado para op_item (pro_desc/cor_nome) e o
+#   cor_txt das OPs afetadas é recalculado (e versionado em op_hist) — sem
+#   copiar as OPs de novo.
+# Com as dimensões no Postgres, 04_copiar_janela --dims lê os itens SEM os JOINs
+# em PRODUTOS/CORES e preenche os nomes localmente.
+# -----------------------------------------------------------------------------
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import psycopg2.extras
+
+from fb_extract import DEFAULT_FETCH
+from pg_load import add_stats, derive_op_header
+from op_history import record_op_history
+
+BUCKET = 1000                # códigos por faixa de checksum
+HASH_MOD = 1000000007        # SUM de HASH() estouraria BIGINT no Firebird
+
+# dimensão -> origem no Firebird, coluna detectada (fb_schema) e destino no Postgres
+DIMS: Dict[str, Dict[str, str]] = {
+    "produto": {"fb_table": "PRODUTOS", "fb_key": "PRO_CODIGO", "schema": "PRODUTOS_DESC",
+                "pg_key": "pro_codigo", "pg_col": "descricao", "item_col": "pro_desc"},
+    "cor":     {"fb_table": "CORES",    "fb_key": "COR_CODIGO", "schema": "CORES_NOME",
+                "pg_key": "cor_codigo", "pg_col": "nome",      "item_col": "cor_nome"},
+}
+
+def ensure_dim_schema(pg_cur):
+    pg_cur.execute("""
+    CREATE TABLE IF NOT EXISTS produto (
+      pro_codigo   INTEGER PRIMARY KEY,
+      descricao    TEXT,
+      synced_at    TIMESTAMP NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS cor (
+      cor_codigo   INTEGER PRIMARY KEY,
+      nome         VARCHAR(200),
+      synced_at    TIMESTAMP NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS etl_dim_bucket (
+      dim          VARCHAR(20) NOT NULL,
+      bucket       INTEGER NOT NULL,
+      qtd          INTEGER NOT NULL,
+      checksum     BIGINT NOT NULL,
+      checked_at   TIMESTAMP NOT NULL DEFAULT now(),
+      PRIMARY KEY (dim, bucket)
+    );
+    """)
+
+# -----------------------------------------------------------------------------
+# Firebird
+# -----------------------------------------------------------------------------
+def fb_rows_after(cur_fb, spec: Dict[str, str], col: str, after: int,
+                  fetch_size: int = DEFAULT_FETCH) -> List[Tuple[int, Any]]:
+    """(código, descrição) com código > `after` (high-water mark)."""
+    cur_fb.execute(f"""
+        SELECT {spec['fb_key']}, {col} FROM {spec['fb_table']}
+        WHERE {spec['fb_key']} > ?
+        ORDER BY {spec['fb_key']}
+    """, (after,))
+    out: List[Tuple[int, Any]] = []
+    while True:
+        rows = cur_fb.fetchmany(fetch_size)
+        if not rows:
+            return out
+        out.extend((int(k), v) for k, v in rows if k is not None)
+
+def fb_rows_in_buckets(cur_fb, spec: Dict[str, str], col: str,
+                       buckets: Sequence[int]) -> List[Tuple[int, Any]]:
+    out: List[Tuple[int, Any]] = []
+    for b in buckets:
+        cur_fb.execute(f"""
+            SELECT {spec['fb_key']}, {col} FROM {spec['fb_table']}
+            WHERE {spec['fb_key']} BETWEEN ? AND ?
+        """, (b * BUCKET, (b + 1) * BUCKET - 1))
+        out.extend((int(k), v) for k, v in cur_fb.fetchall() if k is not None)
+    return out
+
+def fb_checksums(cur_fb, spec: Dict[str, str], col: str) -> Dict[int, Tuple[int, int]]:
+    """{faixa: (qtd, checksum)} calculados no Firebird (1 consulta agregada)."""
+    cur_fb.execute(f"""
+        SELECT CAST({spec['fb_key']} / {BUCKET} AS INTEGER) AS B,
+               COUNT(*),
+               SUM(MOD(HASH(COALESCE({col}, '')), {HASH_MOD}))
+        FROM {spec['fb_table']}
+        WHERE {spec['fb_key']} IS NOT NULL
+        GROUP BY CAST({spec['fb_key']} / {BUCKET} AS INTEGER)
+    """)
+    return {int(b): (int(n), int(h or 0)) for b, n, h in cur_fb.fetchall()}
+
+# -----------------------------------------------------------------------------
+# Postgres
+# -----------------------------------------------------------------------------
+def upsert_dim(pg_cur, dim: str, rows: List[Tuple[int, Any]]) -> List[int]:
+    """UPSERT (código, descrição); devolve os códigos inseridos ou alterados."""
+    if not rows:
+        return []
+    spec = DIMS[dim]
+    k, c = spec["pg_key"], spec["pg_col"]
+    rows = list(dict(rows).items())  # chave repetida quebraria o DO UPDATE
+    res = psycopg2.extras.execute_values(pg_cur, f"""
+        INSERT INTO {dim} AS t ({k}, {c}) VALUES %s
+        ON CONFLICT ({k}) DO UPDATE SET {c} = EXCLUDED.{c}, synced_at = now()
+        WHERE t.{c} IS DISTINCT FROM EXCLUDED.{c}
+        RETURNING t.{k}
+    """, rows, page_size=1000, fetch=True)
+    return [r[0] for r in res]
+
+def propagate(pg_cur, dim: str, codes: List[int]) -> List[int]:
+    """Atualiza pro_desc/cor_nome em op_item para `codes`; devolve as OPs afetadas."""
+    if not codes:
+        return []
+    spec = DIMS[dim]
+    k, c, ic = spec["pg_key"], spec["pg_col"], spec["item_col"]
+    pg_cur.execute(f"""
+        UPDATE op_item AS i SET {ic} = d.{c}
+        FROM {dim} d
+        WHERE i.{k} = d.{k} AND d.{k} = ANY(%s)
+          AND i.{ic} IS DISTINCT FROM d.{c}
+        RETURNING i.op_id
+    """, (codes,))
+    return sorted({r[0] for r in pg_cur.fetchall() if r[0] is not None})
+
+def load_dim_names(pg_cur) -> Dict[str, Dict[int, Any]]:
+    """{"produto": {código: descrição}, "cor": {código: nome}} para preencher itens localmente."""
+    out: Dict[str, Dict[int, Any]] = {}
+    for dim, spec in DIMS.items():
+        pg_cur.execute(f"SELECT {spec['pg_key']}, {spec['pg_col']} FROM {dim}")
+        out[dim] = dict(pg_cur.fetchall())
+    return out
+
+def apply_dim_names(items: List[Dict[str, Any]], names: Dict[str, Dict[int, Any]]):
+    """PRO_DESC/COR_NOME dos itens a partir das dimensões locais (itens lidos sem JOIN)."""
+    prod, cor = names.get("produto", {}), names.get("cor", {})
+    for it in items:
+        if it.get("PRO_DESC") is None and it.get("OPD_PRO_CODIGO") is not None:
+            it["PRO_DESC"] = prod.get(int(it["OPD_PRO_CODIGO"]))
+        if it.get("COR_NOME") is None and it.get("OPD_COR_CODIGO") is not None:
+            it["COR_NOME"] = cor.get(int(it["OPD_COR_CODIGO"]))
+
+# -----------------------------------------------------------------------------
+# Sync
+# -----------------------------------------------------------------------------
+def check_due(pg_cur, dim: str, every: float) -> bool:
+    pg_cur.execute("SELECT EXTRACT(EPOCH FROM now() - MIN(checked_at)) FROM etl_dim_bucket WHERE dim = %s", (dim,))
+    age = pg_cur.fetchone()[0]
+    return age is None or float(age) >= every
+
+def sync_dim(cur_fb, pg_cur, dim: str, col: str, check: bool,
+             stats: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Any]:
+    """
+    Sincroniza uma dimensão: novos códigos (high-water mark) e, se `check`,
+    conferência por checksum das faixas. Não faz commit.
+    """
+    spec = DIMS[dim]
+    k, c = spec["pg_key"], spec["pg_col"]
+    pg_cur.execute(f"SELECT COALESCE(MAX({k}), -1) FROM {dim}")
+    hwm = int(pg_cur.fetchone()[0])
+    changed = upsert_dim(pg_cur, dim, fb_rows_after(cur_fb, spec, col, hwm))
+    res: Dict[str, Any] = {"new": len(changed), "reread_buckets": 0, "updated": 0, "deleted": 0}
+
+    if check:
+        fb_sums = fb_checksums(cur_fb, spec, col)
+        pg_cur.execute("SELECT bucket, qtd, checksum FROM etl_dim_bucket WHERE dim = %s", (dim,))
+        known = {int(b): (int(n), int(h)) for b, n, h in pg_cur.fetchall()}
+        # faixa nova/alterada, ou que sumiu no Firebird
+        stale = sorted(b for b in set(fb_sums) | set(known) if fb_sums.get(b) != known.get(b))
+        if known and stale:
+            rows = fb_rows_in_buckets(cur_fb, spec, col, stale)
+            upd = upsert_dim(pg_cur, dim, rows)
+            changed += upd
+            res["updated"] = len(upd)
+            # exclusões: códigos das faixas relidas que não vieram do Firebird
+            alive = [code for code, _ in rows]
+            pg_cur.execute(f"""
+                DELETE FROM {dim}
+                WHERE ({k} / {BUCKET}) = ANY(%s) AND NOT ({k} = ANY(%s))
+            """, (stale, alive))
+            res["deleted"] = pg_cur.rowcount
+        res["reread_buckets"] = len(stale) if known else 0
+        pg_cur.execute("DELETE FROM etl_dim_bucket WHERE dim = %s", (dim,))
+        if fb_sums:
+            psycopg2.extras.execute_values(pg_cur, """
+                INSERT INTO etl_dim_bucket (dim, bucket, qtd, checksum) VALUES %s
+            """, [(dim, b, n, h) for b, (n, h) in fb_sums.items()], page_size=1000)
+
+    ops = propagate(pg_cur, dim, changed)
+    if dim == "cor" and ops:
+        derive_op_header(pg_cur, ops, stats)
+        record_op_history(pg_cur, ops, stats)  # cor_txt mudou: nova versão, na mesma transação
+    res["ops_touched"] = len(ops)
+    add_stats(stats, dim, inserted=res["new"], updated=res["updated"])
+    return res
+
+def sync_dims(cur_fb, pg_cur, schema: Dict[str, Any], check_every: float = 86400.0,
+              force_check: bool = False,
+              stats: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Sincroniza produto e cor (dimensões cuja coluna não foi detectada são puladas). Não faz commit."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for dim, spec in DIMS.items():
+        col = schema.get(spec["schema"])
+        if not col:
+            print(f"[AVISO] {spec['fb_table']}: coluna de descrição/nome não detectada; dimensão {dim} pulada.")
+            continue
+        t0 = time.perf_counter()
+        check = force_check or check_due(pg_cur, dim, check_every)
+        out[dim] = sync_dim(cur_fb, pg_cur, dim, col, check, stats)
+        out[dim]["checked"] = check
+        out[dim]["duration_s"] = round(time.perf_counter() - t0, 3)
+    return out
@@ -0,0 +1,199 @@
+# etl/etl_metrics.py
+# -----------------------------------------------------------------------------
+# Instrumentação dos scripts de ETL (04_copiar_janela, 05_sync_andamento_setor):
+#   - tempo por estágio (seleção, esquema, extração, transformação, carga, commit);
+#     nos modos concorrentes (--pipeline/--workers) é tempo OCUPADO por estágio,
+#     então a soma pode passar do tempo total;
+#   - round trips: execute/fetchmany/COPY contados por cursor (Firebird e Postgres);
+#   - linhas por tabela e linhas/s; pico de memória (RSS);
+#   - saída: resumo JSON e, opcionalmente, textfile do Prometheus
+#     (node_exporter --collector.textfile);
+#   - --profile: cProfile da execução (.prof; abra com snakeviz ou gere um
+#     flamegraph com flameprof).
+# -----------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import threading
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+try:
+    import resource  # Unix
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil  # opcional (pico de RSS no Windows)
+except ImportError:
+    psutil = None
+
+def new_metrics(job: str) -> Dict[str, Any]:
+    return {"job": job, "started_at": datetime.now().isoformat(timespec="seconds"),
+            "t0": time.perf_counter(), "lock": threading.Lock(),
+            "stages": {}, "calls": {}}
+
+@contextmanager
+def stage(m: Optional[Dict[str, Any]], name: str):
+    """Acumula o tempo do bloco no estágio `name` (no-op se m for None)."""
+    if m is None:
+        yield
+        return
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        with m["lock"]:
+            m["stages"][name] = m["stages"].get(name, 0.0) + dt
+
+def timed(it: Iterable[Any], m: Optional[Dict[str, Any]], name: str) -> Iterator[Any]:
+    """Itera contando o tempo gasto em cada next() no estágio `name` (ex.: leitura em streaming)."""
+    it = iter(it)
+    while True:
+        with stage(m, name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+def count_call(m: Optional[Dict[str, Any]], key: str, n: int = 1):
+    if m is None:
+        return
+    with m["lock"]:
+        m["calls"][key] = m["calls"].get(key, 0) + n
+
+class CountingCursor:
+    """Proxy de cursor (firebirdsql/psycopg2) que conta os round trips."""
+    _COUNTED = ("execute", "executemany", "fetchmany", "copy_expert")
+
+    def __init__(self, cur, m: Dict[str, Any], side: str):
+        self._cur, self._m, self._side = cur, m, side
+
+    def __getattr__(self, name):
+        attr = getattr(self._cur, name)
+        if name in self._COUNTED and callable(attr):
+            def wrapped(*a, **kw):
+                count_call(self._m, f"{self._side}_{name}")
+                return attr(*a, **kw)
+            return wrapped
+        return attr
+
+    def __iter__(self):
+        return iter(self._cur)
+
+def count_cursor(cur, m: Optional[Dict[str, Any]], side: str):
+    return cur if m is None else CountingCursor(cur, m, side)
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is not None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    return None
+
+def merge_metrics(dst: Dict[str, Any], src: Dict[str, Any]):
+    """Soma estágios/chamadas de um worker (ou do resumo dele) no coordenador."""
+    with dst["lock"]:
+        for k, v in src.get("stages", {}).items():
+            dst["stages"][k] = dst["stages"].get(k, 0.0) + v
+        for k, v in src.get("calls", {}).items():
+            dst["calls"][k] = dst["calls"].get(k, 0) + v
+
+def summary(m: Dict[str, Any], stats: Optional[Dict[str, Dict[str, int]]] = None,
+            extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Resumo serializável: tempos, round trips, linhas e linhas/s, pico de RSS."""
+    total = time.perf_counter() - m["t0"]
+    rows = {t: c["inserted"] + c["updated"] + c["unchanged"] for t, c in (stats or {}).items()}
+    calls = dict(m["calls"])
+    out = {
+        "job": m["job"],
+        "started_at": m["started_at"],
+        "total_s": round(total, 3),
+        "stages_s": {k: round(v, 3) for k, v in m["stages"].items()},
+        "fb_round_trips": sum(v for k, v in calls.items() if k.startswith("fb_")),
+        "pg_round_trips": sum(v for k, v in calls.items() if k.startswith("pg_")),
+        "calls": calls,
+        "rows": rows,
+        "rows_per_s": round(sum(rows.values()) / total, 1) if total > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if stats is not None:
+        out["stats"] = stats
+    out.update(extra or {})
+    return out
+
+def format_summary(s: Dict[str, Any]) -> str:
+    st = ", ".join(f"{k} {v}s" for k, v in s["stages_s"].items())
+    return (f"Tempo {s['total_s']}s ({st}); round trips FB {s['fb_round_trips']} / PG {s['pg_round_trips']}; "
+            f"{s['rows_per_s']} linhas/s; pico RSS {s['peak_rss_mb']} MB")
+
+def _write_atomic(path: str, text: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def write_json(s: Dict[str, Any], path: str):
+    _write_atomic(path, json.dumps(s, indent=2, default=str))
+
+def write_prometheus(s: Dict[str, Any], path: str):
+    """Textfile do Prometheus (métricas gauge com label job)."""
+    job = s["job"]
+    lines = [
+        "# TYPE gp_etl_duration_seconds gauge",
+        f'gp_etl_duration_seconds{{job="{job}"}} {s["total_s"]}',
+        "# TYPE gp_etl_stage_seconds gauge",
+        *[f'gp_etl_stage_seconds{{job="{job}",stage="{k}"}} {v}' for k, v in s["stages_s"].items()],
+        "# TYPE gp_etl_round_trips gauge",
+        f'gp_etl_round_trips{{job="{job}",db="firebird"}} {s["fb_round_trips"]}',
+        f'gp_etl_round_trips{{job="{job}",db="postgres"}} {s["pg_round_trips"]}',
+        "# TYPE gp_etl_rows gauge",
+        *[f'gp_etl_rows{{job="{job}",table="{k}"}} {v}' for k, v in s["rows"].items()],
+        "# TYPE gp_etl_rows_per_second gauge",
+        f'gp_etl_rows_per_second{{job="{job}"}} {s["rows_per_s"] or 0}',
+        "# TYPE gp_etl_last_run_timestamp_seconds gauge",
+        f'gp_etl_last_run_timestamp_seconds{{job="{job}"}} {int(time.time())}',
+    ]
+    if s.get("peak_rss_mb") is not None:
+        lines += ["# TYPE gp_etl_peak_rss_megabytes gauge",
+                  f'gp_etl_peak_rss_megabytes{{job="{job}"}} {s["peak_rss_mb"]}']
+    _write_atomic(path, "\n".join(lines) + "\n")
+
+def emit(s: Dict[str, Any], json_path: Optional[str] = None, prom_path: Optional[str] = None):
+    """Imprime o resumo e grava JSON/textfile quando pedidos."""
+    print(format_summary(s))
+    if json_path:
+        write_json(s, json_path)
+    if prom_path:
+        write_prometheus(s, prom_path)
+
+@contextmanager
+def profiled(path: Optional[str]):
+    """cProfile do bloco, gravado em `path` (.prof). No-op sem path."""
+    if not path:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(path)
+        print(f"Profile gravado em {path} (ex.: snakeviz {path})")
+
+def add_cli_args(ap):
+    """--metrics-json / --prom-textfile / --profile (mesmas opções nos scripts)."""
+    ap.add_argument("--metrics-json", type=str, default=None,
+                    help="Grava o resumo da execução (tempos por estágio, round trips, linhas/s, RSS) em JSON.")
+    ap.add_argument("--prom-textfile", type=str, default=None,
+                    help="Grava as métricas no formato textfile do Prometheus (node_exporter).")
+    ap.add_argument("--profile", type=str, default=None,
+                    help="Roda sob cProfile e grava o .prof neste caminho.")
@@ -0,0 +1,201 @@
+# etl/fb_driver.py
+# -----------------------------------------------------------------------------
+# Camada fina sobre o driver do Firebird usado pelo ETL:
+#   - firebirdsql (Python puro; padrão histórico dos scripts) ou firebird-driver
+#     (fbclient nativo; o do requirements.txt e do 01_conectar_e_listar.py),
+#     escolhido por FIREBIRD_DRIVER ou pelo parâmetro `driver`;
+#   - comandos PREPARADOS reaproveitados: o cursor guarda os últimos
+#     FIREBIRD_STMT_CACHE comandos por texto SQL, então a consulta por OP (e as
+#     IN-lists de mesmo tamanho) é preparada uma vez e só executada depois;
+#   - transação SOMENTE LEITURA (o ETL nunca grava no banco da Microsys):
+#     read committed (padrão) ou snapshot, sem espera por lock (no wait);
+#   - FIREBIRD_FETCH_SIZE: linhas por fetchmany() sem tamanho (arraysize);
+#   - FIREBIRD_WIRE_COMPRESSION=1: compressão do protocolo (Firebird 3+, só no
+#     firebird-driver; o firebirdsql não implementa);
+#   - fake_db: banco sintético do benchmark (fb_fake.py, importado só nesse
+#     caso), sem preparo.
+# Limitações do firebirdsql: sem TPB próprio, o snapshot é leitura/escrita com
+# espera (ISOLATION_LEVEL_REPEATABLE_READ); o read committed é o _RO dele.
+# Para medir qual combinação é mais rápida no seu servidor: bench_fb_driver.py.
+# -----------------------------------------------------------------------------
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+try:
+    import firebirdsql
+except ImportError:
+    firebirdsql = None
+
+try:
+    from firebird import driver as fbdriver  # firebird-driver
+except ImportError:
+    fbdriver = None
+
+DRIVERS = ("firebirdsql", "firebird-driver")
+TX_MODES = ("read_committed", "snapshot")
+
+# compressão do protocolo já aplicada na configuração (global) do firebird-driver
+_wire_compression = False
+
+def env_options() -> Dict[str, Any]:
+    """Configuração da camada a partir do .env (já carregado pelo script)."""
+    return {
+        "driver": os.getenv("FIREBIRD_DRIVER", "firebirdsql"),
+        "tx": os.getenv("FIREBIRD_TX", "read_committed"),
+        "fetch_size": int(os.getenv("FIREBIRD_FETCH_SIZE", "2000")),
+        "wire_compression": os.getenv("FIREBIRD_WIRE_COMPRESSION", "0") == "1",
+        "stmt_cache": int(os.getenv("FIREBIRD_STMT_CACHE", "64")),
+    }
+
+# -----------------------------------------------------------------------------
+# Cursor/conexão com cache de comandos preparados
+# -----------------------------------------------------------------------------
+class FbCursor:
+    """Cursor DB-API (execute/fetch*/description) que prepara cada SQL uma vez."""
+
+    def __init__(self, conn: "FbConnection", cur):
+        self._conn, self._cur = conn, cur
+        self._stmts: "OrderedDict[str, Any]" = OrderedDict()
+        self.arraysize = conn.fetch_size
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self) -> int:
+        return getattr(self._cur, "rowcount", -1)
+
+    def _prepared(self, sql: str):
+        stmt = self._stmts.get(sql)
+        if stmt is not None:
+            self._stmts.move_to_end(sql)
+            self._conn.stats["reused"] += 1
+            return stmt
+        self._conn.stats["prepared"] += 1
+        stmt = self._cur.prep(sql) if self._conn.driver == "firebirdsql" else self._cur.prepare(sql)
+        self._stmts[sql] = stmt
+        if len(self._stmts) > self._conn.stmt_cache:
+            _free(self._stmts.popitem(last=False)[1])
+        return stmt
+
+    def execute(self, sql: str, params: Sequence[Any] = ()):
+        if self._conn.stmt_cache > 0 and self._conn.driver in DRIVERS:
+            self._cur.execute(self._prepared(sql), list(params))
+        else:
+            self._cur.execute(sql, list(params))
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self._cur.fetchmany(size or self.arraysize)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        for stmt in self._stmts.values():
+            _free(stmt)
+        self._stmts.clear()
+        self._cur.close()
+
+def _free(stmt: Any):
+    """Libera o comando preparado no servidor (free no firebird-driver, close no firebirdsql)."""
+    fn = getattr(stmt, "free", None) or getattr(stmt, "close", None)
+    if fn is not None:
+        try:
+            fn()
+        except Exception:
+            pass
+
+class FbConnection:
+    def __init__(self, raw, driver: str, tx: str, fetch_size: int, stmt_cache: int):
+        self._raw, self.driver, self.tx = raw, driver, tx
+        self.fetch_size, self.stmt_cache = fetch_size, stmt_cache
+        self.stats = {"prepared": 0, "reused": 0}
+
+    def cursor(self) -> FbCursor:
+        return FbCursor(self, self._raw.cursor())
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+# -----------------------------------------------------------------------------
+# Conexão
+# -----------------------------------------------------------------------------
+def connect(host: str, port: int, database: str, user: str, password: str, charset: str,
+            snapshot: bool = False, fake_db: Optional[str] = None, **opts) -> FbConnection:
+    """
+    Abre a conexão pela camada. `opts` sobrescreve env_options() (driver, tx,
+    fetch_size, wire_compression, stmt_cache); snapshot=True força tx="snapshot".
+    """
+    o = dict(env_options(), **opts)
+    tx = "snapshot" if snapshot else o["tx"]
+    if tx not in TX_MODES:
+        raise SystemExit(f"FIREBIRD_TX inválido: {tx} (use {' ou '.join(TX_MODES)})")
+    if fake_db:
+        import fb_fake  # só no benchmark/testes
+        return FbConnection(fb_fake.connect(fake_db), "fake", tx, o["fetch_size"], 0)
+    if o["driver"] == "firebird-driver":
+        raw = _connect_fbdriver(host, port, database, user, password, charset, tx, o["wire_compression"])
+    elif o["driver"] == "firebirdsql":
+        raw = _connect_firebirdsql(host, port, database, user, password, charset, tx, o["wire_compression"])
+    else:
+        raise SystemExit(f"FIREBIRD_DRIVER inválido: {o['driver']} (use {' ou '.join(DRIVERS)})")
+    return FbConnection(raw, o["driver"], tx, o["fetch_size"], o["stmt_cache"])
+
+def _connect_firebirdsql(host, port, database, user, password, charset, tx, wire_compression):
+    if firebirdsql is None:
+        raise SystemExit("Driver firebirdsql não instalado (pip install firebirdsql) ou use FIREBIRD_DRIVER=firebird-driver.")
+    if wire_compression:
+        print("[AVISO] firebirdsql não suporta compressão do protocolo; FIREBIRD_WIRE_COMPRESSION ignorado.")
+    if tx == "snapshot":
+        level = firebirdsql.ISOLATION_LEVEL_REPEATABLE_READ
+    else:
+        level = getattr(firebirdsql, "ISOLATION_LEVEL_READ_COMMITED_RO", firebirdsql.ISOLATION_LEVEL_READ_COMMITED)
+    return firebirdsql.connect(host=host, port=port, database=database, user=user, password=password,
+                               charset=charset, isolation_level=level)
+
+def _set_wire_compression(on: bool):
+    """
+    Compressão do protocolo no firebird-driver. driver_config vale para o processo
+    todo: é ajustado só na primeira conexão com compressão (ou quando o valor
+    pedido muda, como no bench_fb_driver), não a cada connect().
+    """
+    global _wire_compression
+    if on == _wire_compression:
+        return
+    try:
+        fbdriver.driver_config.db_defaults.config.value = f"WireCompression = {'true' if on else 'false'}"
+    except AttributeError as e:
+        print(f"[AVISO] não foi possível ajustar a compressão do protocolo: {e}")
+        return
+    _wire_compression = on
+
+def _connect_fbdriver(host, port, database, user, password, charset, tx, wire_compression):
+    if fbdriver is None:
+        raise SystemExit("Driver firebird-driver não instalado (pip install -r etl\\requirements.txt).")
+    _set_wire_compression(wire_compression)
+    raw = fbdriver.connect(f"{host}/{port}:{database}", user=user, password=password, charset=charset)
+    isolation = (fbdriver.Isolation.SNAPSHOT if tx == "snapshot"
+                 else fbdriver.Isolation.READ_COMMITTED_RECORD_VERSION)
+    # somente leitura, sem espera por lock (lock_timeout=0)
+    raw.main_transaction.default_tpb = fbdriver.tpb(isolation, lock_timeout=0,
+                                                     access_mode=fbdriver.TraAccessMode.READ)
+    return raw
@@ -0,0 +1,252 @@
+# etl/fb_fake.py
+# -----------------------------------------------------------------------------
+# Firebird "de mentira" para benchmark local (sem o servidor da Microsys):
+# - Banco SQLite com as mesmas tabelas que o ETL lê: ORDEM_PRODUCAO,
+#   ORDEM_PRODUCAO_ITENS, PRODUTOS, CORES e PCP_ORP_ROTEIRO, mais as visões de
+#   catálogo RDB$RELATIONS / RDB$RELATION_FIELDS usadas pelo fb_schema;
+# - connect() devolve conexão/cursor no formato do firebirdsql (placeholders ?,
+#   nomes de coluna em UPPER, fetchmany) e traduz o que o SQLite não tem:
+#   SELECT FIRST n, HASH() e MOD();
+# - generate() cria dados sintéticos com semente fixa (mesma semente = mesmo
+#   banco): distribuição de itens por OP, status, datas e etapas do roteiro
+#   próximas das da fábrica.
+# Os scripts usam o fake quando FIREBIRD_FAKE_DB aponta para o arquivo gerado
+# (ver bench_etl.py).
+# -----------------------------------------------------------------------------
+import os
+import re
+import random
+import sqlite3
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+BASE_DATE = date(2025, 1, 1)   # datas sintéticas: BASE_DATE .. BASE_DATE + DAYS
+DAYS = 365
+FILIAIS = (1, 2)
+
+# status, peso (OPs finalizadas/canceladas ficam fechadas e fora da janela)
+STATUS_MIX = [("AA", 30), ("IN", 30), ("EP", 12), ("SS", 3), ("FF", 20), ("CC", 5)]
+
+TABLES = {
+    "ORDEM_PRODUCAO": [
+        ("ORP_ID", "INTEGER PRIMARY KEY"), ("ORP_SERIE", "INTEGER"), ("EMP_FIL_CODIGO", "INTEGER"),
+        ("ORP_DESCRICAO", "VARCHAR(100)"), ("ORP_PDV_NUMERO", "INTEGER"),
+        ("ORP_DATA", "DATE"), ("ORP_DT_PREV_INICIO", "DATE"), ("ORP_DT_VALIDADE", "DATE"),
+        ("ORP_STS_CODIGO", "VARCHAR(2)"), ("ORP_STS_ID", "INTEGER"),
+        ("ORP_QTDE_PRODUCAO", "NUMERIC"), ("ORP_QTDE_PRODUZIDAS", "NUMERIC"), ("ORP_QTDE_SALDO", "NUMERIC"),
+        ("ORP_FECHADO", "INTEGER"),
+    ],
+    "ORDEM_PRODUCAO_ITENS": [
+        ("OPD_ID", "INTEGER PRIMARY KEY"), ("OPD_ORP_ID", "INTEGER"), ("OPD_ORP_SERIE", "INTEGER"),
+        ("OPD_LOTE", "VARCHAR(20)"), ("OPD_PRO_CODIGO", "INTEGER"), ("OPD_COR_CODIGO", "INTEGER"),
+        ("OPD_QUANTIDADE", "NUMERIC"), ("OPD_QTD_PRODUZIDAS", "NUMERIC"), ("OPD_QTDE_SALDO", "NUMERIC"),
+    ],
+    "PRODUTOS": [("PRO_CODIGO", "INTEGER PRIMARY KEY"), ("PRO_DESCRICAO", "VARCHAR(200)")],
+    "CORES": [("COR_CODIGO", "INTEGER PRIMARY KEY"), ("COR_NOME", "VARCHAR(200)")],
+    "PCP_ORP_ROTEIRO": [
+        ("OPR_ID", "INTEGER PRIMARY KEY"), ("OPR_ORP_SERIE", "INTEGER"), ("OPR_ATV_ID", "INTEGER"),
+        ("OPR_ATV_SEQUENCIA", "INTEGER"), ("OPR_ATV_DT_INICIO", "TIMESTAMP"),
+        ("OPR_ATV_DT_FIM", "TIMESTAMP"), ("OPR_ATV_STATUS", "VARCHAR(2)"),
+    ],
+}
+INDEXES = [
+    "CREATE INDEX IX_ORP_VALIDADE ON ORDEM_PRODUCAO (EMP_FIL_CODIGO, ORP_DT_VALIDADE)",
+    "CREATE INDEX IX_OPD_ORP_ID ON ORDEM_PRODUCAO_ITENS (OPD_ORP_ID)",
+    "CREATE INDEX IX_OPD_ORP_SERIE ON ORDEM_PRODUCAO_ITENS (OPD_ORP_SERIE)",
+    "CREATE INDEX IX_OPR_ORP_SERIE ON PCP_ORP_ROTEIRO (OPR_ORP_SERIE)",
+]
+
+# Setores do roteiro (ATV_ID) na ordem típica de fabricação
+SETORES = [10, 20, 30, 40, 50, 60, 70, 80]
+
+# -----------------------------------------------------------------------------
+# Tipos (datas como no firebirdsql: date/datetime)
+# -----------------------------------------------------------------------------
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(sep=" "))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+
+def _fb_hash(v: Any) -> int:
+    return zlib.crc32(str(v).encode("utf-8")) if v is not None else 0
+
+def _fb_mod(a: Any, b: Any) -> Optional[int]:
+    return None if a is None or b is None else int(a) % int(b)
+
+# -----------------------------------------------------------------------------
+# Conexão no formato do firebirdsql
+# -----------------------------------------------------------------------------
+_FIRST = re.compile(r"^\s*SELECT\s+FIRST\s+(\d+)\s", re.I)
+
+def translate(sql: str) -> str:
+    """Dialeto Firebird -> SQLite (só o que o ETL usa)."""
+    m = _FIRST.match(sql)
+    if m:
+        sql = "SELECT " + sql[m.end():] + f"\nLIMIT {m.group(1)}"
+    return sql
+
+class FakeCursor:
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+
+    @property
+    def description(self):
+        d = self._cur.description
+        return None if d is None else [(c[0].upper(),) + tuple(c[1:]) for c in d]
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    def execute(self, sql: str, params: Sequence[Any] = ()):
+        self._cur.execute(translate(sql), tuple(params))
+        return self
+
+    def executemany(self, sql: str, seq: Sequence[Sequence[Any]]):
+        self._cur.executemany(translate(sql), [tuple(p) for p in seq])
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def close(self):
+        self._cur.close()
+
+class FakeConnection:
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise SystemExit(f"Erro: banco fake {path} não existe (gere com bench_etl.py).")
+        # threads do --pipeline usam a conexão aberta na thread principal
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._conn.create_function("HASH", 1, _fb_hash, deterministic=True)
+        self._conn.create_function("MOD", 2, _fb_mod, deterministic=True)
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+def connect(path: str, **_kw) -> FakeConnection:
+    """Mesma assinatura útil do firebirdsql.connect (isolation_level etc. são ignorados)."""
+    return FakeConnection(path)
+
+# -----------------------------------------------------------------------------
+# Geração dos dados
+# -----------------------------------------------------------------------------
+def _create_schema(db: sqlite3.Connection):
+    for t, cols in TABLES.items():
+        db.execute(f"CREATE TABLE {t} ({', '.join(f'{c} {ty}' for c, ty in cols)})")
+    for ddl in INDEXES:
+        db.execute(ddl)
+    db.execute("""CREATE TABLE rdb$relations (
+        rdb$relation_name CHAR(31), rdb$system_flag INTEGER, rdb$view_blr BLOB)""")
+    db.execute("""CREATE TABLE rdb$relation_fields (
+        rdb$relation_name CHAR(31), rdb$field_name CHAR(31), rdb$field_position INTEGER)""")
+    for t, cols in TABLES.items():
+        db.execute("INSERT INTO rdb$relations VALUES (?, 0, NULL)", (t,))
+        db.executemany("INSERT INTO rdb$relation_fields VALUES (?, ?, ?)",
+                       [(t, c, i) for i, (c, _) in enumerate(cols)])
+
+def _items_per_op(rnd: random.Random) -> int:
+    """Cauda longa: a maioria das OPs tem poucos itens, algumas têm dezenas."""
+    return max(1, min(120, int(rnd.lognormvariate(1.7, 0.8))))
+
+def _roteiro(rnd: random.Random, serie: int, sts: str, start: date, next_id: int) -> List[tuple]:
+    n = rnd.randint(3, 7)
+    setores = sorted(rnd.sample(SETORES, n))
+    done = n if sts in ("FF", "CC") else (0 if sts == "AA" else rnd.randint(0, n - 1))
+    rows = []
+    t = datetime.combine(start, datetime.min.time()) + timedelta(hours=7)
+    for seq, setor in enumerate(setores, start=1):
+        ini = fim = None
+        status = "AA"
+        if seq <= done:
+            ini, fim, status = t, t + timedelta(hours=rnd.randint(2, 30)), "FF"
+            t = fim
+        elif seq == done + 1 and sts in ("IN", "EP", "SS"):
+            ini, status = t, "IN"
+        rows.append((next_id + seq - 1, serie, setor, seq, ini, fim, status))
+    return rows
+
+def generate(path: str, n_items: int, seed: int = 42, n_produtos: int = 5000,
+             n_cores: int = 300, batch: int = 20000) -> Dict[str, int]:
+    """
+    Gera (sobrescrevendo) um banco fake com ~`n_items` itens de OP.
+    Retorna as contagens por tabela.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rnd = random.Random(seed)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    _create_schema(db)
+
+    db.executemany("INSERT INTO PRODUTOS VALUES (?, ?)",
+                   [(c, f"PRODUTO {c:05d} {rnd.choice(['PORTA', 'PAINEL', 'GAVETA', 'TAMPO', 'LATERAL'])}")
+                    for c in range(1, n_produtos + 1)])
+    db.executemany("INSERT INTO CORES VALUES (?, ?)",
+                   [(c, f"COR {c:03d}") for c in range(1, n_cores + 1)])
+
+    status_codes = [s for s, _ in STATUS_MIX]
+    status_weights = [w for _, w in STATUS_MIX]
+    counts = {"ORDEM_PRODUCAO": 0, "ORDEM_PRODUCAO_ITENS": 0, "PCP_ORP_ROTEIRO": 0,
+              "PRODUTOS": n_produtos, "CORES": n_cores}
+    ops: List[tuple] = []; items: List[tuple] = []; rot: List[tuple] = []
+
+    def flush():
+        db.executemany(f"INSERT INTO ORDEM_PRODUCAO VALUES ({','.join('?' * 14)})", ops)
+        db.executemany(f"INSERT INTO ORDEM_PRODUCAO_ITENS VALUES ({','.join('?' * 9)})", items)
+        db.executemany(f"INSERT INTO PCP_ORP_ROTEIRO VALUES ({','.join('?' * 7)})", rot)
+        ops.clear(); items.clear(); rot.clear()
+
+    op_id = 0; opd_id = 0; opr_id = 1
+    while counts["ORDEM_PRODUCAO_ITENS"] < n_items:
+        op_id += 1
+        serie = 100000 + op_id
+        sts = rnd.choices(status_codes, status_weights)[0]
+        emissao = BASE_DATE + timedelta(days=rnd.randrange(DAYS))
+        prev = emissao + timedelta(days=rnd.randint(1, 20))
+        validade = prev + timedelta(days=rnd.randint(5, 45))
+        n = min(_items_per_op(rnd), n_items - counts["ORDEM_PRODUCAO_ITENS"])
+        # ~2% das OPs com itens ligados só pela série (OPD_ORP_ID nulo), como em bases antigas
+        link = None if rnd.random() < 0.02 else op_id
+        tot = prod = 0.0
+        for _ in range(n):
+            opd_id += 1
+            qtd = float(rnd.choice([1, 2, 4, 6, 10, 12, 20, 50]))
+            feito = qtd if sts == "FF" else (0.0 if sts == "AA" else float(rnd.randint(0, int(qtd))))
+            items.append((opd_id, link, serie, f"L{op_id % 997:03d}", rnd.randint(1, n_produtos),
+                          rnd.randint(1, n_cores), qtd, feito, qtd - feito))
+            tot += qtd; prod += feito
+        ops.append((op_id, serie, rnd.choice(FILIAIS), f"OP {serie}", rnd.randint(1, 50000),
+                    emissao, prev, validade, sts, status_codes.index(sts) + 1,
+                    tot, prod, tot - prod, 1 if sts in ("FF", "CC") else 0))
+        r = _roteiro(rnd, serie, sts, prev, opr_id)
+        rot.extend(r); opr_id += len(r)
+        counts["ORDEM_PRODUCAO"] += 1
+        counts["ORDEM_PRODUCAO_ITENS"] += n
+        counts["PCP_ORP_ROTEIRO"] += len(r)
+        if len(items) >= batch:
+            flush()
+    flush()
+    db.commit()
+    db.close()
+    return counts
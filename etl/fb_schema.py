@@ -0,0 +1,197 @@
+# etl/fb_schema.py
+# -----------------------------------------------------------------------------
+# Detecção ÚNICA do esquema do Firebird usada pelos scripts de ETL:
+#   - PRODUTOS_DESC: coluna de descrição em PRODUTOS
+#   - CORES_NOME:    coluna de nome da cor em CORES
+#   - ROTEIRO:       tabela/colunas do roteiro {TABLE, OP_NUM, SETOR_COD, SEQ,
+#                    DTINI, DTFIM, STATUS} (as três últimas podem ser None)
+#
+# O resultado fica em cache num arquivo local (etl/.fb_schema_cache.json),
+# chaveado pela origem (host/porta/banco) e por um fingerprint do catálogo
+# (checksum de RDB$RELATION_FIELDS das tabelas envolvidas):
+#   - dentro do TTL (FB_SCHEMA_CACHE_TTL, segundos; padrão 3600): zero consultas
+#     de catálogo;
+#   - depois do TTL: 1 consulta (fingerprint); só detecta de novo se mudou.
+# Para forçar nova detecção, apague o arquivo de cache.
+#
+# Overrides manuais (opcional): etl/fb_schema_overrides.json (ou FB_SCHEMA_OVERRIDES)
+#   {"PRODUTOS_DESC": "PRO_DESCRICAO", "CORES_NOME": "COR_NOME",
+#    "ROTEIRO": {"TABLE": "PCP_ORP_ROTEIRO", "OP_NUM": "OPR_ORP_SERIE"}}
+# -----------------------------------------------------------------------------
+import os, re, json, time, hashlib, threading
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, ".fb_schema_cache.json")
+DEFAULT_OVERRIDES_PATH = os.path.join(BASE_DIR, "fb_schema_overrides.json")
+
+ROTEIRO_CANDIDATES = ["PCP_APTO_ROTEIRO", "PCP_ORP_ROTEIRO", "PCP_ROTEIRO", "ROTEIRO"]
+FINGERPRINT_TABLES = ["PRODUTOS", "CORES"] + ROTEIRO_CANDIDATES
+
+# Cache em memória (por processo): daemon/workers não releem nem o arquivo
+_MEMO: Dict[str, Dict[str, Any]] = {}
+_LOCK = threading.Lock()
+
+# -----------------------------------------------------------------------------
+# Catálogo
+# -----------------------------------------------------------------------------
+def list_user_tables(cur) -> List[str]:
+    cur.execute("""
+        SELECT TRIM(r.rdb$relation_name)
+        FROM rdb$relations r
+        WHERE r.rdb$system_flag = 0
+          AND r.rdb$view_blr IS NULL
+        ORDER BY 1
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+def list_columns(cur, table: str) -> List[str]:
+    """Colunas de uma tabela de usuário (em UPPER, na ordem física)."""
+    cur.execute("""
+        SELECT TRIM(rf.rdb$field_name)
+        FROM rdb$relation_fields rf
+        WHERE rf.rdb$relation_name = ?
+        ORDER BY rf.rdb$field_position
+    """, (table.upper(),))
+    return [row[0].upper() for row in cur.fetchall()]
+
+def pick_col(cols: List[str], preferred: List[str], patterns: List[re.Pattern]) -> Optional[str]:
+    """Primeiro nome preferido presente; senão, a primeira coluna que bater num regex."""
+    upp = [c.upper() for c in cols]
+    for p in preferred:
+        if p.upper() in upp:
+            return p.upper()
+    for rx in patterns:
+        for c in upp:
+            if rx.search(c):
+                return c
+    return None
+
+def catalog_fingerprint(cur) -> str:
+    """Checksum das colunas (nome/posição) das tabelas que a detecção examina."""
+    cur.execute(f"""
+        SELECT TRIM(rf.rdb$relation_name), TRIM(rf.rdb$field_name), rf.rdb$field_position
+        FROM rdb$relation_fields rf
+        WHERE rf.rdb$relation_name IN ({','.join(['?'] * len(FINGERPRINT_TABLES))})
+        ORDER BY 1, 3, 2
+    """, tuple(FINGERPRINT_TABLES))
+    h = hashlib.sha1()
+    for rel, field, pos in cur.fetchall():
+        h.update(f"{rel}.{field}.{pos};".encode("utf-8"))
+    return h.hexdigest()
+
+# -----------------------------------------------------------------------------
+# Detecção
+# -----------------------------------------------------------------------------
+def detect_product_desc_column(cur) -> str:
+    """PRO_DESCRICAO, PRO_DESCR, DESCRICAO, DESCR... ("" se não achar)."""
+    return pick_col(list_columns(cur, "PRODUTOS"), [], [
+        re.compile(r"^PRO_?DESCR", re.I),
+        re.compile(r"DESCR", re.I),
+    ]) or ""
+
+def detect_color_name_column(cur) -> str:
+    """COR_NOME, COR_DESCRICAO, NOME, DESCRICAO... ("" se não achar)."""
+    return pick_col(list_columns(cur, "CORES"), [], [
+        re.compile(r"^COR_?(NOME|DESCR)", re.I),
+        re.compile(r"^(NOME|DESCR).*", re.I),
+    ]) or ""
+
+def detect_roteiro(cur) -> Optional[Dict[str, Optional[str]]]:
+    """Tabela/colunas do roteiro (PCP_APTO_ROTEIRO, PCP_ORP_ROTEIRO, PCP_ROTEIRO, ROTEIRO)."""
+    tabs = list_user_tables(cur)
+    for t in ROTEIRO_CANDIDATES:
+        if t not in tabs:
+            continue
+        cols = list_columns(cur, t)
+        opnum = pick_col(cols,
+            ["OPR_ORP_NUMERO","APR_ORP_NUMERO","OPR_ORP_SERIE","APR_ORP_SERIE","ORP_NUMERO","ORP_SERIE","OPR_ORP_ID","APR_ORP_ID"],
+            [re.compile(r"(^|_)ORP_?(NUM|NUMERO|SERIE|ID)$", re.I)]
+        )
+        setor = pick_col(cols,
+            ["OPR_ATV_ID","APR_ATV_ID","OPR_SET_CODIGO","APR_SET_CODIGO","ATV_ID","ATV_CODIGO","SET_CODIGO","SETOR_CODIGO"],
+            [re.compile(r"ATV.*(ID|COD)", re.I), re.compile(r"SET.*COD", re.I)]
+        )
+        seq   = pick_col(cols,
+            ["OPR_ATV_SEQUENCIA","APR_ATV_SEQUENCIA","ATV_SEQUENCIA","SEQUENCIA","ORDEM","OPR_SEQ"],
+            [re.compile(r"SEQ", re.I), re.compile(r"ORDEM", re.I)]
+        )
+        start = pick_col(cols,
+            ["OPR_ATV_DT_INICIO","APR_ATV_DT_INICIO","DT_INICIO","DATA_INICIO","OPR_DT_INICIO","APR_DT_INICIO","INICIO","DTINI"],
+            [re.compile(r"INI(CIO)?", re.I)]
+        )
+        end   = pick_col(cols,
+            ["OPR_ATV_DT_FIM","APR_ATV_DT_FIM","DT_FIM","DATA_FIM","OPR_DT_FIM","APR_DT_FIM","FINAL","CONCLUSAO","DTFIM"],
+            [re.compile(r"(FIM|FINAL|CONCL)", re.I)]
+        )
+        stat  = pick_col(cols,
+            ["OPR_ATV_STATUS","APR_ATV_STATUS","OPR_STATUS","APR_STATUS","STATUS","SITUACAO","IND_REALIZACAO","OPR_IND_REALIZACAO"],
+            [re.compile(r"STATUS|SITU|IND", re.I)]
+        )
+        if opnum and setor and seq:
+            return {"TABLE": t, "OP_NUM": opnum, "SETOR_COD": setor, "SEQ": seq,
+                    "DTINI": start, "DTFIM": end, "STATUS": stat}
+    return None
+
+def detect_all(cur) -> Dict[str, Any]:
+    return {
+        "PRODUTOS_DESC": detect_product_desc_column(cur),
+        "CORES_NOME": detect_color_name_column(cur),
+        "ROTEIRO": detect_roteiro(cur),
+    }
+
+# -----------------------------------------------------------------------------
+# Cache + overrides
+# -----------------------------------------------------------------------------
+def _read_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path: str, data: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def apply_overrides(info: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(info)
+    for k in ("PRODUTOS_DESC", "CORES_NOME"):
+        if overrides.get(k) is not None:
+            out[k] = str(overrides[k]).upper()
+    if overrides.get("ROTEIRO"):
+        rot = dict(out.get("ROTEIRO") or {})
+        rot.update({k: (str(v).upper() if v else None) for k, v in overrides["ROTEIRO"].items()})
+        out["ROTEIRO"] = rot if all(rot.get(k) for k in ("TABLE", "OP_NUM", "SETOR_COD", "SEQ")) else None
+    return out
+
+def resolve_schema(cur, source: str, cache_path: Optional[str] = None,
+                   overrides_path: Optional[str] = None, ttl: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Mapeamentos de PRODUTOS/CORES/roteiro para a origem `source` (ex.: "host:3050/C:\\BASE.FDB"),
+    usando memória -> arquivo de cache (TTL + fingerprint) -> detecção completa.
+    """
+    cache_path = cache_path or os.getenv("FB_SCHEMA_CACHE", DEFAULT_CACHE_PATH)
+    overrides_path = overrides_path or os.getenv("FB_SCHEMA_OVERRIDES", DEFAULT_OVERRIDES_PATH)
+    ttl = float(os.getenv("FB_SCHEMA_CACHE_TTL", "3600")) if ttl is None else ttl
+
+    with _LOCK:
+        now = time.time()
+        entry = _MEMO.get(source) or _read_json(cache_path).get(source)
+        fresh = bool(entry) and now - float(entry.get("checked_at", 0)) < ttl
+        if not fresh:
+            fp = catalog_fingerprint(cur)
+            if not entry or entry.get("fingerprint") != fp:
+                entry = {"fingerprint": fp, "info": detect_all(cur)}
+            entry["checked_at"] = now
+            cache = _read_json(cache_path)
+            cache[source] = entry
+            try:
+                _write_json(cache_path, cache)
+            except OSError as e:
+                print(f"[AVISO] não foi possível gravar o cache de esquema ({cache_path}): {e}")
+        _MEMO[source] = entry
+
+    return apply_overrides(entry["info"], _read_json(overrides_path))
@@ -0,0 +1,130 @@
+# etl/fb_snapshot.py
+# -----------------------------------------------------------------------------
+# Cache local (Parquet, zstd) da extração CRUA do Firebird:
+#   - 04_copiar_janela --snapshot-dir: cada bloco extraído (fb_extract) é gravado
+#     como está, ANTES da transformação — cabeçalhos, itens e roteiro;
+#   - 04_copiar_janela --from-snapshot: recarrega o Postgres só desses arquivos
+#     (transformação + gravação normais, sem nenhuma consulta ao Firebird);
+#   - snapshot_diff.py: compara dois snapshots (OPs/itens/etapas novos,
+#     removidos e alterados).
+# Layout (partição pela data da extração):
+#   <raiz>/dt=YYYY-MM-DD/run=HHMMSS-ffffff[-wK]/part-00001.{op,op_item,roteiro}.parquet
+#                                               manifest.json
+# O manifest guarda origem, filial, chave da janela, esquema detectado (roteiro,
+# necessário para andamento_setor na recarga) e a lista de partes. Uma pasta de
+# execução só é lida na recarga se tiver manifest (execução terminada).
+# Requer pyarrow (opcional: pip install pyarrow); sem ele, só estas opções falham.
+# -----------------------------------------------------------------------------
+import os
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from fb_extract import Record
+
+TABLES = ("op", "op_item", "roteiro")
+OP_KEY = "_ORP_ID"  # ORP_ID do pacote nas linhas de itens/roteiro (o item pode vir pela série)
+MANIFEST = "manifest.json"
+COMPRESSION = os.getenv("ETL_SNAPSHOT_COMPRESSION", "zstd")
+
+def require_pyarrow():
+    if pa is None:
+        raise SystemExit("Snapshots exigem pyarrow (pip install pyarrow).")
+
+def _json_default(o):
+    return str(o)
+
+# -----------------------------------------------------------------------------
+# Gravação
+# -----------------------------------------------------------------------------
+def open_snapshot(root: str, meta: Dict[str, Any], suffix: str = "") -> Dict[str, Any]:
+    """
+    Abre a pasta de uma execução em `root` (dt=<hoje>/run=<hora>[suffix]).
+    `meta` vai para o manifest (filial, run_key, source, schema...).
+    """
+    require_pyarrow()
+    now = datetime.now()
+    path = os.path.join(root, f"dt={now:%Y-%m-%d}", f"run={now:%H%M%S-%f}{suffix}")
+    os.makedirs(path, exist_ok=True)
+    return {"path": path, "meta": dict(meta, created_at=now.isoformat(timespec="seconds")),
+            "parts": [], "ops": 0, "rows": {t: 0 for t in TABLES}}
+
+def _table(rows: List[Dict[str, Any]]):
+    return pa.Table.from_pylist(rows)
+
+def snapshot_bundles(snap: Dict[str, Any], bundles: List[Dict[str, Any]]):
+    """Grava um bloco de pacotes {"op_id", "hdr", "items", "roteiro"} como uma parte."""
+    if not bundles:
+        return
+    rows = {
+        "op": [dict(b["hdr"]) for b in bundles],
+        "op_item": [dict(it.as_dict(), **{OP_KEY: b["op_id"]}) for b in bundles for it in b["items"]],
+        "roteiro": [dict(a.as_dict(), **{OP_KEY: b["op_id"]}) for b in bundles for a in b["roteiro"]],
+    }
+    name = f"part-{len(snap['parts']) + 1:05d}"
+    for t, r in rows.items():
+        if r:
+            pq.write_table(_table(r), os.path.join(snap["path"], f"{name}.{t}.parquet"),
+                           compression=COMPRESSION)
+        snap["rows"][t] += len(r)
+    snap["parts"].append({"name": name, "ops": len(bundles), **{t: len(r) for t, r in rows.items()}})
+    snap["ops"] += len(bundles)
+
+def close_snapshot(snap: Dict[str, Any], status: str = "ok") -> str:
+    """Grava o manifest (a execução passa a valer para --from-snapshot). Retorna a pasta."""
+    manifest = dict(snap["meta"], status=status, ops=snap["ops"], rows=snap["rows"], parts=snap["parts"],
+                    finished_at=datetime.now().isoformat(timespec="seconds"))
+    with open(os.path.join(snap["path"], MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    return snap["path"]
+
+# -----------------------------------------------------------------------------
+# Leitura
+# -----------------------------------------------------------------------------
+def find_runs(path: str) -> List[str]:
+    """Pastas de execução com manifest sob `path` (raiz, dt=... ou a própria execução), em ordem."""
+    out = []
+    for d, _, files in os.walk(path):
+        if MANIFEST in files:
+            out.append(d)
+    return sorted(out)
+
+def load_manifest(run_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(run_dir, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+def read_rows(run_dir: str, name: str, table: str) -> List[Dict[str, Any]]:
+    fn = os.path.join(run_dir, f"{name}.{table}.parquet")
+    return pq.read_table(fn).to_pylist() if os.path.exists(fn) else []
+
+def _records(rows: List[Dict[str, Any]]) -> Dict[int, List[Record]]:
+    """Linhas de itens/roteiro de volta a Record (índice de colunas compartilhado), por ORP_ID."""
+    out: Dict[int, List[Record]] = {}
+    if not rows:
+        return out
+    cols = [c for c in rows[0] if c != OP_KEY]
+    idx = {c: i for i, c in enumerate(cols)}
+    for r in rows:
+        out.setdefault(r[OP_KEY], []).append(Record(idx, [r[c] for c in cols]))
+    return out
+
+def read_part(run_dir: str, name: str) -> List[Dict[str, Any]]:
+    """Uma parte como os pacotes de fb_extract.extract_bundles (mesma ordem)."""
+    require_pyarrow()
+    items, rot = _records(read_rows(run_dir, name, "op_item")), _records(read_rows(run_dir, name, "roteiro"))
+    return [{"op_id": int(h["ORP_ID"]), "hdr": h, "items": items.get(int(h["ORP_ID"]), []),
+             "roteiro": rot.get(int(h["ORP_ID"]), [])}
+            for h in read_rows(run_dir, name, "op")]
+
+def iter_parts(run_dir: str, manifest: Optional[Dict[str, Any]] = None
+               ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """(nome da parte, pacotes) de uma execução, na ordem de gravação."""
+    manifest = manifest or load_manifest(run_dir)
+    for p in manifest["parts"]:
+        yield p["name"], read_part(run_dir, p["name"])
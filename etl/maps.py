@@ -1,6 +1,6 @@
 # etl/maps.py
 # Mapa de status do legado -> nome claro (igual ao status.ts)
-from typing import Optional, Literal, Dict
+from typing import Any, Optional, Literal, Dict, Iterable, List
 
 StatusOP = Literal["ABERTA","ENTRADA_PARCIAL","FINALIZADA","CANCELADA","OUTRO"]
 
@@ -20,3 +20,38 @@ SETOR_LEGACY_MAP: Dict[int,str] = {
     6: "Eixo",
     # quando souber: <codigo>: "Expedição",
 }
+
+# Etapa do roteiro -> status do setor (andamento_setor)
+def derive_stage_status(dtini, dtfim, statval) -> str:
+    if dtfim: return "CONCLUIDO"
+    if dtini: return "EM_EXECUCAO"
+    if statval:
+        s = str(statval).strip().upper()
+        if s in ("FF","FINALIZADO","FINALIZADA","CONCLUIDO","CONCLUIDA","FECHADO","FECHADA","F","C","2"):
+            return "CONCLUIDO"
+        if s in ("IN","INICIADO","INICIADA","EXECUCAO","EXECUTANDO","ANDAMENTO","A","1"):
+            return "EM_EXECUCAO"
+    return "PENDENTE"
+
+def andamento_rows(op_numero: int, atividades: Iterable[Any],
+                   info: Dict[str, Optional[str]]) -> List[tuple]:
+    """
+    Linhas de andamento_setor a partir das etapas do roteiro já lidas (Record ou
+    dict com chaves em UPPER, colunas conforme a detecção `info` de fb_schema).
+    Tuplas na ordem de pg_load.ANDAMENTO_COLS:
+    (op_numero, setor_codigo, sequencia, status_setor, dt_inicio, dt_fim).
+    """
+    def col(k):
+        return (info.get(k) or "").upper() or None
+    c_set, c_seq, c_ini, c_fim, c_sts = col("SETOR_COD"), col("SEQ"), col("DTINI"), col("DTFIM"), col("STATUS")
+    rows = []
+    for a in atividades:
+        setor, seq = a.get(c_set), a.get(c_seq)
+        if setor is None or seq is None:
+            continue
+        dtini = a.get(c_ini) if c_ini else None
+        dtfim = a.get(c_fim) if c_fim else None
+        statv = a.get(c_sts) if c_sts else None
+        rows.append((int(op_numero), int(setor), int(seq),
+                     derive_stage_status(dtini, dtfim, statv), dtini, dtfim))
+    return rows
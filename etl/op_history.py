@@ -0,0 +1,88 @@
+# etl/op_history.py
+# -----------------------------------------------------------------------------
+# Histórico (SCD tipo 2) do cabeçalho das OPs: op_hist
+# - Uma linha por VERSÃO de cada OP, válida em [valid_from, valid_to)
+#   (valid_to NULL = versão atual). Versão nova só quando alguma coluna
+#   acompanhada (HIST_COLS: status, datas, quantidades, %, cor...) muda.
+# - Gravado pelo ETL junto com o op, na mesma transação: no checkpoint do 04
+#   (depois do % / cor derivados) e na reconciliação de status.
+# - Consulta "como estava em T" (API: as_of=) pelo índice GiST do intervalo:
+#     WHERE tstzrange(valid_from, valid_to) @> T
+# - Ao criar a tabela, as OPs já existentes entram com a versão atual (a
+#   partir de agora); antes disso não há histórico.
+# -----------------------------------------------------------------------------
+from typing import Dict, Optional, Sequence
+
+from pg_load import add_stats
+
+# Colunas acompanhadas (as usadas pelas listas/dashboard da API)
+HIST_COLS = [
+    "op_numero", "filial", "descricao", "pedido_numero", "status_code", "status_nome",
+    "dt_emissao", "dt_prev_inicio", "dt_validade",
+    "qtd_total_hdr", "qtd_produzidas_hdr", "qtd_saldo_hdr", "percent_concluido", "cor_txt",
+]
+
+def ensure_hist_schema(pg_cur):
+    """Cria op_hist e os índices (se não existirem); numa tabela nova, semeia com o op atual."""
+    pg_cur.execute("""
+    CREATE TABLE IF NOT EXISTS op_hist (
+      hist_id             BIGSERIAL PRIMARY KEY,
+      op_id               INTEGER NOT NULL,
+      valid_from          TIMESTAMPTZ NOT NULL,
+      valid_to            TIMESTAMPTZ NULL,          -- NULL = versão atual
+      op_numero           INTEGER,
+      filial              INTEGER,
+      descricao           TEXT,
+      pedido_numero       INTEGER,
+      status_code         VARCHAR(4),
+      status_nome         VARCHAR(40),
+      dt_emissao          TIMESTAMP,
+      dt_prev_inicio      TIMESTAMP,
+      dt_validade         TIMESTAMP,
+      qtd_total_hdr       NUMERIC(18,3),
+      qtd_produzidas_hdr  NUMERIC(18,3),
+      qtd_saldo_hdr       NUMERIC(18,3),
+      percent_concluido   NUMERIC(7,2),
+      cor_txt             VARCHAR(200)
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_op_hist_atual ON op_hist(op_id) WHERE valid_to IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_op_hist_validade ON op_hist USING gist (tstzrange(valid_from, valid_to));
+    """)
+    cols = ", ".join(HIST_COLS)
+    pg_cur.execute(f"""
+    INSERT INTO op_hist (op_id, valid_from, {cols})
+    SELECT op_id, now(), {cols} FROM op
+    WHERE NOT EXISTS (SELECT 1 FROM op_hist)
+    """)
+
+def record_op_history(pg_cur, op_ids: Sequence[int],
+                      stats: Optional[Dict[str, Dict[str, int]]] = None) -> int:
+    """
+    Versiona as OPs `op_ids` já gravadas em op (2 comandos set-based):
+      1) fecha (valid_to = now()) a versão atual das que mudaram;
+      2) abre versão nova para as que ficaram sem versão atual (mudaram ou são novas).
+    now() é o início da transação: o fim de uma versão = o início da seguinte.
+    Retorna a quantidade de versões novas.
+    """
+    if not op_ids:
+        return 0
+    ids = list(op_ids)
+    h_cols = ", ".join(f"h.{c}" for c in HIST_COLS)
+    o_cols = ", ".join(f"o.{c}" for c in HIST_COLS)
+    pg_cur.execute(f"""
+    UPDATE op_hist AS h SET valid_to = now()
+    FROM op AS o
+    WHERE o.op_id = ANY(%s) AND h.op_id = o.op_id AND h.valid_to IS NULL
+      AND ({h_cols}) IS DISTINCT FROM ({o_cols})
+    """, (ids,))
+    closed = pg_cur.rowcount
+    pg_cur.execute(f"""
+    INSERT INTO op_hist (op_id, valid_from, {", ".join(HIST_COLS)})
+    SELECT o.op_id, now(), {o_cols}
+    FROM op AS o
+    WHERE o.op_id = ANY(%s)
+      AND NOT EXISTS (SELECT 1 FROM op_hist h WHERE h.op_id = o.op_id AND h.valid_to IS NULL)
+    """, (ids,))
+    n = pg_cur.rowcount
+    add_stats(stats, "op_hist", inserted=n - closed, updated=closed, unchanged=len(ids) - n)
+    return n
@@ -0,0 +1,335 @@
+# etl/pg_load.py
+# -----------------------------------------------------------------------------
+# Carga set-based no Postgres:
+#   1) COPY das linhas extraídas para tabelas de staging (stg_op, stg_op_item,
+#      stg_roteiro) — TEMPORÁRIAS: sem WAL e privadas da sessão, então vários
+#      processos/workers podem carregar ao mesmo tempo sem se atrapalhar;
+#   2) um único INSERT ... SELECT ... ON CONFLICT por tabela-alvo, dentro da
+#      transação da execução.
+# Linhas cujo conteúdo não mudou NÃO são reescritas (guarda IS DISTINCT FROM no
+# DO UPDATE): sem tuplas mortas/WAL/churn de índice a cada sync. Cada merge
+# devolve as contagens inseridas / atualizadas / inalteradas por tabela.
+# percent_concluido/cor_txt do cabeçalho são derivados de op_item no próprio
+# Postgres (derive_op_header), num único UPDATE ... FROM agregado.
+# Opcional: synchronous_commit=off para a sessão do ETL (o commit não espera o
+# flush do WAL; numa queda do servidor perde-se no máximo a última execução,
+# que o próximo sync refaz).
+# -----------------------------------------------------------------------------
+import io
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import psycopg2.extras
+
+# Colunas na ordem usada pelo COPY e pelo INSERT ... SELECT
+OP_COLS = [
+    "op_id", "op_numero", "filial", "descricao", "pedido_numero",
+    "status_code", "status_nome", "dt_emissao", "dt_prev_inicio", "dt_validade",
+    "qtd_total_hdr", "qtd_produzidas_hdr", "qtd_saldo_hdr", "origem",
+]
+ITEM_COLS = [
+    "opd_id", "op_id", "op_numero", "lote", "pro_codigo", "cor_codigo",
+    "qtd", "qtd_produzidas", "qtd_saldo", "pro_desc", "cor_nome",
+]
+ROTEIRO_COLS = ["op_numero", "setor_codigo", "sequencia"]
+ANDAMENTO_COLS = ["op_numero", "setor_codigo", "sequencia", "status_setor", "dt_inicio", "dt_fim"]
+
+# alvo -> staging, colunas, chave de conflito e ação no conflito
+# "steps": etapas por OP (op_numero); com replace, as que sumiram no Firebird são apagadas
+# "keep": colunas em que NULL na staging mantém o valor atual (origem: só o 08 marca)
+STAGING: Dict[str, Dict[str, Any]] = {
+    "op":      {"stg": "stg_op",      "cols": OP_COLS,      "key": ["op_id"],  "update": True,
+                "keep": ["origem"]},
+    "op_item": {"stg": "stg_op_item", "cols": ITEM_COLS,    "key": ["opd_id"], "update": True},
+    "roteiro": {"stg": "stg_roteiro", "cols": ROTEIRO_COLS,
+                "key": ["op_numero", "setor_codigo", "sequencia"], "update": False, "steps": True},
+    "andamento_setor": {"stg": "stg_andamento", "cols": ANDAMENTO_COLS,
+                        "key": ["op_numero", "setor_codigo", "sequencia"], "update": True, "steps": True},
+}
+
+# -----------------------------------------------------------------------------
+# Contagens por tabela: {"op": {"inserted": n, "updated": n, "unchanged": n}, ...}
+# (+ "deleted" nas tabelas de etapas, quando há etapas apagadas)
+# -----------------------------------------------------------------------------
+def new_stats() -> Dict[str, Dict[str, int]]:
+    return {}
+
+def add_stats(stats: Optional[Dict[str, Dict[str, int]]], table: str,
+              inserted: int = 0, updated: int = 0, unchanged: int = 0, deleted: int = 0):
+    if stats is None:
+        return
+    t = stats.setdefault(table, {"inserted": 0, "updated": 0, "unchanged": 0})
+    t["inserted"] += inserted; t["updated"] += updated; t["unchanged"] += unchanged
+    if deleted:
+        t["deleted"] = t.get("deleted", 0) + deleted
+
+def merge_stats(dst: Dict[str, Dict[str, int]], src: Dict[str, Dict[str, int]]):
+    for table, c in src.items():
+        add_stats(dst, table, c["inserted"], c["updated"], c["unchanged"], c.get("deleted", 0))
+
+def format_stats(stats: Dict[str, Dict[str, int]]) -> str:
+    return "; ".join(
+        f"{t}: +{c['inserted']} ~{c['updated']} ={c['unchanged']}"
+        + (f" -{c['deleted']}" if c.get("deleted") else "") for t, c in stats.items()
+    ) or "(nada gravado)"
+
+def new_value(c: str, alias: str, keep: Sequence[str] = ()) -> str:
+    """Valor gravado no DO UPDATE (colunas de `keep`: NULL mantém o atual)."""
+    return f"COALESCE(EXCLUDED.{c}, {alias}.{c})" if c in keep else f"EXCLUDED.{c}"
+
+def changed_guard(cols: Sequence[str], key: Sequence[str], alias: str, keep: Sequence[str] = ()) -> str:
+    """WHERE do DO UPDATE: só reescreve se alguma coluna não-chave mudou."""
+    rest = [c for c in cols if c not in key]
+    return (f"({', '.join(f'{alias}.{c}' for c in rest)}) IS DISTINCT FROM "
+            f"({', '.join(new_value(c, alias, keep) for c in rest)})")
+
+def upsert_values(pg_cur, sql: str, rows: Sequence[Any], template: str, table: str,
+                  stats: Optional[Dict[str, Dict[str, int]]] = None, page_size: int = 500):
+    """
+    execute_values de um INSERT ... VALUES %s ... RETURNING (xmax = 0), contando
+    inseridas/atualizadas; as linhas que o DO UPDATE WHERE / DO NOTHING pularam
+    contam como inalteradas.
+    """
+    if not rows:
+        return
+    res = psycopg2.extras.execute_values(pg_cur, sql, rows, template=template,
+                                         page_size=page_size, fetch=True)
+    ins = sum(1 for (inserted,) in res if inserted)
+    add_stats(stats, table, ins, len(res) - ins, len(rows) - len(res))
+
+@contextmanager
+def savepoint(pg_cur, name: str = "etl_op"):
+    """SAVEPOINT: um erro dentro do bloco desfaz só o bloco, não a transação."""
+    pg_cur.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except BaseException:
+        pg_cur.execute(f"ROLLBACK TO SAVEPOINT {name}")
+        raise
+    else:
+        pg_cur.execute(f"RELEASE SAVEPOINT {name}")
+
+def ensure_staging(pg_cur):
+    """Cria as tabelas de staging da sessão (se ainda não existirem)."""
+    pg_cur.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS stg_op (
+      op_id           INTEGER,
+      op_numero       INTEGER,
+      filial          INTEGER,
+      descricao       TEXT,
+      pedido_numero   INTEGER,
+      status_code     VARCHAR(4),
+      status_nome     VARCHAR(40),
+      dt_emissao      TIMESTAMP,
+      dt_prev_inicio  TIMESTAMP,
+      dt_validade     TIMESTAMP,
+      qtd_total_hdr       NUMERIC(18,3),
+      qtd_produzidas_hdr  NUMERIC(18,3),
+      qtd_saldo_hdr       NUMERIC(18,3),
+      origem          VARCHAR(60)
+    ) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS stg_op_item (
+      opd_id          INTEGER,
+      op_id           INTEGER,
+      op_numero       INTEGER,
+      lote            INTEGER,
+      pro_codigo      INTEGER,
+      cor_codigo      INTEGER,
+      qtd             NUMERIC(18,3),
+      qtd_produzidas  NUMERIC(18,3),
+      qtd_saldo       NUMERIC(18,3),
+      pro_desc        TEXT,
+      cor_nome        VARCHAR(200)
+    ) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS stg_roteiro (
+      op_numero       INTEGER,
+      setor_codigo    INTEGER,
+      sequencia       INTEGER
+    ) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS stg_andamento (
+      op_numero       INTEGER,
+      setor_codigo    INTEGER,
+      sequencia       INTEGER,
+      status_setor    VARCHAR(20),
+      dt_inicio       TIMESTAMP,
+      dt_fim          TIMESTAMP
+    ) ON COMMIT DELETE ROWS;
+    """)
+
+def set_async_commit(pg_cur):
+    """synchronous_commit=off para esta sessão (só o ETL; a API não é afetada)."""
+    pg_cur.execute("SET synchronous_commit TO OFF")
+
+def _copy_text(v: Any) -> str:
+    """Formata um valor para o COPY em formato texto (NULL = \\N)."""
+    if v is None:
+        return r"\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    s = str(v)
+    return (s.replace("\\", "\\\\").replace("\t", "\\t")
+             .replace("\n", "\\n").replace("\r", "\\r"))
+
+def copy_rows(pg_cur, table: str, cols: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+    """COPY ... FROM STDIN de tuplas (na ordem de `cols`). Retorna a quantidade."""
+    buf = io.StringIO(); n = 0
+    for r in rows:
+        buf.write("\t".join(_copy_text(v) for v in r)); buf.write("\n"); n += 1
+    if n:
+        buf.seek(0)
+        pg_cur.copy_expert(f"COPY {table} ({', '.join(cols)}) FROM STDIN", buf)
+    return n
+
+def merge_sql(target: str, replace: bool = False, keep: bool = False) -> str:
+    """
+    INSERT ... SELECT DISTINCT ON (chave) FROM staging ON CONFLICT ... (um comando
+    por tabela), devolvendo (distintas na staging, inseridas, atualizadas, apagadas).
+    Com `replace` (tabelas de etapas), o MESMO comando apaga as etapas das OPs do
+    bloco (stg_op) que não vieram na staging: diff por OP, sem apagar e recarregar.
+    Com `keep`, o comando recebe um parâmetro (int[]) com OPs cujas etapas não
+    são apagadas (atividades no Firebird que não puderam ser lidas).
+    """
+    spec = STAGING[target]
+    cols, key = spec["cols"], spec["key"]
+    col_list = ", ".join(cols)
+    key_list = ", ".join(key)
+    if spec["update"]:
+        keep = spec.get("keep", ())
+        sets = ",\n        ".join(f"{c} = {new_value(c, 't', keep)}" for c in cols if c not in key)
+        action = f"DO UPDATE SET\n        {sets}\n      WHERE {changed_guard(cols, key, 't', keep)}"
+    else:
+        action = "DO NOTHING"
+    if replace and spec.get("steps"):
+        match = " AND ".join(f"s.{k} = d.{k}" for k in key)
+        # DELETE e INSERT no mesmo snapshot tocam linhas disjuntas (fora x dentro da staging)
+        deleted = f"""del AS (
+      DELETE FROM {target} d
+      WHERE d.op_numero IN (SELECT op_numero FROM stg_op){" AND d.op_numero <> ALL(%s)" if keep else ""}
+        AND NOT EXISTS (SELECT 1 FROM {spec['stg']} s WHERE {match})
+      RETURNING 1
+    ),"""
+        n_deleted = "(SELECT COUNT(*) FROM del)"
+    else:
+        deleted, n_deleted = "", "0"
+    return f"""
+    WITH {deleted} up AS (
+      INSERT INTO {target} AS t ({col_list})
+      SELECT DISTINCT ON ({key_list}) {col_list}
+      FROM {spec['stg']}
+      ORDER BY {key_list}
+      ON CONFLICT ({key_list}) {action}
+      RETURNING (t.xmax = 0) AS inserted
+    )
+    SELECT
+      (SELECT COUNT(*) FROM (SELECT DISTINCT {key_list} FROM {spec['stg']}) d),
+      COUNT(*) FILTER (WHERE inserted),
+      COUNT(*) FILTER (WHERE NOT inserted),
+      {n_deleted}
+    FROM up
+    """
+
+def load_staged(pg_cur, rows_by_target: Dict[str, List[Sequence[Any]]],
+                stats: Optional[Dict[str, Dict[str, int]]] = None,
+                replace_steps: bool = False) -> Dict[str, int]:
+    """
+    Carrega {alvo: [tuplas]} via staging + merge (op -> op_item -> roteiro ->
+    andamento_setor, por causa da FK). Alvos ausentes em `rows_by_target` são
+    pulados. Deve rodar dentro da transação da execução. Retorna linhas copiadas
+    por alvo e acumula inseridas/atualizadas/inalteradas/apagadas em `stats`.
+    Com `replace_steps`, as etapas (roteiro/andamento) trazidas são o conjunto
+    COMPLETO de cada OP do bloco: as que não vieram são apagadas, menos as das
+    OPs em rows_by_target["keep_steps"] (op_numero; etapas não lidas).
+    """
+    counts: Dict[str, int] = {}
+    keep = list(rows_by_target.get("keep_steps") or [])
+    for target in ("op", "op_item", "roteiro", "andamento_setor"):
+        if target not in rows_by_target:
+            continue
+        rows = rows_by_target[target] or []
+        spec = STAGING[target]
+        pg_cur.execute(f"TRUNCATE {spec['stg']}")
+        counts[target] = copy_rows(pg_cur, spec["stg"], spec["cols"], rows)
+        replace = replace_steps and spec.get("steps", False)
+        if counts[target] or replace:  # OP sem etapas no Firebird: só apaga
+            if replace and keep:
+                pg_cur.execute(merge_sql(target, replace, keep=True), (keep,))
+            else:
+                pg_cur.execute(merge_sql(target, replace))
+            total, ins, upd, dele = pg_cur.fetchone()
+            add_stats(stats, target, ins, upd, total - ins - upd, dele)
+    return counts
+
+def delete_vanished_steps(pg_cur, table: str, op_numero: int, rows: Sequence[Sequence[Any]],
+                          stats: Optional[Dict[str, Dict[str, int]]] = None) -> int:
+    """
+    Apaga de `table` (roteiro/andamento_setor) as etapas da OP que não estão em
+    `rows` (tuplas começando por op_numero, setor_codigo, sequencia). Caminho por OP.
+    """
+    pg_cur.execute(f"""
+    DELETE FROM {table} d
+    WHERE d.op_numero = %s
+      AND NOT EXISTS (
+        SELECT 1 FROM unnest(%s::int[], %s::int[]) AS n(setor_codigo, sequencia)
+        WHERE n.setor_codigo = d.setor_codigo AND n.sequencia = d.sequencia
+      )
+    """, (op_numero, [r[1] for r in rows], [r[2] for r in rows]))
+    add_stats(stats, table, deleted=pg_cur.rowcount)
+    return pg_cur.rowcount
+
+def upsert_andamento(pg_cur, rows: Sequence[Sequence[Any]],
+                     stats: Optional[Dict[str, Dict[str, int]]] = None, page_size: int = 1000):
+    """UPSERT de andamento_setor (tuplas na ordem de ANDAMENTO_COLS); não reescreve etapas sem mudança."""
+    if not rows:
+        return
+    # chave repetida no mesmo INSERT ... VALUES quebraria o DO UPDATE (fica a última)
+    rows = list({tuple(r[:3]): r for r in rows}.values())
+    upsert_values(pg_cur, """
+    INSERT INTO andamento_setor AS t (op_numero, setor_codigo, sequencia, status_setor, dt_inicio, dt_fim)
+    VALUES %s
+    ON CONFLICT (op_numero, setor_codigo, sequencia) DO UPDATE SET
+      status_setor = EXCLUDED.status_setor,
+      dt_inicio = EXCLUDED.dt_inicio,
+      dt_fim = EXCLUDED.dt_fim
+    WHERE (t.status_setor, t.dt_inicio, t.dt_fim)
+          IS DISTINCT FROM (EXCLUDED.status_setor, EXCLUDED.dt_inicio, EXCLUDED.dt_fim)
+    RETURNING (t.xmax = 0)
+    """, rows, "(%s, %s, %s, %s, %s, %s)", "andamento_setor", stats, page_size=page_size)
+
+def derive_op_header(pg_cur, op_ids: Sequence[int],
+                     stats: Optional[Dict[str, Dict[str, int]]] = None) -> int:
+    """
+    percent_concluido e cor_txt das OPs `op_ids`, a partir de op_item já gravado
+    (ligação por op_numero = série, como no Firebird), num único UPDATE ... FROM:
+      - % = (1 - saldo/total) * 100 pelos itens; sem itens, pelo cabeçalho;
+      - cor = nomes distintos das cores dos itens ("SEM PINTURA" se nenhum).
+    Só reescreve as OPs cujo valor mudou. Retorna a quantidade atualizada.
+    """
+    if not op_ids:
+        return 0
+    pg_cur.execute("""
+    WITH agg AS (
+      SELECT o.op_id,
+             CASE WHEN COUNT(i.opd_id) > 0 THEN SUM(COALESCE(i.qtd, 0))
+                  ELSE COALESCE(o.qtd_total_hdr, 0) END AS tot,
+             CASE WHEN COUNT(i.opd_id) > 0 THEN SUM(COALESCE(i.qtd_saldo, 0))
+                  ELSE COALESCE(o.qtd_saldo_hdr, 0) END AS saldo,
+             string_agg(DISTINCT btrim(i.cor_nome), ', ' ORDER BY btrim(i.cor_nome))
+               FILTER (WHERE i.cor_codigo IS NOT NULL AND i.cor_nome IS NOT NULL) AS cores
+      FROM op o
+      LEFT JOIN op_item i ON i.op_numero = o.op_numero
+      WHERE o.op_id = ANY(%s)
+      GROUP BY o.op_id, o.qtd_total_hdr, o.qtd_saldo_hdr
+    ), calc AS (
+      SELECT op_id,
+             CASE WHEN tot > 0 THEN round((1 - saldo / tot) * 100, 2) ELSE 0 END AS pct,
+             COALESCE(NULLIF(left(cores, 200), ''), 'SEM PINTURA') AS cor
+      FROM agg
+    )
+    UPDATE op AS t SET percent_concluido = c.pct, cor_txt = c.cor
+    FROM calc c
+    WHERE t.op_id = c.op_id
+      AND (t.percent_concluido, t.cor_txt) IS DISTINCT FROM (c.pct, c.cor)
+    """, (list(op_ids),))
+    n = pg_cur.rowcount
+    add_stats(stats, "op_header", updated=n, unchanged=len(op_ids) - n)
+    return n
@@ -0,0 +1,120 @@
+# etl/progress_series.py
+# -----------------------------------------------------------------------------
+# Série temporal compacta do andamento (gráficos de fluxo acumulado/burn-down):
+# - progress_op: por OP e por balde de hora, SÓ quando o % concluído
+#   mudou desde a amostra anterior: % atual e delta (progress_op_last guarda o
+#   último valor de cada OP, sem varrer o histórico);
+# - progress_setor: por filial/setor e balde, quantas etapas das OPs em aberto
+#   estão PENDENTE / EM_EXECUCAO / CONCLUIDO (andamento_setor).
+# As duas tabelas são particionadas por mês (RANGE em bucket); a partição do
+# mês é criada na primeira amostra dele. Amostrar de novo no mesmo balde é
+# idempotente: o balde fica com o último estado e o delta acumulado.
+# Uma granularidade só (hora): baldes de hora e de dia nas mesmas chaves se
+# misturariam no balde das 00:00; dia/semana/mês são agregados pela API.
+# Quem amostra: job "series" do 06_sync_daemon (--series-every) ou o
+# 04_copiar_janela --series ao fim da cópia. Leitura: GET /series/progress.
+# -----------------------------------------------------------------------------
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pg_load import add_stats, new_stats
+
+BUCKET = "hour"  # granularidade gravada (date_trunc); a API reagrupa por day/week/month
+# etapas de OPs nestes status não entram na contagem por setor (não são carteira)
+CLOSED_STATUS = ("FINALIZADA", "CANCELADA", "FECHADA", "REMOVIDA")
+PARTITIONED = ("progress_op", "progress_setor")
+
+def ensure_series_schema(pg_cur):
+    """Tabelas da série (particionadas por mês; Postgres 11+) e o último % de cada OP."""
+    pg_cur.execute("""
+    CREATE TABLE IF NOT EXISTS progress_op (
+      bucket       TIMESTAMP NOT NULL,
+      filial       INTEGER,
+      op_id        INTEGER NOT NULL,
+      percent      NUMERIC(7,2) NOT NULL,
+      delta        NUMERIC(7,2) NOT NULL,
+      PRIMARY KEY (op_id, bucket)
+    ) PARTITION BY RANGE (bucket);
+    CREATE INDEX IF NOT EXISTS idx_progress_op_filial ON progress_op(filial, bucket);
+    CREATE TABLE IF NOT EXISTS progress_op_last (
+      op_id        INTEGER PRIMARY KEY,
+      percent      NUMERIC(7,2) NOT NULL,
+      bucket       TIMESTAMP NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS progress_setor (
+      bucket       TIMESTAMP NOT NULL,
+      filial       INTEGER NOT NULL,
+      setor_codigo INTEGER NOT NULL,
+      pendente     INTEGER NOT NULL,
+      em_execucao  INTEGER NOT NULL,
+      concluido    INTEGER NOT NULL,
+      PRIMARY KEY (filial, setor_codigo, bucket)
+    ) PARTITION BY RANGE (bucket);
+    """)
+
+def ensure_partitions(pg_cur, bucket: datetime):
+    """Partição mensal de `bucket` nas tabelas da série (ex.: progress_op_202610)."""
+    start = bucket.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    for t in PARTITIONED:
+        pg_cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {t}_{start:%Y%m} PARTITION OF {t}
+          FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')
+        """)
+
+def sample_progress(pg_cur, filial: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Uma amostra no balde da hora atual (relógio do Postgres) da `filial` (None =
+    todas). Não faz commit. Retorna {"bucket", "ops" (OPs com % alterado),
+    "setores" (linhas por setor), "stats"}.
+    """
+    pg_cur.execute("SELECT date_trunc(%s, localtimestamp)", (BUCKET,))
+    ts = pg_cur.fetchone()[0]
+    ensure_partitions(pg_cur, ts)
+    stats = new_stats()
+    f_sql, f_params = ("AND o.filial = %s", [filial]) if filial is not None else ("", [])
+
+    # % por OP: só as que mudaram desde a última amostra (no mesmo balde, acumula o delta)
+    pg_cur.execute(f"""
+    WITH cur AS (
+      SELECT o.op_id, o.filial, o.percent_concluido AS pct, COALESCE(l.percent, 0) AS prev
+      FROM op o
+      LEFT JOIN progress_op_last l ON l.op_id = o.op_id
+      WHERE o.percent_concluido IS NOT NULL
+        AND o.percent_concluido IS DISTINCT FROM l.percent {f_sql}
+    ), ins AS (
+      INSERT INTO progress_op AS t (bucket, filial, op_id, percent, delta)
+      SELECT %s, filial, op_id, pct, pct - prev FROM cur
+      ON CONFLICT (op_id, bucket) DO UPDATE SET
+        percent = EXCLUDED.percent,
+        delta = t.delta + EXCLUDED.delta
+      RETURNING 1
+    )
+    INSERT INTO progress_op_last AS t (op_id, percent, bucket)
+    SELECT op_id, pct, %s FROM cur
+    ON CONFLICT (op_id) DO UPDATE SET percent = EXCLUDED.percent, bucket = EXCLUDED.bucket
+    """, f_params + [ts, ts])
+    ops = pg_cur.rowcount
+    add_stats(stats, "progress_op", inserted=ops)
+
+    # contagem por setor das etapas das OPs em aberto (o balde guarda a última amostra)
+    pg_cur.execute(f"""
+    INSERT INTO progress_setor AS t (bucket, filial, setor_codigo, pendente, em_execucao, concluido)
+    SELECT %s, o.filial, a.setor_codigo,
+           COUNT(*) FILTER (WHERE a.status_setor = 'PENDENTE'),
+           COUNT(*) FILTER (WHERE a.status_setor = 'EM_EXECUCAO'),
+           COUNT(*) FILTER (WHERE a.status_setor = 'CONCLUIDO')
+    FROM andamento_setor a
+    JOIN op o ON o.op_numero = a.op_numero
+    WHERE o.filial IS NOT NULL AND COALESCE(o.status_nome, '') <> ALL(%s) {f_sql}
+    GROUP BY o.filial, a.setor_codigo
+    ON CONFLICT (filial, setor_codigo, bucket) DO UPDATE SET
+      pendente = EXCLUDED.pendente,
+      em_execucao = EXCLUDED.em_execucao,
+      concluido = EXCLUDED.concluido
+    WHERE (t.pendente, t.em_execucao, t.concluido)
+          IS DISTINCT FROM (EXCLUDED.pendente, EXCLUDED.em_execucao, EXCLUDED.concluido)
+    """, [ts, list(CLOSED_STATUS)] + f_params)
+    setores = pg_cur.rowcount
+    add_stats(stats, "progress_setor", inserted=setores)
+    return {"bucket": ts, "ops": ops, "setores": setores, "stats": stats}
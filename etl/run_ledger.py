@@ -0,0 +1,97 @@
+# etl/run_ledger.py
+# -----------------------------------------------------------------------------
+# Registro das execuções do ETL (tabela etl_run): uma linha por execução de cada
+# script/job, com tipo, filial, janela, início/fim, OPs e linhas gravadas,
+# falhas e duração. A API (/etl/status) usa para mostrar a idade dos dados e
+# expõe uma "versão dos dados" (último run_id que gravou algo).
+# -----------------------------------------------------------------------------
+import json
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Dict, Iterator, Optional
+
+import psycopg2.extras
+
+def ensure_run_schema(pg_cur):
+    pg_cur.execute("""
+    CREATE TABLE IF NOT EXISTS etl_run (
+      run_id       BIGSERIAL PRIMARY KEY,
+      kind         VARCHAR(30) NOT NULL,          -- janela | andamento | reconcile | dims | dead_letter | snapshot | series
+      filial       INTEGER NULL,
+      dt_from      DATE NULL,
+      dt_to        DATE NULL,
+      params       JSONB NULL,
+      status       VARCHAR(10) NOT NULL,          -- running | ok | partial | error
+      started_at   TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+      finished_at  TIMESTAMPTZ NULL,
+      duration_s   NUMERIC(12,3) NULL,
+      selected     INTEGER NULL,
+      done         INTEGER NULL,
+      failed       INTEGER NULL,
+      changed      INTEGER NULL,                  -- linhas inseridas/atualizadas/apagadas
+      rows         JSONB NULL,                    -- contagens por tabela (pg_load.new_stats)
+      error        TEXT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_etl_run_kind ON etl_run(kind, filial, started_at DESC);
+    """)
+
+def start_run(pg_cur, kind: str, filial: Optional[int] = None, dt_from: Optional[date] = None,
+              dt_to: Optional[date] = None, params: Optional[Dict[str, Any]] = None) -> int:
+    """Insere a execução como 'running' e faz COMMIT (fica visível enquanto roda)."""
+    pg_cur.execute("""
+        INSERT INTO etl_run (kind, filial, dt_from, dt_to, params, status)
+        VALUES (%s, %s, %s, %s, %s, 'running')
+        RETURNING run_id
+    """, (kind, filial, dt_from, dt_to, psycopg2.extras.Json(params or {}, dumps=_dumps)))
+    run_id = pg_cur.fetchone()[0]
+    pg_cur.connection.commit()
+    return run_id
+
+def finish_run(pg_cur, rec: Dict[str, Any], status: str, error: Optional[str] = None):
+    """Fecha a execução (status, contagens, duração) e faz COMMIT."""
+    stats = rec.get("stats") or {}
+    changed = rec.get("changed")
+    if changed is None:
+        changed = sum(c.get("inserted", 0) + c.get("updated", 0) + c.get("deleted", 0) for c in stats.values())
+    pg_cur.execute("""
+        UPDATE etl_run SET
+          status = %s, error = %s,
+          finished_at = clock_timestamp(),
+          duration_s = EXTRACT(EPOCH FROM clock_timestamp() - started_at),
+          dt_from = COALESCE(%s, dt_from), dt_to = COALESCE(%s, dt_to),
+          selected = %s, done = %s, failed = %s, changed = %s, rows = %s
+        WHERE run_id = %s
+    """, (status, (error or "")[:4000] or None, rec.get("dt_from"), rec.get("dt_to"),
+          rec.get("selected"), rec.get("done"), rec.get("fail"), changed,
+          psycopg2.extras.Json(stats), rec["run_id"]))
+    pg_cur.connection.commit()
+
+@contextmanager
+def recorded_run(pg_cur, kind: str, filial: Optional[int] = None, dt_from: Optional[date] = None,
+                 dt_to: Optional[date] = None, params: Optional[Dict[str, Any]] = None
+                 ) -> Iterator[Dict[str, Any]]:
+    """
+    Registra o bloco como uma execução em etl_run. O chamador preenche o dict
+    devolvido ("selected", "done", "fail", "stats" ou "changed"; "dt_from"/"dt_to"
+    se a janela só é conhecida depois). Sem exceção: ok (partial se houve falhas);
+    com exceção: ROLLBACK do trabalho, grava 'error' e repassa a exceção.
+    """
+    rec: Dict[str, Any] = {"run_id": start_run(pg_cur, kind, filial, dt_from, dt_to, params),
+                           "selected": None, "done": None, "fail": 0, "stats": {}}
+    try:
+        yield rec
+    except BaseException as e:
+        try:
+            pg_cur.connection.rollback()
+            finish_run(pg_cur, rec, "error", f"{type(e).__name__}: {e}")
+        except Exception as e2:  # conexão caiu: a linha fica como 'running'
+            print(f"[AVISO] não foi possível registrar a falha em etl_run: {e2}")
+        raise
+    finish_run(pg_cur, rec, "partial" if rec.get("fail") else "ok")
+
+def args_params(args) -> Dict[str, Any]:
+    """Opções da linha de comando que valem registro (sem as vazias/desligadas)."""
+    return {k: v for k, v in vars(args).items() if v not in (None, False, "")}
+
+def _dumps(o: Any) -> str:
+    return json.dumps(o, default=str)
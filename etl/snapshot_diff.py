@@ -0,0 +1,111 @@
+# etl/snapshot_diff.py
+# -----------------------------------------------------------------------------
+# Compara dois snapshots da extração do Firebird (fb_snapshot.py / --snapshot-dir):
+# - Cada lado pode ser a raiz, uma partição dt=... ou uma execução; com várias
+#   execuções, vale a leitura mais recente de cada OP (mesma regra da recarga);
+# - OPs por ORP_ID, itens por OPD_ID e etapas do roteiro por (OP, setor, sequência);
+# - Mostra, por tabela, quantas linhas entraram, saíram e mudaram, e as colunas
+#   que mais mudaram, com exemplos. Só leitura de arquivos locais.
+# -----------------------------------------------------------------------------
+r"""
+Como usar (PowerShell):
+
+# O que mudou na filial 1 entre a extração de ontem e a de hoje
+(.venv) PS> python .\etl\snapshot_diff.py .\etl\.snapshots\dt=2026-10-15 .\etl\.snapshots\dt=2026-10-16 --filial 1
+
+# Mais exemplos por tabela e resultado em JSON
+(.venv) PS> python .\etl\snapshot_diff.py .\snap_a .\snap_b --show 20 --out .\etl\.bench\snapshot_diff.json
+"""
+import os
+import sys
+import json
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from fb_snapshot import TABLES, find_runs, load_manifest, iter_parts, require_pyarrow
+
+def step_key(op_id: int, a, rot: Optional[Dict[str, Any]]) -> Tuple:
+    """Chave da etapa: (OP, setor, sequência) pelas colunas detectadas; sem detecção, a linha toda."""
+    if rot and rot.get("SETOR_COD") and rot.get("SEQ"):
+        return (op_id, a.get(rot["SETOR_COD"].upper()), a.get(rot["SEQ"].upper()))
+    return (op_id,) + tuple(str(v) for v in a.as_dict().values())
+
+def load_side(path: str, filial: Optional[int] = None) -> Dict[str, Dict[Any, Dict[str, Any]]]:
+    """Linhas de um lado por tabela e chave; a execução mais recente de cada OP substitui as anteriores."""
+    by_op: Dict[int, Dict[str, Any]] = {}
+    for d in find_runs(path):
+        mf = load_manifest(d)
+        if filial is not None and mf.get("filial") != filial:
+            continue
+        rot = (mf.get("schema") or {}).get("ROTEIRO")
+        for _, bundles in iter_parts(d, mf):
+            for b in bundles:
+                by_op[b["op_id"]] = {
+                    "op": {b["op_id"]: b["hdr"]},
+                    "op_item": {it["OPD_ID"]: it.as_dict() for it in b["items"]},
+                    "roteiro": {step_key(b["op_id"], a, rot): a.as_dict() for a in b["roteiro"]},
+                }
+    out: Dict[str, Dict[Any, Dict[str, Any]]] = {t: {} for t in TABLES}
+    for rows in by_op.values():
+        for t in TABLES:
+            out[t].update(rows[t])
+    return out
+
+def diff_table(a: Dict[Any, Dict[str, Any]], b: Dict[Any, Dict[str, Any]], show: int) -> Dict[str, Any]:
+    added = [k for k in b if k not in a]
+    removed = [k for k in a if k not in b]
+    cols: Counter = Counter()
+    changed, samples = 0, []
+    for k in a.keys() & b.keys():
+        diff = {c: (a[k].get(c), b[k].get(c)) for c in a[k].keys() | b[k].keys() if a[k].get(c) != b[k].get(c)}
+        if not diff:
+            continue
+        changed += 1
+        cols.update(diff.keys())
+        if len(samples) < show:
+            samples.append({"key": k, "changes": diff})
+    return {"a": len(a), "b": len(b), "added": len(added), "removed": len(removed), "changed": changed,
+            "columns": dict(cols.most_common()), "samples": samples,
+            "added_keys": added[:show], "removed_keys": removed[:show]}
+
+def parse_args(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Compara dois snapshots da extração do Firebird (fb_snapshot).")
+    ap.add_argument("a", help="Snapshot de referência (raiz, dt=... ou execução).")
+    ap.add_argument("b", help="Snapshot comparado.")
+    ap.add_argument("--filial", type=int, default=None, help="Só as execuções desta filial.")
+    ap.add_argument("--show", type=int, default=5, help="Exemplos por tabela.")
+    ap.add_argument("--out", type=str, default=None, help="Grava o resultado em JSON.")
+    return ap.parse_args(argv)
+
+def main():
+    args = parse_args()
+    require_pyarrow()
+    for p in (args.a, args.b):
+        if not find_runs(p):
+            raise SystemExit(f"Nenhum snapshot (pasta com manifest) em {p}.")
+    side_a, side_b = load_side(args.a, args.filial), load_side(args.b, args.filial)
+    result = {t: diff_table(side_a[t], side_b[t], args.show) for t in TABLES}
+
+    for t, r in result.items():
+        print(f"{t:<8} A={r['a']:<7} B={r['b']:<7} +{r['added']} -{r['removed']} ~{r['changed']}")
+        if r["columns"]:
+            print("         colunas: " + ", ".join(f"{c} ({n})" for c, n in r["columns"].items()))
+        for s in r["samples"]:
+            print(f"         {s['key']}: " + "; ".join(f"{c}: {x!r} -> {y!r}" for c, (x, y) in s["changes"].items()))
+        if r["added_keys"]:
+            print(f"         novas: {r['added_keys']}{' ...' if r['added'] > len(r['added_keys']) else ''}")
+        if r["removed_keys"]:
+            print(f"         removidas: {r['removed_keys']}{' ...' if r['removed'] > len(r['removed_keys']) else ''}")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"a": args.a, "b": args.b, "filial": args.filial, "tables": result}, f, indent=2, default=str)
+        print(f"Resultado gravado em {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -50,6 +50,133 @@ CREATE TABLE IF NOT EXISTS andamento_setor (
   PRIMARY KEY (op_numero, setor_codigo, sequencia)
 );
 
+-- dimensões replicadas do Firebird (dim_sync.py / 07_sync_dimensoes.py)
+CREATE TABLE IF NOT EXISTS produto (
+  pro_codigo   INTEGER PRIMARY KEY,
+  descricao    TEXT,
+  synced_at    TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS cor (
+  cor_codigo   INTEGER PRIMARY KEY,
+  nome         VARCHAR(200),
+  synced_at    TIMESTAMP NOT NULL DEFAULT now()
+);
+-- checksum por faixa de códigos da última conferência (qtd + soma de HASH no Firebird)
+CREATE TABLE IF NOT EXISTS etl_dim_bucket (
+  dim          VARCHAR(20) NOT NULL,          -- produto | cor
+  bucket       INTEGER NOT NULL,              -- código / 1000
+  qtd          INTEGER NOT NULL,
+  checksum     BIGINT NOT NULL,
+  checked_at   TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY (dim, bucket)
+);
+
+-- fingerprint por OP do último sync (04_copiar_janela --changed-only)
+CREATE TABLE IF NOT EXISTS etl_op_fingerprint (
+  op_id        INTEGER PRIMARY KEY,           -- ORP_ID
+  fingerprint  VARCHAR(32) NOT NULL,          -- md5(status|qtds|datas|itens)
+  synced_at    TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- checkpoint por execução (04_copiar_janela --commit-every/--resume)
+CREATE TABLE IF NOT EXISTS etl_checkpoint (
+  run_key      VARCHAR(200) PRIMARY KEY,      -- janela:filial:campo:de..ate:status[#wI/N]
+  last_op_id   INTEGER,                       -- última ORP_ID commitada
+  updated_at   TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- OPs que falharam na cópia, com erro e pacote extraído (04_copiar_janela --retry-dead-letter)
+CREATE TABLE IF NOT EXISTS etl_dead_letter (
+  id           BIGSERIAL PRIMARY KEY,
+  run_key      VARCHAR(200),
+  op_id        INTEGER NOT NULL,
+  error        TEXT,
+  payload      JSONB,
+  created_at   TIMESTAMP NOT NULL DEFAULT now(),
+  resolved_at  TIMESTAMP NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dead_letter_pend ON etl_dead_letter(op_id) WHERE resolved_at IS NULL;
+
+-- Execuções do ETL (etl/run_ledger.py; idade dos dados em GET /etl/status)
+CREATE TABLE IF NOT EXISTS etl_run (
+  run_id       BIGSERIAL PRIMARY KEY,
+  kind         VARCHAR(30) NOT NULL,          -- janela | andamento | reconcile | dims | dead_letter | snapshot | series
+  filial       INTEGER NULL,
+  dt_from      DATE NULL,
+  dt_to        DATE NULL,
+  params       JSONB NULL,
+  status       VARCHAR(10) NOT NULL,          -- running | ok | partial | error
+  started_at   TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  finished_at  TIMESTAMPTZ NULL,
+  duration_s   NUMERIC(12,3) NULL,
+  selected     INTEGER NULL,
+  done         INTEGER NULL,
+  failed       INTEGER NULL,
+  changed      INTEGER NULL,
+  rows         JSONB NULL,
+  error        TEXT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_etl_run_kind ON etl_run(kind, filial, started_at DESC);
+
+-- Histórico (SCD2) do cabeçalho das OPs (etl/op_history.py; API ?as_of=)
+CREATE TABLE IF NOT EXISTS op_hist (
+  hist_id             BIGSERIAL PRIMARY KEY,
+  op_id               INTEGER NOT NULL,
+  valid_from          TIMESTAMPTZ NOT NULL,
+  valid_to            TIMESTAMPTZ NULL,          -- NULL = versão atual
+  op_numero           INTEGER,
+  filial              INTEGER,
+  descricao           TEXT,
+  pedido_numero       INTEGER,
+  status_code         VARCHAR(4),
+  status_nome         VARCHAR(40),
+  dt_emissao          TIMESTAMP,
+  dt_prev_inicio      TIMESTAMP,
+  dt_validade         TIMESTAMP,
+  qtd_total_hdr       NUMERIC(18,3),
+  qtd_produzidas_hdr  NUMERIC(18,3),
+  qtd_saldo_hdr       NUMERIC(18,3),
+  percent_concluido   NUMERIC(7,2),
+  cor_txt             VARCHAR(200)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_op_hist_atual ON op_hist(op_id) WHERE valid_to IS NULL;
+CREATE INDEX IF NOT EXISTS idx_op_hist_validade ON op_hist USING gist (tstzrange(valid_from, valid_to));
+-- tabela nova: as OPs já existentes entram com a versão atual
+INSERT INTO op_hist (op_id, valid_from, op_numero, filial, descricao, pedido_numero, status_code, status_nome,
+                     dt_emissao, dt_prev_inicio, dt_validade, qtd_total_hdr, qtd_produzidas_hdr, qtd_saldo_hdr,
+                     percent_concluido, cor_txt)
+SELECT op_id, now(), op_numero, filial, descricao, pedido_numero, status_code, status_nome,
+       dt_emissao, dt_prev_inicio, dt_validade, qtd_total_hdr, qtd_produzidas_hdr, qtd_saldo_hdr,
+       percent_concluido, cor_txt
+FROM op
+WHERE NOT EXISTS (SELECT 1 FROM op_hist);
+
+-- Série de andamento (etl/progress_series.py; API /series/progress). Particionadas por mês:
+-- as partições (progress_op_YYYYMM, progress_setor_YYYYMM) são criadas pelo ETL na 1ª amostra do mês.
+CREATE TABLE IF NOT EXISTS progress_op (
+  bucket       TIMESTAMP NOT NULL,              -- hora ou dia da amostra
+  filial       INTEGER,
+  op_id        INTEGER NOT NULL,
+  percent      NUMERIC(7,2) NOT NULL,
+  delta        NUMERIC(7,2) NOT NULL,           -- variação desde a amostra anterior da OP
+  PRIMARY KEY (op_id, bucket)
+) PARTITION BY RANGE (bucket);
+CREATE INDEX IF NOT EXISTS idx_progress_op_filial ON progress_op(filial, bucket);
+CREATE TABLE IF NOT EXISTS progress_op_last (
+  op_id        INTEGER PRIMARY KEY,
+  percent      NUMERIC(7,2) NOT NULL,
+  bucket       TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress_setor (
+  bucket       TIMESTAMP NOT NULL,
+  filial       INTEGER NOT NULL,
+  setor_codigo INTEGER NOT NULL,
+  pendente     INTEGER NOT NULL,                -- etapas das OPs em aberto
+  em_execucao  INTEGER NOT NULL,
+  concluido    INTEGER NOT NULL,
+  PRIMARY KEY (filial, setor_codigo, bucket)
+) PARTITION BY RANGE (bucket);
+
 -- Índices úteis
 CREATE INDEX IF NOT EXISTS idx_andamento_op            ON andamento_setor(op_numero);
 CREATE INDEX IF NOT EXISTS idx_op_op_numero            ON op(op_numero);
@@ -68,6 +195,7 @@ CREATE INDEX IF NOT EXISTS idx_item_opid_saldo         ON op_item (op_id) WHERE
 -- Migração segura (ambientes já criados)
 ALTER TABLE op_item ADD COLUMN IF NOT EXISTS pro_desc  TEXT;
 ALTER TABLE op_item ADD COLUMN IF NOT EXISTS cor_nome  VARCHAR(200);
+ALTER TABLE op      ADD COLUMN IF NOT EXISTS origem    VARCHAR(60);   -- origem (banco Firebird) no 08_sync_multi
 
 -- Produtos que representam "pintura"
 CREATE TABLE IF NOT EXISTS cfg_pintura_prod (
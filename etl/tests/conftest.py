@@ -0,0 +1,54 @@
+# etl/tests/conftest.py
+# -----------------------------------------------------------------------------
+# Fixtures dos testes do ETL (pytest, a partir da raiz ou de etl/):
+# - fake_fb: cursor de um Firebird sintético (fb_fake, SQLite), gerado uma vez
+#   por sessão com semente fixa;
+# - pg_cur: cursor de um Postgres de teste (ETL_TEST_PG_DSN), num schema próprio
+#   e numa transação desfeita no fim (nada fica gravado). Sem a variável, os
+#   testes que pedem pg_cur são pulados.
+# -----------------------------------------------------------------------------
+import importlib
+import os
+import sys
+
+import pytest
+
+ETL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ETL_DIR not in sys.path:
+    sys.path.insert(0, ETL_DIR)
+
+import fb_fake  # noqa: E402
+
+@pytest.fixture(scope="session")
+def janela():
+    """Módulo 04_copiar_janela (nome começa com dígito: importlib)."""
+    return importlib.import_module("04_copiar_janela")
+
+@pytest.fixture(scope="session")
+def fake_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("fb") / "fake.db")
+    fb_fake.generate(path, n_items=3000, n_produtos=200, n_cores=30)
+    return path
+
+@pytest.fixture
+def fake_fb(fake_db):
+    con = fb_fake.connect(fake_db)
+    cur = con.cursor()
+    yield cur
+    cur.close(); con.close()
+
+@pytest.fixture
+def pg_cur(janela):
+    dsn = os.getenv("ETL_TEST_PG_DSN")
+    if not dsn:
+        pytest.skip("ETL_TEST_PG_DSN não definido (Postgres de teste)")
+    psycopg2 = pytest.importorskip("psycopg2")
+    con = psycopg2.connect(dsn)
+    cur = con.cursor()
+    try:
+        cur.execute("CREATE SCHEMA etl_test; SET LOCAL search_path TO etl_test")
+        janela.ensure_schema(cur)
+        yield cur
+    finally:
+        con.rollback()
+        cur.close(); con.close()
@@ -0,0 +1,42 @@
+# etl/tests/test_fb_extract.py
+# -----------------------------------------------------------------------------
+# Blocos de IN-list (chunked) e linhas por nome de coluna (Record/iter_records).
+# -----------------------------------------------------------------------------
+import pytest
+
+from fb_extract import FB_MAX_IN, Record, chunked, iter_records
+
+def test_chunked_sizes():
+    assert list(chunked(list(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+    assert list(chunked((1, 2), 10)) == [[1, 2]]
+
+def test_chunked_clamps_size():
+    assert [len(c) for c in chunked(list(range(FB_MAX_IN + 10)), 10 * FB_MAX_IN)] == [FB_MAX_IN, 10]
+    assert list(chunked([1, 2], 0)) == [[1], [2]]
+
+def test_record_access():
+    r = Record({"OPD_ID": 0, "PRO_DESC": 1}, (7, None))
+    assert r["OPD_ID"] == 7 and r.get("PRO_DESC") is None
+    assert r.get("COR_NOME", "x") == "x"
+    assert "OPD_ID" in r and "COR_NOME" not in r
+    assert r.keys() == ["OPD_ID", "PRO_DESC"]
+    with pytest.raises(KeyError):
+        r["COR_NOME"]
+
+def test_record_set_copies_row_and_shares_index():
+    idx = {"OPD_ID": 0, "PRO_DESC": 1}
+    row = (7, None)
+    a, b = Record(idx, row), Record(idx, (8, "B"))
+    a["PRO_DESC"] = "PORTA"
+    assert a.as_dict() == {"OPD_ID": 7, "PRO_DESC": "PORTA"}
+    assert row == (7, None)  # linha do driver intacta
+    assert b["PRO_DESC"] == "B"
+    with pytest.raises(KeyError):
+        a["COR_NOME"] = "AZUL"  # só colunas da consulta
+
+def test_iter_records_streams_with_fetchmany(fake_fb):
+    fake_fb.execute("SELECT FIRST 5 ORP_ID, orp_serie FROM ORDEM_PRODUCAO ORDER BY ORP_ID")
+    recs = list(iter_records(fake_fb, fetch_size=2))
+    assert [r["ORP_ID"] for r in recs] == [1, 2, 3, 4, 5]
+    assert all(r["ORP_SERIE"] == 100000 + r["ORP_ID"] for r in recs)
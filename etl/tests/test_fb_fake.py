@@ -0,0 +1,42 @@
+# etl/tests/test_fb_fake.py
+# -----------------------------------------------------------------------------
+# Tradução do dialeto Firebird do fake (fb_fake.translate) e funções do SQLite.
+# -----------------------------------------------------------------------------
+import fb_fake
+
+def test_translate_first_to_limit():
+    sql = fb_fake.translate("  SELECT FIRST 10 ORP_ID FROM ORDEM_PRODUCAO ORDER BY ORP_ID")
+    assert sql.startswith("SELECT ORP_ID FROM ORDEM_PRODUCAO")
+    assert sql.rstrip().endswith("LIMIT 10")
+    assert "FIRST" not in sql
+
+def test_translate_is_case_insensitive_and_multiline():
+    sql = fb_fake.translate("select first 3\n  op.ORP_ID\nFROM ORDEM_PRODUCAO op")
+    assert "first" not in sql.lower().split("from")[0]
+    assert sql.endswith("LIMIT 3")
+
+def test_translate_leaves_other_sql():
+    for sql in ("SELECT ORP_ID FROM ORDEM_PRODUCAO",
+                "SELECT COUNT(*) FROM ORDEM_PRODUCAO op WHERE op.ORP_DESCRICAO = 'FIRST 2'",
+                "SELECT FIRSTNAME FROM T"):
+        assert fb_fake.translate(sql) == sql
+
+def test_first_limits_rows(fake_fb):
+    fake_fb.execute("SELECT FIRST 4 ORP_ID FROM ORDEM_PRODUCAO ORDER BY ORP_ID")
+    assert [r[0] for r in fake_fb.fetchall()] == [1, 2, 3, 4]
+
+def test_hash_and_mod(fake_fb):
+    fake_fb.execute("SELECT HASH('abc'), HASH(NULL), MOD(17, 5), MOD(NULL, 5)")
+    h, h_null, m, m_null = fake_fb.fetchone()
+    assert h == fb_fake._fb_hash("abc") and isinstance(h, int)
+    assert (h_null, m, m_null) == (0, 2, None)
+
+def test_generate_is_deterministic(tmp_path):
+    a, b = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    assert fb_fake.generate(a, 200, seed=7, n_produtos=50) == fb_fake.generate(b, 200, seed=7, n_produtos=50)
+    rows = []
+    for p in (a, b):
+        con = fb_fake.connect(p); cur = con.cursor()
+        cur.execute("SELECT * FROM ORDEM_PRODUCAO ORDER BY ORP_ID")
+        rows.append(cur.fetchall()); con.close()
+    assert rows[0] == rows[1]
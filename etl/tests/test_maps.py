@@ -0,0 +1,46 @@
+# etl/tests/test_maps.py
+# -----------------------------------------------------------------------------
+# Etapas do roteiro -> linhas de andamento_setor (maps.andamento_rows).
+# -----------------------------------------------------------------------------
+from datetime import datetime
+
+from fb_extract import Record
+from maps import andamento_rows, derive_stage_status
+
+INFO = {"TABLE": "PCP_ORP_ROTEIRO", "OP_NUM": "OPR_ORP_SERIE", "SETOR_COD": "OPR_ATV_ID",
+        "SEQ": "OPR_ATV_SEQUENCIA", "DTINI": "OPR_ATV_DT_INICIO", "DTFIM": "OPR_ATV_DT_FIM",
+        "STATUS": "OPR_ATV_STATUS"}
+INI, FIM = datetime(2025, 3, 1, 8), datetime(2025, 3, 2, 17)
+
+def step(setor, seq, dtini=None, dtfim=None, status=None) -> dict:
+    return {"OPR_ATV_ID": setor, "OPR_ATV_SEQUENCIA": seq, "OPR_ATV_DT_INICIO": dtini,
+            "OPR_ATV_DT_FIM": dtfim, "OPR_ATV_STATUS": status}
+
+def test_status_by_dates_then_status_column():
+    rows = andamento_rows(100001, [step(10, 1, INI, FIM), step(20, 2, INI), step(30, 3),
+                                   step(40, 4, status="FF"), step(50, 5, status="IN")], INFO)
+    assert rows == [
+        (100001, 10, 1, "CONCLUIDO", INI, FIM),
+        (100001, 20, 2, "EM_EXECUCAO", INI, None),
+        (100001, 30, 3, "PENDENTE", None, None),
+        (100001, 40, 4, "CONCLUIDO", None, None),
+        (100001, 50, 5, "EM_EXECUCAO", None, None),
+    ]
+
+def test_skips_steps_without_sector_or_sequence():
+    rows = andamento_rows(100001, [step(None, 1), step(10, None), step("20", "2")], INFO)
+    assert rows == [(100001, 20, 2, "PENDENTE", None, None)]
+
+def test_without_date_status_columns():
+    info = {k: v for k, v in INFO.items() if k not in ("DTINI", "DTFIM", "STATUS")}
+    assert andamento_rows(7, [step(10, 1, INI, FIM, "FF")], info) == [(7, 10, 1, "PENDENTE", None, None)]
+
+def test_accepts_records_and_lowercase_detection():
+    idx = {c: i for i, c in enumerate(step(0, 0))}
+    rec = Record(idx, (10, 1, INI, None, None))
+    info = {k: v.lower() for k, v in INFO.items()}
+    assert andamento_rows(5, [rec], info) == [(5, 10, 1, "EM_EXECUCAO", INI, None)]
+
+def test_derive_stage_status_unknown_is_pending():
+    assert derive_stage_status(None, None, "XX") == "PENDENTE"
+    assert derive_stage_status(None, None, " concluida ") == "CONCLUIDO"
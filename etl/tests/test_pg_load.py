@@ -0,0 +1,103 @@
+# etl/tests/test_pg_load.py
+# -----------------------------------------------------------------------------
+# Merge por staging e diff das etapas (pg_load): o texto do merge_sql sempre;
+# o comportamento (apagar etapas que sumiram, manter as de OPs cujo roteiro
+# não pôde ser lido) só com um Postgres de teste (ETL_TEST_PG_DSN).
+# -----------------------------------------------------------------------------
+from pg_load import (OP_COLS, delete_vanished_steps, ensure_staging, load_staged,
+                     merge_sql, new_stats)
+
+def op_row(op_id: int, op_numero: int) -> tuple:
+    vals = {"op_id": op_id, "op_numero": op_numero, "filial": 1, "status_code": "AA",
+            "status_nome": "ABERTA"}
+    return tuple(vals.get(c) for c in OP_COLS)
+
+def steps(cur, table: str, op_numero: int) -> set:
+    cur.execute(f"SELECT setor_codigo, sequencia FROM {table} WHERE op_numero = %s", (op_numero,))
+    return set(cur.fetchall())
+
+def seed_roteiro(cur, rows):
+    cur.execute("INSERT INTO roteiro (op_numero, setor_codigo, sequencia) SELECT * FROM unnest(%s::int[], %s::int[], %s::int[])",
+                ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]))
+
+# -----------------------------------------------------------------------------
+# merge_sql (só o texto)
+# -----------------------------------------------------------------------------
+def test_merge_sql_delete_only_for_step_tables_with_replace():
+    assert "DELETE" not in merge_sql("roteiro")
+    assert "DELETE" not in merge_sql("op", replace=True)
+    assert "DELETE" not in merge_sql("op_item", replace=True)
+    for target in ("roteiro", "andamento_setor"):
+        sql = merge_sql(target, replace=True)
+        assert f"DELETE FROM {target} d" in sql
+        assert "SELECT op_numero FROM stg_op" in sql
+        assert "%s" not in sql
+
+def test_merge_sql_keep_adds_exclusion_param():
+    sql = merge_sql("roteiro", replace=True, keep=True)
+    assert sql.count("%s") == 1
+    assert "d.op_numero <> ALL(%s)" in sql
+
+def test_merge_sql_keeps_origem_when_null():
+    sql = merge_sql("op")
+    assert "origem = COALESCE(EXCLUDED.origem, t.origem)" in sql
+    assert "descricao = EXCLUDED.descricao" in sql
+
+# -----------------------------------------------------------------------------
+# load_staged com replace (Postgres)
+# -----------------------------------------------------------------------------
+def test_load_staged_replace_deletes_vanished_and_keeps_unread(pg_cur):
+    ensure_staging(pg_cur)
+    seed_roteiro(pg_cur, [(1001, 10, 1), (1001, 20, 2), (1001, 30, 3),
+                          (1002, 10, 1), (1002, 20, 2),
+                          (1003, 10, 1)])
+    stats = new_stats()
+    load_staged(pg_cur, {
+        "op": [op_row(1, 1001), op_row(2, 1002)],
+        "roteiro": [(1001, 10, 1), (1001, 30, 3), (1001, 40, 4)],
+        "keep_steps": [1002],  # roteiro da 1002 não pôde ser lido
+    }, stats, replace_steps=True)
+
+    assert steps(pg_cur, "roteiro", 1001) == {(10, 1), (30, 3), (40, 4)}
+    assert steps(pg_cur, "roteiro", 1002) == {(10, 1), (20, 2)}
+    assert steps(pg_cur, "roteiro", 1003) == {(10, 1)}  # fora do bloco
+    assert stats["roteiro"] == {"inserted": 1, "updated": 0, "unchanged": 2, "deleted": 1}
+
+def test_load_staged_replace_without_rows_clears_block_steps(pg_cur):
+    ensure_staging(pg_cur)
+    seed_roteiro(pg_cur, [(1001, 10, 1), (1002, 10, 1)])
+    stats = new_stats()
+    load_staged(pg_cur, {"op": [op_row(1, 1001)], "roteiro": []}, stats, replace_steps=True)
+
+    assert steps(pg_cur, "roteiro", 1001) == set()
+    assert steps(pg_cur, "roteiro", 1002) == {(10, 1)}
+    assert stats["roteiro"]["deleted"] == 1
+
+def test_load_staged_without_replace_never_deletes(pg_cur):
+    ensure_staging(pg_cur)
+    seed_roteiro(pg_cur, [(1001, 10, 1), (1001, 20, 2)])
+    load_staged(pg_cur, {"op": [op_row(1, 1001)], "roteiro": [(1001, 10, 1)]}, new_stats())
+
+    assert steps(pg_cur, "roteiro", 1001) == {(10, 1), (20, 2)}
+
+# -----------------------------------------------------------------------------
+# delete_vanished_steps (caminho por OP)
+# -----------------------------------------------------------------------------
+def test_delete_vanished_steps(pg_cur):
+    pg_cur.execute("""
+        INSERT INTO andamento_setor (op_numero, setor_codigo, sequencia, status_setor)
+        VALUES (1001, 10, 1, 'CONCLUIDO'), (1001, 20, 2, 'PENDENTE'), (1002, 20, 2, 'PENDENTE')
+    """)
+    stats = new_stats()
+    n = delete_vanished_steps(pg_cur, "andamento_setor", 1001,
+                              [(1001, 10, 1, "CONCLUIDO", None, None)], stats)
+
+    assert n == 1
+    assert steps(pg_cur, "andamento_setor", 1001) == {(10, 1)}
+    assert steps(pg_cur, "andamento_setor", 1002) == {(20, 2)}
+    assert stats["andamento_setor"]["deleted"] == 1
+
+def test_delete_vanished_steps_empty_rows_clears_op(pg_cur):
+    seed_roteiro(pg_cur, [(1001, 10, 1), (1001, 20, 2)])
+    assert delete_vanished_steps(pg_cur, "roteiro", 1001, []) == 2
+    assert steps(pg_cur, "roteiro", 1001) == set()
@@ -0,0 +1,44 @@
+# etl/tests/test_plan_slices.py
+# -----------------------------------------------------------------------------
+# Fatiamento da janela (04_copiar_janela.plan_slices) sobre o Firebird fake.
+# -----------------------------------------------------------------------------
+from argparse import Namespace
+from datetime import date
+
+import pytest
+
+DT_FROM, DT_TO = date(2025, 1, 1), date(2025, 12, 31)
+
+def window_args(**kw) -> Namespace:
+    base = {"filial": 1, "status": "AA,IN,EP,SS", "date_field": "validade"}
+    base.update(kw)
+    return Namespace(**base)
+
+def window_ids(janela, cur, args, a: date, b: date) -> set:
+    return set(janela.find_ops_window(cur, args.filial, args.status.split(","), args.date_field, a, b))
+
+@pytest.mark.parametrize("target", [5, 20, 10_000])
+def test_slices_cover_window(janela, fake_fb, target):
+    args = window_args()
+    slices = janela.plan_slices(fake_fb, args, DT_FROM, DT_TO, target)
+    full = window_ids(janela, fake_fb, args, DT_FROM, DT_TO)
+    assert full, "fake sem OPs na janela"
+
+    got = set()
+    for a, b, n in slices:
+        ids = window_ids(janela, fake_fb, args, a, b)
+        assert len(ids) == n > 0
+        assert n <= target or (b - a).days < 2
+        got |= ids
+    assert got == full
+    # em ordem de data, dentro da janela; vizinhas podem dividir o dia da borda
+    assert slices[0][0] >= DT_FROM and slices[-1][1] <= DT_TO
+    assert all(s[1] <= t[0] for s, t in zip(slices, slices[1:]))
+
+def test_single_slice_when_under_target(janela, fake_fb):
+    args = window_args()
+    n = janela.count_ops_window(fake_fb, args.filial, args.status.split(","), args.date_field, DT_FROM, DT_TO)
+    assert janela.plan_slices(fake_fb, args, DT_FROM, DT_TO, n) == [(DT_FROM, DT_TO, n)]
+
+def test_empty_window_has_no_slices(janela, fake_fb):
+    assert janela.plan_slices(fake_fb, window_args(), date(2030, 1, 1), date(2030, 12, 31), 10) == []